@@ -5,7 +5,7 @@ a = Analysis(
     ['viki_ui.py'],
     pathex=[],
     binaries=[],
-    datas += [('jarvis', 'jarvis'), ('click.wav', '.')],
+    datas += [('jarvis', 'jarvis'), ('click.wav', '.'), ('deploy.prototxt', '.')],
     hiddenimports=['PIL.Image', 'PIL.ImageTk', 'tkinter', 'tkinter.scrolledtext', 'tkinter.messagebox', 'tkinter.filedialog', 'customtkinter'],
     hookspath=[],
     hooksconfig={},
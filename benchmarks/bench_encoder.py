@@ -0,0 +1,152 @@
+"""
+Benchmark: inline cv2.VideoWriter vs. the background EncoderWorker.
+
+Feeds frames from a SyntheticCapture through each recording strategy and reports
+how long the capture loop spends per frame (what the camera read has to wait for),
+how many frames were dropped and what the encoder actually wrote.
+
+The "motion_start" entry covers motion-gated recording: a still scene fills the
+pre-roll, then motion starts and the whole pre-roll is handed to the encoder at
+once. It reports the pre-roll frames dropped there (should be 0) and how long
+that one write stalled the capture loop. --check exits non-zero if any were dropped.
+
+Usage:
+    python benchmarks/bench_encoder.py [--frames 300] [--fps 30] [--realtime] [--format mp4]
+                                       [--pre-roll 2] [--check]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import viki_recorder
+import viki_video
+
+FOURCC = {"mp4": "mp4v", "avi": "XVID"}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_capture_loop(write_frame, args):
+    cap = viki_video.SyntheticCapture(640, 480, fps=args.fps, max_frames=args.frames, realtime=args.realtime)
+    loop_times = []
+    started = time.perf_counter()
+    base_ts = time.monotonic()
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        # Without --realtime, frames arrive faster than real time; give them camera timestamps
+        timestamp = time.monotonic() if args.realtime else base_ts + len(loop_times) / args.fps
+        t0 = time.perf_counter()
+        write_frame(frame, timestamp)
+        loop_times.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    return {
+        "frames": len(loop_times),
+        "capture_fps": round(len(loop_times) / elapsed, 2),
+        "write_ms_p50": round(statistics.median(loop_times), 3),
+        "write_ms_p99": round(percentile(loop_times, 99), 3),
+        "write_ms_max": round(max(loop_times), 3),
+    }
+
+
+def bench_inline(path, args):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FOURCC[args.format]), args.fps, (640, 480))
+    if not writer.isOpened():
+        return {"error": "could not open cv2.VideoWriter"}
+    result = run_capture_loop(lambda frame, ts: writer.write(frame), args)
+    writer.release()
+    return result
+
+
+def bench_worker(path, args, use_process):
+    worker = viki_recorder.EncoderWorker(path, FOURCC[args.format], args.fps, (640, 480),
+                                         num_slots=args.slots, backpressure=args.backpressure,
+                                         use_process=use_process)
+    if not worker.start():
+        return {"error": worker.error}
+    result = run_capture_loop(worker.write, args)
+    result["encoder"] = worker.release()
+    return result
+
+
+def bench_motion_start(path, args, use_process):
+    encoder = viki_recorder.EncoderWorker(path, FOURCC[args.format], args.fps, (640, 480), num_slots=args.slots,
+                                          backpressure=viki_recorder.BACKPRESSURE_DROP, use_process=use_process)
+    recorder = viki_recorder.MotionRecorder(encoder, sensitivity=0.5, pre_roll_s=args.pre_roll, post_roll_s=1.0)
+    if not recorder.start():
+        return {"error": recorder.error}
+    still = np.full((480, 640, 3), 96, dtype=np.uint8)
+    moving = still.copy()
+    moving[120:360, 160:480] = 255
+    base_ts = time.monotonic()
+    idle_frames = int(args.pre_roll * args.fps) + 10
+    for index in range(idle_frames):
+        recorder.write(still, base_ts + index / args.fps)
+    started = time.perf_counter()
+    recorder.write(moving, base_ts + idle_frames / args.fps) # Starts the segment: the pre-roll goes out in one burst
+    stall_ms = (time.perf_counter() - started) * 1000
+    result = {
+        "pre_roll_frames": encoder.frames_submitted + encoder.frames_dropped - 1, # Minus the frame with motion
+        "frames_dropped": encoder.frames_dropped,
+        "frames_submitted": encoder.frames_submitted,
+        "segment_start_stall_ms": round(stall_ms, 1),
+    }
+    recorder.release()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--slots", type=int, default=8, help="Shared-memory slots for the encoder worker")
+    parser.add_argument("--backpressure", choices=[viki_recorder.BACKPRESSURE_DROP, viki_recorder.BACKPRESSURE_BLOCK],
+                        default=viki_recorder.BACKPRESSURE_DROP)
+    parser.add_argument("--realtime", action="store_true", help="Pace the synthetic camera at --fps")
+    parser.add_argument("--format", choices=sorted(FOURCC), default="mp4")
+    parser.add_argument("--pre-roll", type=float, default=2.0, help="Motion recording pre-roll in seconds")
+    parser.add_argument("--check", action="store_true", help="Fail if motion recording dropped pre-roll frames")
+    args = parser.parse_args()
+
+    results = {"config": vars(args)}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, run in (
+            ("inline", lambda p: bench_inline(p, args)),
+            ("thread", lambda p: bench_worker(p, args, use_process=False)),
+            ("process", lambda p: bench_worker(p, args, use_process=True)),
+        ):
+            path = os.path.join(tmp, f"{name}.{args.format}")
+            results[name] = run(path)
+            if os.path.exists(path):
+                results[name]["file_bytes"] = os.path.getsize(path)
+        results["motion_start"] = {
+            mode: bench_motion_start(os.path.join(tmp, f"motion_{mode}.{args.format}"), args, mode == "process")
+            for mode in ("thread", "process")
+        }
+    print(json.dumps(results, indent=2))
+    if args.check:
+        dropped = {mode: result.get("frames_dropped") for mode, result in results["motion_start"].items()}
+        if any(count != 0 for count in dropped.values()):
+            print(f"Pre-roll frames were dropped when motion started: {dropped}", file=sys.stderr)
+            sys.exit(1)
+        print("No pre-roll frames dropped.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
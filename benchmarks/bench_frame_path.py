@@ -0,0 +1,87 @@
+"""
+Benchmark: per-frame allocations and CPU time of the video_loop frame path.
+
+Compares the original path (cv2.resize + cv2.cvtColor + PIL.Image.fromarray,
+each returning a new array/image) with the FrameRing path (dst= buffers and a
+reused PIL image). Uses a SyntheticCapture at 1280x720 so the resize is real work.
+
+Usage:
+    python benchmarks/bench_frame_path.py [--frames 300]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import PIL.Image
+
+import viki_video
+
+FRAME_SIZE = (640, 480)
+
+
+def legacy_path(cap, frames):
+    for _ in range(frames):
+        ret, frame = cap.read()
+        frame_resized = cv2.resize(frame, FRAME_SIZE)
+        cv2image = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
+        PIL.Image.fromarray(cv2image)
+        yield
+
+
+def ring_path(cap, frames):
+    ring = viki_video.FrameRing(6, *FRAME_SIZE)
+    frame = None
+    for _ in range(frames):
+        ret, frame = cap.read(frame)
+        slot = ring.acquire()
+        cv2.resize(frame, FRAME_SIZE, dst=slot.bgr)
+        cv2.cvtColor(slot.bgr, cv2.COLOR_BGR2RGB, dst=slot.rgb)
+        slot.load_pil()
+        ring.publish(slot, time.monotonic())
+        yield
+
+
+def measure(path, frames):
+    cap = viki_video.SyntheticCapture(1280, 720, realtime=False)
+    steps = path(cap, frames)
+    next(steps) # Warm-up frame: the ring and capture buffers are allocated once here
+
+    tracemalloc.start()
+    allocated = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in steps:
+        current, peak = tracemalloc.get_traced_memory()
+        allocated += peak - current # Memory allocated (and freed again) during this frame
+        tracemalloc.reset_peak()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    tracemalloc.stop()
+    measured = frames - 1
+    return {
+        "frames": measured,
+        "alloc_kb_per_frame": round(allocated / measured / 1024, 1),
+        "cpu_ms_per_frame": round(cpu * 1000 / measured, 3),
+        "wall_ms_per_frame": round(wall * 1000 / measured, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+    cv2.setNumThreads(1) # Keep CPU numbers comparable between runs
+    print(json.dumps({
+        "legacy": measure(legacy_path, args.frames),
+        "ring": measure(ring_path, args.frames),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: multi-camera capture scaling and isolation.
+
+Runs 1, 2 and 4 synthetic cameras through CameraManager with a tiled preview
+consumer, reporting per-camera achieved FPS and process CPU per camera (which
+should stay roughly flat as cameras are added). A last run adds a 2 fps camera
+next to fast ones to check that a slow device does not hold the others back.
+
+Usage:
+    python benchmarks/bench_multicam.py [--seconds 3] [--fps 30]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import viki_cameras
+
+
+def run(sources, seconds):
+    manager = viki_cameras.CameraManager()
+    for source in sources:
+        manager.add(source)
+    preview = viki_cameras.TiledPreview(manager.cameras)
+    manager.start()
+    time.sleep(0.5) # Let every camera open and settle before measuring
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    frames_start = {camera_id: camera.capture_rate.count for camera_id, camera in manager.cameras.items()}
+    while time.perf_counter() - wall_start < seconds:
+        preview.update(manager.bus.take_all())
+        time.sleep(1 / 60) # Preview tick
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    metrics = manager.metrics()
+    manager.stop()
+    cameras = {}
+    for camera_id, m in metrics.items():
+        cameras[camera_id] = {
+            "source": m["source"],
+            "fps": round((manager.cameras[camera_id].capture_rate.count - frames_start[camera_id]) / wall, 1),
+            "bus_dropped": m["bus_dropped"],
+            "ring_overruns": m["ring_overruns"],
+        }
+    return {
+        "cameras": cameras,
+        "cpu_pct": round(cpu / wall * 100, 1),
+        "cpu_pct_per_camera": round(cpu / wall * 100 / len(sources), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--fps", type=float, default=30.0)
+    args = parser.parse_args()
+    fast = f"synthetic:{args.fps:g}"
+    results = {"config": vars(args)}
+    for count in (1, 2, 4):
+        results[f"{count}_cameras"] = run([fast] * count, args.seconds)
+    results["with_slow_camera"] = run([fast, fast, "synthetic:2"], args.seconds)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark: photo capture throughput, synchronous imwrite vs. the PhotoWriter pool.
+
+For every format, saves --shots frames from a SyntheticCapture either with
+cv2.imwrite on the calling thread (the old capture_photo path) or by handing
+pinned ring slots to PhotoWriter with 1, 2 and 4 workers. Reports how long the
+caller is blocked per shot, total photos/s and the average file size.
+
+Usage:
+    python benchmarks/bench_photos.py [--shots 60] [--png-level 3] [--quality 90]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+import viki_photos
+import viki_video
+
+FRAME_SIZE = (640, 480)
+
+
+def fill_ring(ring, cap):
+    """Publishes one new synthetic frame into the ring (what video_loop does per frame)."""
+    slot = ring.acquire()
+    while slot is None: # Every slot is pinned by the writer; wait like the capture loop would
+        time.sleep(0.001)
+        slot = ring.acquire()
+    ret, frame = cap.read()
+    slot.bgr[:] = frame
+    ring.publish(slot, time.monotonic())
+
+
+def bench_sync(out_dir, fmt, args):
+    cap = viki_video.SyntheticCapture(*FRAME_SIZE, realtime=False)
+    ext, params = viki_photos.encode_params(fmt, args.png_level, args.quality)
+    blocked = []
+    sizes = []
+    started = time.perf_counter()
+    for i in range(args.shots):
+        ret, frame = cap.read()
+        path = os.path.join(out_dir, f"sync_{i}{ext}")
+        t0 = time.perf_counter()
+        cv2.imwrite(path, frame, params)
+        blocked.append((time.perf_counter() - t0) * 1000)
+        sizes.append(os.path.getsize(path))
+    elapsed = time.perf_counter() - started
+    return summarize(blocked, sizes, elapsed, args.shots)
+
+
+def bench_pool(out_dir, fmt, workers, args):
+    cap = viki_video.SyntheticCapture(*FRAME_SIZE, realtime=False)
+    ring = viki_video.FrameRing(workers + 4, *FRAME_SIZE)
+    writer = viki_photos.PhotoWriter(out_dir, fmt=fmt, png_level=args.png_level, quality=args.quality,
+                                     max_workers=workers, prefix=f"pool{workers}")
+    blocked = []
+    sizes = []
+    started = time.perf_counter()
+    for _ in range(args.shots):
+        fill_ring(ring, cap)
+        t0 = time.perf_counter()
+        slot = ring.snapshot()
+        writer.submit(slot, ring, lambda path, error: sizes.append(os.path.getsize(path)) if path else None)
+        blocked.append((time.perf_counter() - t0) * 1000)
+    writer.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+    result = summarize(blocked, sizes, elapsed, args.shots)
+    result["overruns"] = ring.overruns
+    return result
+
+
+def summarize(blocked, sizes, elapsed, shots):
+    return {
+        "photos_per_s": round(shots / elapsed, 1),
+        "caller_ms_p50": round(statistics.median(blocked), 3),
+        "caller_ms_max": round(max(blocked), 3),
+        "avg_kb": round(statistics.mean(sizes) / 1024, 1) if sizes else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shots", type=int, default=60)
+    parser.add_argument("--png-level", type=int, default=3)
+    parser.add_argument("--quality", type=int, default=90)
+    args = parser.parse_args()
+    cv2.setNumThreads(1) # Parallelism comes from the writer pool only
+
+    results = {"config": vars(args)}
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in viki_photos.PHOTO_FORMATS:
+            results[fmt] = {"sync": bench_sync(tmp, fmt, args)}
+            for workers in (1, 2, 4):
+                results[fmt][f"pool_{workers}"] = bench_pool(tmp, fmt, workers, args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Load test: viki_server with hundreds of concurrent clients.
+
+Starts viki_server in this process (on its own thread and event loop) with the
+same sandbox as bench_text_path: launchers are recording stubs, custom commands
+and installed applications come from temporary fixtures, and the chatbot is a
+local stand-in answering after --llm-latency-ms. Then --clients clients connect
+at once (WebSocket, or HTTP keep-alive for --http-fraction of them) and each runs
+--requests queries from benchmarks/text_corpus.json, one after another.
+
+Reported: throughput, end-to-end latency percentiles, requests rejected as busy
+(503) and retried, errors, and the server's own counters afterwards. A run with
+--max-queued smaller than --clients shows the backpressure: excess requests are
+refused at once and retried instead of queueing without bound. --echo replaces
+perform_task with a function returning the query, to measure the server alone.
+
+Usage:
+    python benchmarks/bench_server.py [--clients 300] [--requests 20] [--http-fraction 0.3]
+                                      [--workers 16] [--max-queued 256] [--llm-latency-ms 50] [--echo]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import secrets
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import viki_server
+from bench_text_path import CORPUS_FILE, StandInGemini, percentile, sandboxed_viki
+
+RETRY_DELAY_S = 0.05
+
+
+class HttpClient:
+    def __init__(self, port):
+        self.port = port
+        self.session = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+
+    async def request(self, query):
+        body = json.dumps({"query": query}).encode()
+        head = f"POST /task HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        if self.session:
+            head += f"X-Viki-Session: {self.session}\r\n"
+        self.writer.write((head + "\r\n").encode() + body)
+        await self.writer.drain()
+        status_line, *lines = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        headers = {name.lower(): value.strip() for name, _, value in (line.partition(":") for line in lines if line)}
+        payload = json.loads(await self.reader.readexactly(int(headers["content-length"])))
+        self.session = headers.get("x-viki-session", self.session)
+        return int(status_line.split()[1]), payload
+
+    async def close(self):
+        self.writer.close()
+
+
+class WebSocketClient:
+    def __init__(self, port):
+        self.port = port
+        self.ids = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        key = base64.b64encode(secrets.token_bytes(16)).decode()
+        self.writer.write(f"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode())
+        await self.writer.drain()
+        response = await self.reader.readuntil(b"\r\n\r\n")
+        if not response.startswith(b"HTTP/1.1 101"):
+            raise ConnectionError(response.split(b"\r\n")[0].decode())
+        await self._receive() # hello
+
+    async def _send(self, message):
+        payload = json.dumps(message).encode()
+        mask = secrets.token_bytes(4)
+        length = len(payload)
+        head = struct.pack("!BB", 0x81, 0x80 | length) if length < 126 else struct.pack("!BBH", 0x81, 0x80 | 126, length)
+        self.writer.write(head + mask + viki_server._unmask(payload, mask)) # Masking is the same XOR
+        await self.writer.drain()
+
+    async def _receive(self):
+        head = await self.reader.readexactly(2)
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+        return json.loads(await self.reader.readexactly(length))
+
+    async def request(self, query):
+        self.ids += 1
+        await self._send({"type": "task", "id": self.ids, "query": query})
+        while True:
+            message = await self._receive() # "speech" messages stream in first
+            if message["type"] == "done":
+                return 200, message
+            elif message["type"] == "error":
+                return message["status"], message
+
+    async def close(self):
+        self.writer.close()
+
+
+async def run_client(client, queries, samples, counters):
+    await client.connect()
+    try:
+        for query in queries:
+            started = time.perf_counter()
+            while True:
+                status, _ = await client.request(query)
+                if status != 503:
+                    break
+                counters["busy_retries"] += 1
+                await asyncio.sleep(RETRY_DELAY_S * (1 + random.random()))
+            if status == 200:
+                samples.append((time.perf_counter() - started) * 1000)
+            else:
+                counters["errors"] += 1
+    finally:
+        await client.close()
+
+
+async def load(port, args, queries):
+    random.seed(1)
+    samples = []
+    counters = {"busy_retries": 0, "errors": 0, "connect_failures": 0}
+    clients = []
+    for index in range(args.clients):
+        client = HttpClient(port) if index < args.clients * args.http_fraction else WebSocketClient(port)
+        clients.append(run_client(client, random.choices(queries, k=args.requests), samples, counters))
+    started = time.perf_counter()
+    results = await asyncio.gather(*clients, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    counters["connect_failures"] = sum(1 for result in results if isinstance(result, Exception))
+    return {
+        "clients": args.clients,
+        "requests": len(samples),
+        "seconds": round(elapsed, 2),
+        "requests_per_s": round(len(samples) / elapsed, 1),
+        "latency_ms_p50": round(percentile(samples, 50), 1),
+        "latency_ms_p95": round(percentile(samples, 95), 1),
+        "latency_ms_p99": round(percentile(samples, 99), 1),
+        **counters,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=20, help="Queries per client, sent one after another")
+    parser.add_argument("--http-fraction", type=float, default=0.3, help="Share of clients using HTTP instead of WebSocket")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--max-queued", type=int, default=viki_server.DEFAULT_MAX_QUEUED)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Simulated chatbot response time")
+    parser.add_argument("--echo", action="store_true", help="Answer every query with itself (server overhead only)")
+    args = parser.parse_args()
+
+    with open(CORPUS_FILE, encoding="utf-8") as f:
+        corpus = json.load(f)
+    queries = [query for items in corpus["queries"].values() for query in items]
+    gemini = StandInGemini(corpus["llm_reply"], args.llm_latency_ms / 1000)
+    try:
+        with tempfile.TemporaryDirectory() as tmp, sandboxed_viki(corpus, tmp, gemini.url) as launches:
+            echo = lambda text, session: text
+            handlers = {"task": echo, "chat": echo} if args.echo else None
+            server = viki_server.VikiServer(port=0, workers=args.workers, max_queued=args.max_queued, token="",
+                                            handlers=handlers)
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def serve():
+                asyncio.set_event_loop(loop)
+                loop.run_until_complete(server.start())
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=serve, daemon=True).start()
+            ready.wait()
+            results = asyncio.run(load(server.port, args, queries))
+            results["server"] = asyncio.run_coroutine_threadsafe(asyncio.sleep(0, server.health()), loop).result()
+            results["launches_stubbed"] = launches.count
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+    finally:
+        gemini.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
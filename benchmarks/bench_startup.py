@@ -0,0 +1,78 @@
+"""
+Benchmark: cold-start import cost.
+
+Imports each Viki module in a fresh interpreter and reports how long the import
+took and which heavy third-party modules it pulled in. Modules the app only needs
+later (cv2, numpy, speech_recognition, pyttsx3, requests, ...) should not show up
+here; they are imported on first use.
+
+--root points at another checkout, so two revisions can be compared:
+
+    git worktree add /tmp/viki-before HEAD~1
+    python benchmarks/bench_startup.py --root /tmp/viki-before
+    python benchmarks/bench_startup.py
+
+The time until the window is actually visible is logged by viki_ui itself
+("Window visible", with startup_ms and its breakdown) on every start.
+
+Usage:
+    python benchmarks/bench_startup.py [--root PATH] [--repeat 5] [--modules viki viki_ui ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["viki", "viki_video", "viki_recorder", "viki_photos", "viki_detect", "viki_cameras", "viki_ui"]
+HEAVY_MODULES = ["cv2", "numpy", "speech_recognition", "pyttsx3", "requests", "wikipedia", "bs4", "urllib.request",
+                 "PIL.Image", "customtkinter"]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+baseline = set(sys.modules)
+started = time.perf_counter()
+try:
+    __import__(sys.argv[2])
+    error = None
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+elapsed = time.perf_counter() - started
+heavy = [name for name in json.loads(sys.argv[3]) if name in sys.modules and name not in baseline]
+print(json.dumps({"ms": round(elapsed * 1000, 1), "heavy": heavy, "error": error}))
+"""
+
+
+def probe(root, module, repeat):
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", PROBE, root, module, json.dumps(HEAVY_MODULES)],
+                             capture_output=True, text=True, cwd=root)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        if result["error"]:
+            return {"error": result["error"]}
+        samples.append(result)
+    return {
+        "import_ms_median": statistics.median(sample["ms"] for sample in samples),
+        "import_ms_min": min(sample["ms"] for sample in samples),
+        "heavy_modules_loaded": samples[-1]["heavy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="Checkout to measure (default: this one)")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.root)
+    report = {"root": root, "modules": {module: probe(root, module, args.repeat) for module in args.modules}}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
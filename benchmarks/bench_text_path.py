@@ -0,0 +1,254 @@
+"""
+Benchmark: the text path, viki.perform_task end to end.
+
+Runs the query corpus in benchmarks/text_corpus.json (built-ins, custom
+commands, language switches and chat fallbacks) through viki.perform_task with
+1, 8 and 64 concurrent callers. Nothing is launched and nothing leaves the
+machine:
+
+  * subprocess.Popen and webbrowser.open are replaced by recording stubs
+  * custom commands come from a temporary command database with real (empty) targets
+  * installed applications come from an index over a temporary directory holding
+    (empty) notepad, calc, winword, excel and dotenv executables
+  * get_gemini_response talks to a local stand-in server that answers with a
+    fixed Markdown reply after --llm-latency-ms
+
+Reported per concurrency level: dispatch latency (non-LLM queries), LLM
+round-trip overhead (client latency minus the server's simulated latency) and
+throughput; plus the cost of clean_markdown_for_tts on the reply. The
+"app_lookups" in the corpus pin which installed application (or none) an
+"open <name>" query resolves to.
+
+--check compares the p50 numbers with benchmarks/baselines/text_path.json and
+exits with status 1 if any got slower than --tolerance (and by more than a small
+absolute margin, to ignore timer noise), or if an app lookup resolved wrongly. --update-baseline rewrites that file.
+
+Usage:
+    python benchmarks/bench_text_path.py [--rounds 3] [--llm-latency-ms 50] [--check | --update-baseline]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import viki
+import viki_commands
+import viki_apps
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS_FILE = os.path.join(HERE, "text_corpus.json")
+BASELINE_FILE = os.path.join(HERE, "baselines", "text_path.json")
+CONCURRENCY = (1, 8, 64)
+# Differences below these are timer noise, never a regression
+ABSOLUTE_MARGIN_MS = 0.5
+ABSOLUTE_MARGIN_US = 5.0
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class StandInGemini:
+    """Local HTTP server speaking just enough of the generateContent API."""
+
+    def __init__(self, reply, latency_s):
+        body = json.dumps({"candidates": [{"content": {"parts": [{"text": reply}], "role": "model"}}]}).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(latency_s)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 256 # Accept backlog for 64 callers connecting at once
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1beta/models/stand-in:generateContent"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Launches:
+    """Records what perform_task would have launched."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+        return True
+
+
+@contextlib.contextmanager
+def sandboxed_viki(corpus, tmp, server_url):
+    """Points viki at the stubs, the temporary command file and the stand-in server."""
+    for name in ("editor.exe", "player.exe"):
+        open(os.path.join(tmp, name), "wb").close()
+    store = viki_commands.CommandStore(os.path.join(tmp, "custom_commands.db"))
+    store.upsert_many((voice, path.replace("{tmp}", tmp), None) for voice, path in corpus["custom_commands"].items())
+
+    apps_dir = os.path.join(tmp, "apps")
+    os.makedirs(apps_dir)
+    for name in ("notepad", "calc", "winword", "excel", "dotenv"):
+        path = os.path.join(apps_dir, name + (".exe" if sys.platform == "win32" else ""))
+        open(path, "wb").close()
+        os.chmod(path, 0o755)
+    apps = viki_apps.AppIndex(path_dirs=[apps_dir], desktop_dirs=[], shortcut_dirs=[])
+    apps.refresh()
+
+    launches = Launches()
+    session = viki.default_session
+    saved = (viki.subprocess, viki.webbrowser, viki.API_URL, session.language, viki_apps.subprocess)
+    viki.subprocess = viki_apps.subprocess = types.SimpleNamespace(Popen=launches)
+    viki.webbrowser = types.SimpleNamespace(open=launches)
+    previous_store = viki_commands.set_store(store)
+    previous_apps = viki_apps.set_index(apps)
+    viki.API_URL = server_url
+    session.chat_mode = False
+    try:
+        yield launches
+    finally:
+        viki.subprocess, viki.webbrowser, viki.API_URL, session.language, viki_apps.subprocess = saved
+        viki_commands.set_store(previous_store)
+        viki_apps.set_index(previous_apps)
+        store.close()
+        session.clear_history()
+
+
+def run_level(queries, callers, rounds, llm_latency_s):
+    """Each of `callers` threads runs the whole corpus `rounds` times."""
+    work = [(category, query) for _ in range(rounds * callers) for category, query in queries]
+    samples = {"dispatch": [], "llm_overhead": []}
+    lock = threading.Lock()
+    viki.default_session.clear_history() # Every level starts from the same conversation size
+
+    def call(item):
+        category, query = item
+        started = time.perf_counter()
+        result = viki.perform_task(query)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if isinstance(result, str) and result.startswith("Error"):
+            raise RuntimeError(f"{query!r}: {result}")
+        with lock:
+            if category == "chat":
+                samples["llm_overhead"].append(elapsed_ms - llm_latency_s * 1000)
+            else:
+                samples["dispatch"].append(elapsed_ms)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        list(pool.map(call, work))
+    elapsed = time.perf_counter() - started
+    result = {"queries": len(work), "queries_per_s": round(len(work) / elapsed, 1)}
+    for name, values in samples.items():
+        result[f"{name}_ms_p50"] = round(statistics.median(values), 3)
+        result[f"{name}_ms_p99"] = round(percentile(values, 99), 3)
+    return result
+
+
+def check_app_lookups(lookups):
+    """Resolves each query with find_installed_app; returns the ones that got the wrong application."""
+    wrong = []
+    for query, expected in lookups:
+        app = viki.find_installed_app(query)
+        found = app.name if app is not None else None
+        if found != expected:
+            wrong.append(f"{query!r} opened {found!r}, expected {expected!r}")
+    return wrong
+
+
+def bench_sanitizer(text, iterations=2000):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        viki.clean_markdown_for_tts(text)
+    return round((time.perf_counter() - started) * 1e6 / iterations, 2)
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regressions: p50 metrics that got slower than the baseline allows."""
+    regressions = []
+    def check(name, current, reference, margin):
+        if reference and current > reference * (1 + tolerance) and current - reference > margin:
+            regressions.append(f"{name}: {current} vs baseline {reference}")
+    check("sanitizer_us_per_call", results["sanitizer_us_per_call"], baseline.get("sanitizer_us_per_call"), ABSOLUTE_MARGIN_US)
+    for level, values in results["levels"].items():
+        reference = baseline.get("levels", {}).get(level, {})
+        for metric in ("dispatch_ms_p50", "llm_overhead_ms_p50"):
+            check(f"{level}.{metric}", values[metric], reference.get(metric), ABSOLUTE_MARGIN_MS)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3, help="Passes over the corpus per caller")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Simulated Gemini response time")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown vs. the baseline (0.5 = 50%%)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--check", action="store_true", help="Fail if slower than the stored baseline")
+    group.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+    args = parser.parse_args()
+
+    with open(CORPUS_FILE, encoding="utf-8") as f:
+        corpus = json.load(f)
+    queries = [(category, query) for category, items in corpus["queries"].items() for query in items]
+    server = StandInGemini(corpus["llm_reply"], args.llm_latency_ms / 1000)
+    results = {"config": vars(args), "sanitizer_us_per_call": bench_sanitizer(corpus["llm_reply"]), "levels": {}}
+    try:
+        with tempfile.TemporaryDirectory() as tmp, sandboxed_viki(corpus, tmp, server.url) as launches:
+            with contextlib.redirect_stdout(io.StringIO()): # perform_task prints every query
+                for callers in CONCURRENCY:
+                    results["levels"][f"callers_{callers}"] = run_level(queries, callers, args.rounds,
+                                                                        args.llm_latency_ms / 1000)
+            results["launches_stubbed"] = launches.count
+            wrong_lookups = check_app_lookups(corpus["app_lookups"])
+            results["app_lookups_wrong"] = len(wrong_lookups)
+    finally:
+        server.close()
+    print(json.dumps(results, indent=2))
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {BASELINE_FILE}")
+    elif args.check:
+        if not os.path.exists(BASELINE_FILE):
+            sys.exit(f"No baseline at {BASELINE_FILE}; run with --update-baseline first.")
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            regressions = wrong_lookups + compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Benchmark: the whole webcam pipeline, headless.
+
+Drives the same stages as VikiUI.video_loop from a synthetic or file-backed
+source, without Tk or a camera:
+
+    capture   cap.read() into the reused capture buffer
+    convert   resize/copy into a FrameRing slot, BGR->RGB, load into the slot's PIL image
+    handoff   FrameMailbox.put() until a 60 Hz "preview" thread takes the frame
+    encode    EncoderWorker.write() (time the capture loop is blocked by recording)
+
+and reports per-stage latency percentiles, achieved capture/preview FPS, dropped
+frames at every stage and peak RSS. Output is JSON; --output appends one line per
+run to a JSONL file so results can be tracked over time.
+
+Usage:
+    python benchmarks/bench_video_pipeline.py [--source synthetic|<video file>] [--frames 300]
+        [--fps 30] [--realtime] [--no-record] [--format mp4] [--output results.jsonl]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+import viki_cameras
+import viki_recorder
+import viki_video
+
+FOURCC = {"mp4": "mp4v", "avi": "XVID"}
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    def pick(pct):
+        return round(ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))], 3)
+    return {"count": len(ordered), "p50": pick(50), "p90": pick(90), "p99": pick(99), "max": round(ordered[-1], 3)}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children (the encoder), in MB."""
+    try:
+        import resource
+    except ImportError: # Windows
+        try:
+            import psutil
+            return {"self": round(psutil.Process().memory_info().peak_wset / 2**20, 1)}
+        except (ImportError, AttributeError):
+            return None
+    scale = 2**20 if sys.platform == "darwin" else 2**10 # ru_maxrss is bytes on macOS, KB on Linux
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def open_capture(args):
+    if args.source == "synthetic":
+        return viki_video.SyntheticCapture(1280, 720, fps=args.fps, max_frames=args.frames, realtime=args.realtime)
+    return viki_cameras.open_source(args.source)
+
+
+def run(args, record_path):
+    frame_size = (640, 480)
+    cap = open_capture(args)
+    if not cap.isOpened():
+        return {"error": f"cannot open source {args.source!r}"}
+    mode = viki_video.negotiate_camera_mode(cap, *frame_size, args.fps)
+    pacer = viki_video.FramePacer(mode["fps"]) if args.realtime and args.source != "synthetic" else None
+    ring = viki_video.FrameRing(10, *frame_size)
+    mailbox = viki_video.FrameMailbox(on_drop=lambda item: ring.unpin(item[0])) # Items are (slot, put time)
+
+    writer = None
+    if record_path:
+        writer = viki_recorder.EncoderWorker(record_path, FOURCC[args.format], mode["fps"], frame_size)
+        if not writer.start():
+            return {"error": writer.error}
+
+    handoff_ms = []
+    preview_frames = [0]
+    stop_preview = threading.Event()
+
+    def preview():
+        # Stands in for the Tk preview tick: take the newest frame, "display" it, release it
+        while not stop_preview.is_set():
+            item = mailbox.take()
+            if item is not None:
+                (slot, put_at), captured_at = item
+                handoff_ms.append((time.monotonic() - put_at) * 1000)
+                ring.unpin(slot)
+                mailbox.mark_displayed(captured_at)
+                preview_frames[0] += 1
+            time.sleep(1 / 60)
+
+    preview_thread = threading.Thread(target=preview, daemon=True)
+    preview_thread.start()
+
+    capture_ms, convert_ms, encode_ms = [], [], []
+    frames = 0
+    frame = None
+    started = time.perf_counter()
+    base_ts = time.monotonic()
+    while frames < args.frames:
+        t0 = time.perf_counter()
+        ret, frame = cap.read(frame)
+        t1 = time.perf_counter()
+        if not ret:
+            break
+        captured_at = time.monotonic()
+        frames += 1
+        capture_ms.append((t1 - t0) * 1000)
+
+        slot = ring.acquire()
+        if slot is None:
+            continue
+        if frame.shape[1::-1] != frame_size:
+            cv2.resize(frame, frame_size, dst=slot.bgr)
+        else:
+            slot.bgr[...] = frame
+        cv2.cvtColor(slot.bgr, cv2.COLOR_BGR2RGB, dst=slot.rgb)
+        slot.load_pil()
+        ring.publish(slot, captured_at)
+        t2 = time.perf_counter()
+        convert_ms.append((t2 - t1) * 1000)
+
+        ring.pin(slot)
+        mailbox.put((slot, time.monotonic()), captured_at)
+
+        if writer is not None:
+            t3 = time.perf_counter()
+            # Without --realtime, frames arrive faster than real time; give the encoder camera timestamps
+            record_ts = captured_at if args.realtime else base_ts + frames / mode["fps"]
+            writer.write(slot.bgr, record_ts)
+            encode_ms.append((time.perf_counter() - t3) * 1000)
+
+        if pacer is not None:
+            pacer.wait()
+    elapsed = time.perf_counter() - started
+    cap.release()
+    time.sleep(0.05) # Let the preview thread pick up the last frame
+    stop_preview.set()
+    preview_thread.join()
+    mailbox.clear()
+
+    encoder_stats = writer.release() if writer is not None else None
+    mailbox_stats = mailbox.stats()
+    return {
+        "mode": mode,
+        "frames": frames,
+        "capture_fps": round(frames / elapsed, 2) if elapsed else 0.0,
+        "preview_fps": round(preview_frames[0] / elapsed, 2) if elapsed else 0.0,
+        "stages_ms": {
+            "capture": percentiles(capture_ms),
+            "convert": percentiles(convert_ms),
+            "handoff": percentiles(handoff_ms),
+            "encode": percentiles(encode_ms),
+        },
+        "dropped": {
+            "ring_overruns": ring.overruns,
+            "preview_superseded": mailbox_stats["dropped"],
+            "encoder": encoder_stats["frames_dropped"] if encoder_stats else 0,
+        },
+        "preview_latency_ms": {"avg": mailbox_stats["latency_avg_ms"], "max": mailbox_stats["latency_max_ms"]},
+        "encoder": encoder_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="synthetic", help='"synthetic" or a video file path')
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--realtime", action="store_true", help="Pace the source at its frame rate like a camera")
+    parser.add_argument("--no-record", action="store_true", help="Skip the encode stage")
+    parser.add_argument("--format", choices=sorted(FOURCC), default="mp4")
+    parser.add_argument("--output", help="Append the result as one JSON line to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        record_path = None if args.no_record else os.path.join(tmp, f"bench.{args.format}")
+        result = run(args, record_path)
+    report = {
+        "benchmark": "video_pipeline",
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "config": vars(args),
+        "result": result,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import bisect
+import time
+
+import viki_log
+
+log = viki_log.get_logger("app_tree")
+
+# --- Incremental Application Tree ---
+# The Treeview is reconciled with the command store instead of being cleared and
+# refilled: only rows that were added, changed or removed are touched, and large
+# batches are spread over idle callbacks with a small time budget each, so the
+# window stays responsive with thousands of commands. A search box filters rows
+# through an in-memory index; rows that stop matching are detached, not deleted.
+
+CHUNK_BUDGET_S = 0.008 # Work per idle callback, well under one frame
+
+
+class CommandIndex:
+    """
+    Search index over the name, voice command and target of every command.
+    A search term of three or more characters matches anywhere (trigram lookup,
+    then a substring check); shorter terms match the start of a word. All terms
+    of a query have to match.
+    """
+
+    def __init__(self):
+        self._texts = {} # id -> lower-cased searchable text
+        # Postings: key -> id, or a set of ids once a second command shares the key
+        # (most trigrams of paths are unique, and a bare int is far smaller than a set)
+        self._grams = {} # trigram -> postings
+        self._prefixes = {} # First one or two characters of a word -> postings
+
+    def __len__(self):
+        return len(self._texts)
+
+    @staticmethod
+    def _text(command):
+        # Fields are joined with a newline, which no search term contains, so matches never span two fields
+        return "\n".join((command.name, command.voice, command.target)).lower()
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    @staticmethod
+    def _word_prefixes(text):
+        return {word[:size] for word in text.split() for size in (1, 2)}
+
+    @staticmethod
+    def _post(postings, key, command_id):
+        ids = postings.get(key)
+        if ids is None:
+            postings[key] = command_id
+        elif isinstance(ids, set):
+            ids.add(command_id)
+        elif ids != command_id:
+            postings[key] = {ids, command_id}
+
+    @staticmethod
+    def _unpost(postings, key, command_id):
+        ids = postings.get(key)
+        if isinstance(ids, set):
+            ids.discard(command_id)
+            if len(ids) == 1:
+                postings[key] = ids.pop()
+        elif ids == command_id:
+            del postings[key]
+
+    @staticmethod
+    def _ids(postings, key):
+        ids = postings.get(key)
+        if ids is None:
+            return set()
+        return ids if isinstance(ids, set) else {ids}
+
+    def add(self, command):
+        """Adds a command, or re-indexes it if it is already indexed."""
+        text = self._text(command)
+        old = self._texts.get(command.id)
+        if old == text:
+            return
+        if old is not None:
+            self.remove(command.id)
+        self._texts[command.id] = text
+        for gram in self._trigrams(text):
+            self._post(self._grams, gram, command.id)
+        for prefix in self._word_prefixes(text):
+            self._post(self._prefixes, prefix, command.id)
+
+    def remove(self, command_id):
+        text = self._texts.pop(command_id, None)
+        if text is None:
+            return
+        for postings, keys in ((self._grams, self._trigrams(text)), (self._prefixes, self._word_prefixes(text))):
+            for key in keys:
+                self._unpost(postings, key, command_id)
+
+    def search(self, query):
+        """Ids of the commands matching every term of `query`; None for an empty query (everything matches)."""
+        terms = query.lower().split()
+        if not terms:
+            return None
+        result = None
+        for term in sorted(terms, key=len, reverse=True): # Longest (most selective) term first
+            ids = self._search_term(term)
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result
+
+    def _search_term(self, term):
+        if len(term) < 3:
+            return set(self._ids(self._prefixes, term))
+        postings = sorted((self._ids(self._grams, gram) for gram in self._trigrams(term)), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {command_id for command_id in candidates if term in self._texts[command_id]}
+
+    def matches(self, command_id, query):
+        """Whether one command matches `query` (checked directly on its text)."""
+        text = self._texts.get(command_id)
+        if text is None:
+            return False
+        words = None
+        for term in query.lower().split():
+            if len(term) >= 3:
+                if term not in text:
+                    return False
+            else:
+                words = words or text.split()
+                if not any(word.startswith(term) for word in words):
+                    return False
+        return True
+
+
+class CommandTree:
+    """
+    Keeps a ttk.Treeview in step with a list of Commands (row iid = command id).
+    Must be used on the Tk thread. on_change(shown, total) is called whenever the
+    number of visible or known rows changes; on_synced(total) when a sync finishes.
+    """
+
+    def __init__(self, tree, on_change=None, on_synced=None):
+        self.tree = tree
+        self.on_change = on_change
+        self.on_synced = on_synced
+        self.rows = {} # id -> Command, for every known command (shown or filtered out)
+        self.index = CommandIndex()
+        self.query = ""
+        self._shown = [] # Sorted ids of the attached rows; the tree shows them in this order
+        self._jobs = {} # "sync" / "filter" -> [generator, after id]
+        self._pending_sync = {} # id -> Command the running sync() has yet to apply
+
+    # --- Row primitives (keep self._shown and the tree in the same order) ---
+
+    def _values(self, command):
+        return (command.name, command.voice, command.target)
+
+    def _show(self, command_id):
+        position = bisect.bisect_left(self._shown, command_id)
+        if position < len(self._shown) and self._shown[position] == command_id:
+            return
+        iid = str(command_id)
+        if self.tree.exists(iid):
+            self.tree.move(iid, "", position) # Re-attach a filtered-out row
+        else:
+            self.tree.insert("", position, iid=iid, values=self._values(self.rows[command_id]))
+        self._shown.insert(position, command_id)
+
+    def _hide(self, command_ids, delete=False):
+        shown = [command_id for command_id in command_ids if self._is_shown(command_id)]
+        if len(shown) == 1:
+            del self._shown[bisect.bisect_left(self._shown, shown[0])]
+        elif shown:
+            hidden = set(shown)
+            self._shown = [command_id for command_id in self._shown if command_id not in hidden]
+        iids = [str(command_id) for command_id in (command_ids if delete else shown) if self.tree.exists(str(command_id))]
+        if iids:
+            # One Tcl call for the whole batch
+            if delete:
+                self.tree.delete(*iids)
+            else:
+                self.tree.detach(*iids)
+
+    def _is_shown(self, command_id):
+        position = bisect.bisect_left(self._shown, command_id)
+        return position < len(self._shown) and self._shown[position] == command_id
+
+    def _matches(self, command_id):
+        return not self.query or self.index.matches(command_id, self.query)
+
+    def _put(self, command):
+        previous = self.rows.get(command.id)
+        self.rows[command.id] = command
+        self.index.add(command)
+        if previous is not None and previous != command and self.tree.exists(str(command.id)):
+            self.tree.item(str(command.id), values=self._values(command))
+        if self._matches(command.id):
+            self._show(command.id)
+        else:
+            self._hide([command.id])
+
+    def _notify(self):
+        if self.on_change is not None:
+            self.on_change(len(self._shown), len(self.rows))
+
+    # --- Chunked jobs ---
+
+    def _start(self, name, steps, on_done=None):
+        self._cancel(name)
+        job = [self._run(name, steps, on_done), None]
+        self._jobs[name] = job
+        job[1] = self.tree.after_idle(self._step, name, job)
+
+    def _cancel(self, name):
+        job = self._jobs.pop(name, None)
+        if job is not None and job[1] is not None:
+            try:
+                self.tree.after_cancel(job[1])
+            except Exception:
+                pass
+
+    def _run(self, name, steps, on_done):
+        for _ in steps:
+            yield
+        if on_done is not None:
+            on_done()
+
+    def _step(self, name, job):
+        if self._jobs.get(name) is not job:
+            return # Superseded
+        deadline = time.perf_counter() + CHUNK_BUDGET_S
+        try:
+            while time.perf_counter() < deadline:
+                next(job[0])
+        except StopIteration:
+            self._jobs.pop(name, None)
+            self._notify()
+            return
+        self._notify()
+        job[1] = self.tree.after_idle(self._step, name, job)
+
+    def busy(self):
+        return bool(self._jobs)
+
+    # --- Public API ---
+
+    def sync(self, commands):
+        """
+        Reconciles the tree with `commands` (the whole store): removed rows are
+        deleted at once, new and changed rows are applied in idle-time chunks.
+        """
+        commands = list(commands)
+        wanted = {command.id for command in commands}
+        removed = [command_id for command_id in self.rows if command_id not in wanted]
+        for command_id in removed:
+            del self.rows[command_id]
+            self.index.remove(command_id)
+        self._hide(removed, delete=True)
+        changed = [command for command in commands if self.rows.get(command.id) != command]
+        # upsert() and remove() drop their id from here, so a later chunk never brings back stale state
+        pending = self._pending_sync = {command.id: command for command in changed}
+        started = time.perf_counter()
+
+        def steps():
+            for command in changed:
+                if pending.pop(command.id, None) is not None:
+                    self._put(command)
+                yield
+
+        def done():
+            log.debug("Application tree synced", extra={"commands": len(self.rows), "changed": len(changed),
+                                                         "removed": len(removed),
+                                                         "ms": round((time.perf_counter() - started) * 1000, 1)})
+            if self.on_synced is not None:
+                self.on_synced(len(self.rows))
+
+        self._start("sync", steps(), done)
+        self._notify()
+
+    def upsert(self, command):
+        """Applies one added or edited command right away."""
+        self._pending_sync.pop(command.id, None)
+        self._put(command)
+        self._notify()
+
+    def remove(self, command_id):
+        self._pending_sync.pop(command_id, None)
+        self.rows.pop(command_id, None)
+        self.index.remove(command_id)
+        self._hide([command_id], delete=True)
+        self._notify()
+
+    def set_filter(self, query):
+        """Shows only the rows matching `query`: non-matching rows are detached at once, matching ones re-attached in chunks."""
+        query = query.strip()
+        if query == self.query:
+            return
+        self.query = query
+        matching = self.index.search(query)
+        if matching is None:
+            to_show = sorted(self.rows)
+            to_hide = []
+        else:
+            to_show = sorted(matching)
+            to_hide = [command_id for command_id in self._shown if command_id not in matching]
+        self._hide(to_hide)
+
+        def steps():
+            for command_id in to_show:
+                if command_id in self.rows and self._matches(command_id):
+                    self._show(command_id)
+                yield
+
+        self._start("filter", steps())
+        self._notify()
+
+    def shown_count(self):
+        return len(self._shown)
+
+    def close(self):
+        for name in list(self._jobs):
+            self._cancel(name)
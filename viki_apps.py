@@ -0,0 +1,446 @@
+import difflib
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import viki_log
+
+log = viki_log.get_logger("apps")
+
+# --- Installed Application Index ---
+# "open <name>" is resolved against every application found on this machine:
+# executables on PATH, freedesktop .desktop entries (Linux) and Start Menu
+# shortcuts (Windows). Directories are scanned once; afterwards only a directory
+# that changed is rescanned (inotify on Linux, a cheap mtime poll elsewhere).
+# Each entry keeps its launch argv fully resolved, so launching never searches
+# PATH or stats files again.
+#
+# Lookups are an exact dictionary hit (on the longest leading run of words, so
+# "notepad please" finds notepad), else a fuzzy match: candidates sharing
+# trigrams with the name are ranked with difflib, and results are memoized
+# until the index changes.
+
+App = namedtuple("App", ["name", "argv", "source"]) # source: "desktop", "shortcut" or "path"
+
+FUZZY_CUTOFF = 0.75 # difflib ratio a fuzzy match needs
+MAX_CANDIDATES = 12 # Candidates (by shared trigrams) scored with difflib
+MEMO_SIZE = 512 # Names find() remembers; the server and batch mode ask for arbitrary ones
+POLL_INTERVAL_S = 10.0 # Directory mtime poll when inotify isn't available
+SAFETY_POLL_S = 120.0 # Poll even with inotify, for directories created later
+DEBOUNCE_S = 0.5 # Package managers touch many files at once; rescan once they are done
+
+# Spoken names that don't match any executable or entry name
+ALIASES = {
+    "calculator": ("calc", "gnome-calculator", "kcalc", "galculator"),
+    "word": ("winword", "microsoft word", "libreoffice writer"),
+    "excel": ("microsoft excel", "libreoffice calc"),
+    "notepad": ("notepad", "gedit", "gnome-text-editor", "kate", "mousepad"),
+    "terminal": ("gnome-terminal", "konsole", "xfce4-terminal", "cmd"),
+}
+
+_DESKTOP_FIELD_CODES = {"%f", "%F", "%u", "%U", "%d", "%D", "%n", "%N", "%i", "%c", "%k", "%v", "%m"}
+
+
+def normalize(name):
+    return " ".join(name.lower().replace("_", " ").split())
+
+
+def _keys(name):
+    """Names an application can be asked for by: its name, and with dashes as spaces."""
+    key = normalize(name)
+    keys = {key}
+    if "-" in key:
+        keys.add(key.replace("-", " "))
+    return keys
+
+
+def _trigrams(text):
+    text = f" {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# --- Directory scanners: each returns {entry id: App or None (hidden)} ---
+
+def _path_dirs():
+    seen = []
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        directory = os.path.abspath(os.path.expanduser(directory)) if directory else ""
+        if directory and directory not in seen:
+            seen.append(directory)
+    return seen
+
+
+def _scan_path_dir(directory):
+    apps = {}
+    if sys.platform == "win32":
+        extensions = {ext.lower() for ext in os.environ.get("PATHEXT", ".COM;.EXE;.BAT;.CMD").split(";") if ext}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if sys.platform == "win32":
+                    stem, ext = os.path.splitext(entry.name)
+                    executable = ext.lower() in extensions and entry.is_file()
+                else:
+                    stem = entry.name # "python3.12" is one name on POSIX
+                    executable = entry.is_file() and os.access(entry.path, os.X_OK)
+                if executable:
+                    apps.setdefault(stem.lower(), App(stem, (entry.path,), "path"))
+    except OSError:
+        pass
+    return apps
+
+
+def _desktop_dirs():
+    if sys.platform == "win32":
+        return []
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    data_dirs = os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share"
+    return [os.path.join(directory, "applications") for directory in [data_home] + data_dirs.split(":") if directory]
+
+
+def parse_desktop_entry(path):
+    """The App a .desktop file describes, or None if it is hidden or not an application."""
+    fields = {}
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            in_entry = False
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    if in_entry:
+                        break # Only the [Desktop Entry] group matters; actions follow it
+                    in_entry = line == "[Desktop Entry]"
+                elif in_entry and "=" in line:
+                    key, _, value = line.partition("=")
+                    fields.setdefault(key.strip(), value.strip())
+    except OSError:
+        return None
+    if fields.get("Type") != "Application" or "Exec" not in fields or "Name" not in fields:
+        return None
+    if fields.get("NoDisplay", "").lower() == "true" or fields.get("Hidden", "").lower() == "true":
+        return None
+    try:
+        argv = [arg.replace("%%", "%") for arg in shlex.split(fields["Exec"]) if arg not in _DESKTOP_FIELD_CODES]
+    except ValueError:
+        return None
+    if not argv:
+        return None
+    return App(fields["Name"], tuple(argv), "desktop")
+
+
+def _scan_desktop_dir(directory):
+    apps = {}
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if filename.endswith(".desktop"):
+                path = os.path.join(root, filename)
+                # Desktop file id: the path below applications/, with "/" as "-"; an earlier directory overrides it
+                apps[os.path.relpath(path, directory).replace(os.sep, "-")] = parse_desktop_entry(path)
+    return apps
+
+
+def _shortcut_dirs():
+    if sys.platform != "win32":
+        return []
+    roots = [os.environ.get("APPDATA"), os.environ.get("PROGRAMDATA")]
+    return [os.path.join(root, "Microsoft", "Windows", "Start Menu", "Programs") for root in roots if root]
+
+
+def _scan_shortcut_dir(directory):
+    apps = {}
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() == ".lnk" and "uninstall" not in stem.lower():
+                path = os.path.join(root, filename)
+                apps[os.path.relpath(path, directory).lower()] = App(stem, (path,), "shortcut")
+    return apps
+
+
+def _dir_mtime(directory, recursive):
+    """Latest modification time of a directory (and its subdirectories if `recursive`); None if it doesn't exist."""
+    try:
+        latest = os.stat(directory).st_mtime
+    except OSError:
+        return None
+    if not recursive:
+        return latest
+    for root, dirs, _ in os.walk(directory):
+        for name in dirs:
+            try:
+                latest = max(latest, os.stat(os.path.join(root, name)).st_mtime)
+            except OSError:
+                pass
+    return latest
+
+
+class AppIndex:
+    """
+    The applications installed on this machine, by every name they can be asked
+    for. Thread-safe: scans replace the lookup tables in one assignment.
+    """
+
+    def __init__(self, path_dirs=None, desktop_dirs=None, shortcut_dirs=None):
+        # (scanner, directory) in priority order: desktop entries and shortcuts have
+        # the names people say; PATH entries follow in PATH order. None = this system's directories
+        self.sources = ([(_scan_desktop_dir, directory) for directory in (_desktop_dirs() if desktop_dirs is None else desktop_dirs)]
+                        + [(_scan_shortcut_dir, directory) for directory in (_shortcut_dirs() if shortcut_dirs is None else shortcut_dirs)]
+                        + [(_scan_path_dir, directory) for directory in (_path_dirs() if path_dirs is None else path_dirs)])
+        self.trees = {directory for scanner, directory in self.sources if scanner is not _scan_path_dir} # Scanned recursively
+        self._scanned = {} # directory -> {entry id: App or None}
+        self._mtimes = {} # directory -> mtime when it was scanned
+        self._apps = {} # key -> App
+        self._grams = {} # trigram -> keys containing it
+        self._memo = OrderedDict() # name -> App or None, least recently used first; cleared when the index changes
+        self._memo_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.generation = 0
+
+    def __len__(self):
+        return len({app.argv for app in self._apps.values()})
+
+    # --- Building ---
+
+    def refresh(self, directories=None):
+        """Rescans `directories` (all of them if None) and rebuilds the lookup tables."""
+        started = time.perf_counter()
+        with self._lock:
+            for scanner, directory in self.sources:
+                if directories is None or directory in directories:
+                    self._mtimes[directory] = _dir_mtime(directory, directory in self.trees)
+                    self._scanned[directory] = scanner(directory) if self._mtimes[directory] is not None else {}
+            self._rebuild()
+        log.debug("Application index refreshed", extra={"apps": len(self), "names": len(self._apps),
+                                                         "directories": len(directories) if directories else len(self.sources),
+                                                         "ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    def _rebuild(self):
+        # Resolve bare commands of desktop entries through the PATH scan, first directory first
+        on_path = {}
+        for scanner, directory in reversed(self.sources):
+            if scanner is _scan_path_dir:
+                for app in self._scanned.get(directory, {}).values():
+                    on_path[os.path.basename(app.argv[0])] = app.argv[0]
+        apps = {}
+        seen_ids = set()
+        for scanner, directory in self.sources:
+            for entry_id, app in self._scanned.get(directory, {}).items():
+                if scanner is _scan_desktop_dir:
+                    if entry_id in seen_ids:
+                        continue # Overridden (or hidden) by a user or earlier entry
+                    seen_ids.add(entry_id)
+                if app is None:
+                    continue
+                if app.source == "desktop" and os.sep not in app.argv[0] and app.argv[0] in on_path:
+                    app = app._replace(argv=(on_path[app.argv[0]],) + app.argv[1:])
+                for key in _keys(app.name):
+                    apps.setdefault(key, app)
+                if app.source == "desktop":
+                    for key in _keys(os.path.basename(app.argv[0])):
+                        apps.setdefault(key, app)
+        for alias, names in ALIASES.items():
+            for name in names:
+                if alias not in apps and name in apps:
+                    apps[alias] = apps[name]
+        grams = {}
+        for key in apps:
+            for gram in _trigrams(key):
+                grams.setdefault(gram, []).append(key)
+        self._apps, self._grams, self._memo = apps, grams, OrderedDict()
+        self.generation += 1
+
+    # --- Lookup ---
+
+    def find(self, name):
+        """
+        The application best matching a spoken name, or None. Words after the name
+        ("notepad please", "calculator for me") are ignored: the longest leading
+        run of words that names an application exactly wins, before any fuzzy match.
+        """
+        name = normalize(name)
+        if name.startswith("the "):
+            name = name[4:]
+        with self._memo_lock:
+            memo = self._memo
+            if name in memo:
+                memo.move_to_end(name)
+                return memo[name]
+        app = self._exact(name)
+        if app is None and len(name) >= 3:
+            app = self._fuzzy(name)
+        with self._memo_lock:
+            if memo is self._memo: # Not rebuilt meanwhile
+                memo[name] = app
+                if len(memo) > MEMO_SIZE:
+                    memo.popitem(last=False)
+        return app
+
+    def _exact(self, name):
+        words = name.split()
+        for end in range(len(words), 0, -1):
+            app = self._apps.get(" ".join(words[:end]))
+            if app is not None:
+                return app
+        return None
+
+    def _fuzzy(self, name):
+        counts = {}
+        for gram in _trigrams(name):
+            for key in self._grams.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[:MAX_CANDIDATES]
+        matcher = difflib.SequenceMatcher(None, b=name, autojunk=False)
+        best, best_score = None, FUZZY_CUTOFF # Nothing below the cutoff is ever accepted
+        for key in candidates:
+            matcher.set_seq1(key)
+            if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+                continue # Upper bounds of ratio(); the full comparison can't beat the best so far
+            score = matcher.ratio()
+            if score > best_score or (score == best_score and (best is None or len(key) < len(best))):
+                best, best_score = key, score
+        if best is None:
+            # "open visual studio" for "Visual Studio Code": the name is the start of an entry name
+            prefixed = [key for key in candidates if key.startswith(name + " ")]
+            best = min(prefixed, key=len) if prefixed else None
+        return self._apps[best] if best else None
+
+    # --- Watching ---
+
+    def watch(self):
+        """Keeps the index current from a background thread until close()."""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_loop, name="viki-apps", daemon=True)
+            self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+
+    def _changed_dirs(self):
+        return {directory for directory, mtime in list(self._mtimes.items()) if _dir_mtime(directory, directory in self.trees) != mtime}
+
+    def _watch_loop(self):
+        inotify = None
+        try:
+            inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            log.info("Watching application directories by polling: %s", e)
+        try:
+            if inotify is not None:
+                inotify.watch_all(self._mtimes, self.trees)
+            next_poll = time.monotonic() + (SAFETY_POLL_S if inotify else POLL_INTERVAL_S)
+            dirty = set()
+            while not self._stop.is_set():
+                if inotify is not None:
+                    changed = inotify.read(timeout=1.0)
+                    if changed:
+                        dirty |= changed
+                        self._stop.wait(DEBOUNCE_S)
+                        dirty |= inotify.read(timeout=0)
+                else:
+                    self._stop.wait(1.0)
+                if time.monotonic() >= next_poll:
+                    dirty |= self._changed_dirs()
+                    next_poll = time.monotonic() + (SAFETY_POLL_S if inotify else POLL_INTERVAL_S)
+                if dirty:
+                    self.refresh({directory for directory in dirty if directory in self._mtimes} or None)
+                    if inotify is not None:
+                        inotify.watch_all(self._mtimes, self.trees) # Directories created since the last scan
+                    dirty = set()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+
+class _Inotify:
+    """Minimal inotify binding (through ctypes): which watched directories changed."""
+
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {} # watch descriptor -> top-level directory it belongs to
+        self._watched = set()
+
+    def watch_all(self, directories, trees):
+        """Watches each directory, and the subdirectories of those in `trees` (new ones too, when called again)."""
+        for top in list(directories):
+            for root in ([root for root, _, _ in os.walk(top)] if top in trees else [top]):
+                if root not in self._watched and os.path.isdir(root):
+                    wd = self._libc.inotify_add_watch(self.fd, os.fsencode(root), self.MASK)
+                    if wd >= 0:
+                        self._watches[wd] = top
+                        self._watched.add(root)
+
+    def read(self, timeout):
+        import select
+        import struct
+        changed = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+            offset += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                changed.update(self._watches.values()) # Events were lost; rescan everything watched
+            elif wd in self._watches:
+                changed.add(self._watches[wd])
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def launch(app):
+    """Starts an application from its cached argv."""
+    if app.source == "shortcut":
+        os.startfile(app.argv[0]) # Windows resolves the .lnk itself
+    else:
+        subprocess.Popen(list(app.argv))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The shared index, scanned (and watched) on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = AppIndex()
+                index.refresh()
+                index.watch()
+                _index = index
+    return _index
+
+
+def set_index(index):
+    """Replaces the shared index (e.g. with one over fixture directories). Returns the previous one."""
+    global _index
+    with _index_lock:
+        previous, _index = _index, index
+    return previous
@@ -0,0 +1,198 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import types
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import viki
+import viki_apps
+import viki_commands
+import viki_log
+import viki_session
+
+log = viki_log.get_logger("batch")
+
+# --- Batch Mode ---
+# Runs a file of text queries through viki.perform_task without audio or UI,
+# for regression and capacity testing:
+#
+#     python viki_batch.py queries.txt -o results.jsonl --workers 16
+#     some-generator | python viki_batch.py - > results.jsonl
+#
+# One query per line (blank lines and lines starting with "#" are skipped). The
+# input is read as a stream: at most WINDOW_PER_WORKER queries per worker are in
+# flight, so a file of any size runs in constant memory. Each query gets a JSONL
+# row, in input order, with its reply and timing; the last line is the summary
+# ({"summary": {...}} with throughput and latency percentiles).
+#
+# Launches are dry-run by default: subprocess.Popen, webbrowser.open and
+# viki_apps.launch are replaced by recorders, and each row lists what its query
+# would have opened. --live launches for real. Queries that fall through to the
+# chatbot still call it, unless --no-chat answers them with CHAT_PLACEHOLDER.
+# Every query gets a fresh session unless --shared-session is given.
+
+DEFAULT_WORKERS = 8
+WINDOW_PER_WORKER = 4 # Queries read ahead per worker; bounds memory and keeps output in order
+CHAT_PLACEHOLDER = "[chat]"
+
+_calls = threading.local() # Launches recorded for the query running on this thread
+
+
+class _Recorder:
+    """Stands in for a launcher: records the call for the current query instead of making it."""
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    def __call__(self, target, *args, **kwargs):
+        if isinstance(target, viki_apps.App):
+            target = list(target.argv)
+        launches = getattr(_calls, "launches", None)
+        if launches is not None:
+            launches.append([self.kind, target])
+        return True
+
+
+@contextlib.contextmanager
+def dry_run():
+    """Replaces viki's launchers with recorders until exit. Process-wide."""
+    saved = (viki.subprocess, viki.webbrowser, viki_apps.launch)
+    viki.subprocess = types.SimpleNamespace(Popen=_Recorder("popen"))
+    viki.webbrowser = types.SimpleNamespace(open=_Recorder("browser"))
+    viki_apps.launch = _Recorder("open")
+    try:
+        yield
+    finally:
+        viki.subprocess, viki.webbrowser, viki_apps.launch = saved
+
+
+@contextlib.contextmanager
+def no_chat():
+    """Answers chatbot queries with CHAT_PLACEHOLDER until exit. Process-wide."""
+    saved = viki.get_gemini_response
+    viki.get_gemini_response = lambda prompt, session=None: CHAT_PLACEHOLDER
+    try:
+        yield
+    finally:
+        viki.get_gemini_response = saved
+
+
+def iter_queries(stream):
+    """(line number, query) for each query line in `stream`, read lazily."""
+    for number, line in enumerate(stream, 1):
+        query = line.strip()
+        if query and not query.startswith("#"):
+            yield number, query
+
+
+def run_query(number, query, session=None):
+    """Runs one query and returns its result row."""
+    session = session or viki_session.Session(language=viki.default_session.language)
+    _calls.launches = launches = []
+    started = time.perf_counter()
+    try:
+        reply, error = viki.perform_task(query, session), None
+    except Exception as e:
+        reply, error = None, f"{type(e).__name__}: {e}"
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _calls.launches = None
+    row = {"line": number, "query": query, "reply": reply, "ms": round(elapsed_ms, 3)}
+    if launches:
+        row["launches"] = launches
+    if error:
+        row["error"] = error
+    return row
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_batch(queries, out, workers=DEFAULT_WORKERS, session=None):
+    """
+    Runs (line number, query) pairs on `workers` threads and writes a JSONL row per
+    query to `out`, in input order, then the summary row. Returns the summary.
+    """
+    samples = []
+    counts = {"errors": 0, "launches": 0}
+    pending = deque()
+    window = max(1, workers * WINDOW_PER_WORKER)
+
+    def write(row):
+        samples.append(row["ms"])
+        counts["errors"] += "error" in row
+        counts["launches"] += len(row.get("launches", ()))
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="viki-batch") as pool:
+        for number, query in queries:
+            if len(pending) >= window:
+                write(pending.popleft().result())
+            pending.append(pool.submit(run_query, number, query, session))
+        while pending:
+            write(pending.popleft().result())
+    elapsed = time.perf_counter() - started
+
+    summary = {
+        "queries": len(samples),
+        "errors": counts["errors"],
+        "launches": counts["launches"],
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "queries_per_s": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "ms_p50": round(percentile(samples, 50), 3),
+        "ms_p95": round(percentile(samples, 95), 3),
+        "ms_p99": round(percentile(samples, 99), 3),
+        "ms_max": round(max(samples, default=0.0), 3),
+    }
+    out.write(json.dumps({"summary": summary}) + "\n")
+    out.flush()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a file of text queries through Viki's dispatcher and write JSONL results.")
+    parser.add_argument("input", help="File with one query per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file to write (default: stdout)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Queries processed at the same time")
+    parser.add_argument("--live", action="store_true", help="Really launch applications and open pages")
+    parser.add_argument("--no-chat", action="store_true", help=f"Answer chatbot queries with {CHAT_PLACEHOLDER!r} instead of calling it")
+    parser.add_argument("--shared-session", action="store_true",
+                        help="Run every query in one conversation instead of a fresh session each")
+    args = parser.parse_args(argv)
+
+    viki_log.setup_logging(level=os.environ.get("VIKI_LOG_LEVEL", "WARNING")) # Per-query INFO lines would swamp the run
+    # Load the command store and the application index before the clock starts
+    viki_commands.get_store()
+    viki_apps.get_index()
+    session = viki_session.Session("batch") if args.shared_session else None
+    try:
+        with contextlib.ExitStack() as stack:
+            source = sys.stdin if args.input == "-" else stack.enter_context(open(args.input, encoding="utf-8"))
+            out = sys.stdout if args.output == "-" else stack.enter_context(open(args.output, "w", encoding="utf-8", newline="\n"))
+            if not args.live:
+                stack.enter_context(dry_run())
+            if args.no_chat:
+                stack.enter_context(no_chat())
+            summary = run_batch(iter_queries(source), out, args.workers, session)
+        log.info("Batch done", extra=summary)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        viki_log.shutdown_logging()
+    print(f"{summary['queries']} queries in {summary['seconds']} s ({summary['queries_per_s']}/s), "
+          f"{summary['errors']} errors", file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import viki_commands
+import viki_log
+
+log = viki_log.get_logger("bulk")
+
+# --- Bulk Import / Export of Custom Commands ---
+# Files are read as a stream: records are parsed, validated and written to the
+# store in batches (one transaction per batch), so a profile with thousands of
+# mappings never has to be held in memory and the UI sees steady progress. Paths
+# of a batch are checked for existence in parallel, since they may sit on slow or
+# network drives. Both jobs are meant to run off the Tk thread.
+#
+# Accepted formats (chosen by extension):
+#     .json   {"voice": "target", ...} (custom_commands.json) or a list of
+#             {"voice": ..., "target": ..., "name": ...} objects
+#     .jsonl  one such object per line
+#     .csv    a header row naming voice/target/name columns, or voice,target[,name] rows
+#     other   "voice : target" lines (the old TXT export)
+
+BATCH_SIZE = 500
+PATH_CHECK_WORKERS = 8
+READ_CHUNK = 64 * 1024
+MAX_ERRORS_KEPT = 50 # Errors reported back to the user; the rest are only counted
+
+# Column names accepted in a CSV header, and keys accepted in JSON objects
+_FIELD_ALIASES = {
+    "voice": "voice", "voice command": "voice", "voice_command": "voice", "command": "voice",
+    "target": "target", "path": "target", "url": "target",
+    "name": "name", "application": "name", "app": "name",
+}
+
+
+class BulkCancelled(Exception):
+    pass
+
+
+class BulkReport:
+    """Running totals of a bulk job; passed to on_progress after every batch."""
+
+    def __init__(self, path):
+        self.path = path
+        self.read = 0
+        self.written = 0
+        self.invalid = 0
+        self.missing = 0
+        self.errors = [] # (record number, message), at most MAX_ERRORS_KEPT
+        self.started = time.perf_counter()
+        self.finished = None
+        self.bytes_total = 0
+        self.bytes_done = 0
+
+    def error(self, number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS_KEPT:
+            self.errors.append((number, message))
+
+    @property
+    def fraction(self):
+        return min(1.0, self.bytes_done / self.bytes_total) if self.bytes_total else 0.0
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self):
+        return {"path": self.path, "read": self.read, "written": self.written, "invalid": self.invalid,
+                "missing": self.missing, "seconds": round(self.elapsed, 3)}
+
+
+# --- Streaming readers: each yields (record number, fields dict or error string) ---
+
+def _fields(record):
+    """Maps an object's keys onto voice/target/name. Returns None for something that isn't an object."""
+    if not isinstance(record, dict):
+        return None
+    fields = {}
+    for key, value in record.items():
+        field = _FIELD_ALIASES.get(str(key).strip().lower())
+        if field is not None and field not in fields:
+            fields[field] = value
+    return fields
+
+
+def _iter_json_values(f):
+    """
+    Yields the members of a top-level JSON object (as (key, value)) or array (as
+    (None, value)) while reading `f` in chunks, without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    consumed = 0 # Characters dropped from the front of buf, for error positions
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, consumed, eof
+        chunk = f.read(READ_CHUNK)
+        if not chunk:
+            eof = True
+        consumed += pos
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    def expect(chars):
+        nonlocal pos
+        skip_ws()
+        if pos >= len(buf) or buf[pos] not in chars:
+            found = buf[pos] if pos < len(buf) else "end of file"
+            raise ValueError(f"invalid JSON at character {consumed + pos}: expected {' or '.join(repr(c) for c in chars)}, found {found!r}")
+        pos += 1
+        return buf[pos - 1]
+
+    def value():
+        nonlocal pos
+        skip_ws()
+        while True:
+            try:
+                result, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"invalid JSON at character {consumed + e.pos}: {e.msg}") from None
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                fill() # A number could continue in the next chunk; decode again with more input
+                continue
+            pos = end
+            return result
+
+    fill()
+    opening = expect("{[")
+    closing = "}" if opening == "{" else "]"
+    skip_ws()
+    if pos < len(buf) and buf[pos] == closing:
+        return
+    while True:
+        if opening == "{":
+            key = value()
+            expect(":")
+            yield key, value()
+        else:
+            yield None, value()
+        if expect("," + closing) == closing:
+            return
+
+
+def _read_json(f):
+    for number, (key, item) in enumerate(_iter_json_values(f), 1):
+        if key is not None and isinstance(item, str): # {voice: target}
+            yield number, {"voice": key, "target": item}
+            continue
+        fields = _fields(item)
+        if fields is None:
+            yield number, "not an object"
+            continue
+        if key is not None:
+            fields.setdefault("voice", key) # {voice: {"target": ..., "name": ...}}
+        yield number, fields
+
+
+def _read_jsonl(f):
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            fields = _fields(json.loads(line))
+        except ValueError as e:
+            yield number, f"invalid JSON: {e}"
+            continue
+        yield number, fields if fields is not None else "not an object"
+
+
+def _read_csv(f):
+    reader = csv.reader(f)
+    columns = ["voice", "target", "name"]
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        header = [_FIELD_ALIASES.get(cell.strip().lower()) for cell in row]
+        if reader.line_num == 1 and "voice" in header and "target" in header:
+            columns = header
+            continue
+        yield reader.line_num, {field: cell for field, cell in zip(columns, row) if field is not None}
+
+
+def _read_txt(f):
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        voice, sep, target = line.partition(" : ")
+        if not sep:
+            yield number, "expected 'voice : target'"
+            continue
+        yield number, {"voice": voice, "target": target.strip()}
+
+
+def _reader(path):
+    extension = os.path.splitext(path)[1].lower()
+    return {".json": _read_json, ".jsonl": _read_jsonl, ".csv": _read_csv}.get(extension, _read_txt)
+
+
+class _TrackedFile:
+    """Text file wrapper that counts the bytes consumed, for progress reporting."""
+
+    def __init__(self, f, report):
+        self._f = f
+        self._report = report
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._report.bytes_done = self._f.buffer.tell()
+        return data
+
+    def __iter__(self):
+        for line in self._f:
+            self._report.bytes_done += len(line.encode("utf-8"))
+            yield line
+
+
+# --- Validation ---
+
+def _validate(fields):
+    """Returns (voice, target, name) or raises ValueError."""
+    voice, target, name = (fields.get(field) for field in ("voice", "target", "name"))
+    if not isinstance(voice, str) or not voice.strip():
+        raise ValueError("missing voice command")
+    if not isinstance(target, str) or not target.strip():
+        raise ValueError("missing target")
+    if name is not None and not isinstance(name, str):
+        raise ValueError("name must be text")
+    if len(voice.split()) > viki_commands.MAX_VOICE_WORDS:
+        raise ValueError(f"voice command longer than {viki_commands.MAX_VOICE_WORDS} words")
+    return voice.strip(), target.strip(), (name or "").strip() or None
+
+
+def _check_paths(pool, batch):
+    """Existence of every distinct local path in the batch, checked in parallel."""
+    paths = list({target for _, (_, target, _) in batch if not target.startswith(viki_commands.WEB_PREFIX)})
+    return dict(zip(paths, pool.map(os.path.isfile, paths)))
+
+
+# --- Jobs ---
+
+def import_commands(path, store=None, check_paths=True, batch_size=BATCH_SIZE, on_progress=None, cancel=None):
+    """
+    Imports commands from `path` into the store, batch by batch. Invalid records
+    (and, with check_paths, applications whose file does not exist) are skipped
+    and reported. A record with the voice command of an existing one replaces it.
+    on_progress(report) runs after every batch; setting the `cancel` Event stops
+    after the current batch (batches already written stay). Returns the BulkReport.
+    Raises OSError/ValueError for an unreadable file or malformed JSON.
+    """
+    store = store or viki_commands.get_store()
+    report = BulkReport(path)
+    report.bytes_total = os.path.getsize(path)
+    with open(path, "r", encoding="utf-8-sig", newline="") as raw, \
+            ThreadPoolExecutor(max_workers=PATH_CHECK_WORKERS, thread_name_prefix="viki-pathcheck") as pool:
+        f = _TrackedFile(raw, report)
+        batch = []
+
+        def flush():
+            exists = _check_paths(pool, batch) if check_paths else {}
+            rows = []
+            for number, (voice, target, name) in batch:
+                if exists.get(target, True):
+                    rows.append((voice, target, name))
+                else:
+                    report.missing += 1
+                    report.error(number, f"file not found: {target}")
+            if rows:
+                report.written += store.upsert_many(rows)
+            batch.clear()
+            if on_progress is not None:
+                on_progress(report)
+            if cancel is not None and cancel.is_set():
+                raise BulkCancelled()
+
+        try:
+            for number, fields in _reader(path)(f):
+                report.read += 1
+                if isinstance(fields, str):
+                    report.error(number, fields)
+                    continue
+                try:
+                    batch.append((number, _validate(fields)))
+                except ValueError as e:
+                    report.error(number, str(e))
+                    continue
+                if len(batch) >= batch_size:
+                    flush()
+            report.bytes_done = report.bytes_total
+            flush()
+        except BulkCancelled:
+            log.info("Import cancelled", extra=report.summary())
+            raise
+        finally:
+            report.finished = time.perf_counter()
+    log.info("Imported custom commands", extra=report.summary())
+    return report
+
+
+def export_commands(path, store=None, batch_size=BATCH_SIZE, on_progress=None, cancel=None):
+    """
+    Writes every command to `path` in the format its extension selects, streaming
+    from the store. Written atomically: a cancelled or failed export leaves any
+    existing file untouched. Returns the BulkReport (`written` = commands exported).
+    """
+    store = store or viki_commands.get_store()
+    report = BulkReport(path)
+    report.bytes_total = report.read = store.count() # Progress is counted in commands here
+    extension = os.path.splitext(path)[1].lower()
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f) if extension == ".csv" else None
+            if writer is not None:
+                writer.writerow(["name", "voice", "target"])
+            elif extension == ".json":
+                f.write("{")
+            for batch in store.iter_batches(batch_size):
+                for command in batch:
+                    if writer is not None:
+                        writer.writerow([command.name, command.voice, command.target])
+                    elif extension == ".json":
+                        # Same shape as custom_commands.json, so the file can be imported or used as one
+                        f.write(f'{"," if report.written else ""}\n    {json.dumps(command.voice)}: {json.dumps(command.target)}')
+                    elif extension == ".jsonl":
+                        f.write(json.dumps({"name": command.name, "voice": command.voice, "target": command.target}) + "\n")
+                    else:
+                        f.write(f"{command.voice} : {command.target}\n")
+                    report.written += 1
+                report.bytes_done = report.written
+                if on_progress is not None:
+                    on_progress(report)
+                if cancel is not None and cancel.is_set():
+                    raise BulkCancelled()
+            if extension == ".json":
+                f.write("\n}\n" if report.written else "}\n")
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        report.finished = time.perf_counter()
+    log.info("Exported custom commands", extra=report.summary())
+    return report
+
+
+class BulkJob:
+    """Runs import_commands or export_commands on a background thread; cancel() stops it after the current batch."""
+
+    def __init__(self, fn, path, on_progress=None, on_done=None, **kwargs):
+        self.cancel_event = threading.Event()
+        self._fn = fn
+        self._path = path
+        self._on_progress = on_progress
+        self._on_done = on_done # on_done(report, error): report is None if the job failed or was cancelled
+        self._kwargs = kwargs
+        self.thread = threading.Thread(target=self._run, name="viki-bulk", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def running(self):
+        return self.thread.is_alive()
+
+    def _run(self):
+        report = error = None
+        try:
+            report = self._fn(self._path, on_progress=self._on_progress, cancel=self.cancel_event, **self._kwargs)
+        except BulkCancelled:
+            error = "cancelled"
+        except Exception as e:
+            log.warning("Bulk %s of %s failed: %s", self._fn.__name__, self._path, e)
+            error = str(e) or type(e).__name__
+        try:
+            if self._on_done is not None:
+                self._on_done(report, error)
+        finally:
+            # The job and on_done opened store connections on this thread; don't leave them (and the WAL handles) behind
+            store = self._kwargs.get("store")
+            if store is not None:
+                store.release_thread()
+            viki_commands.release_thread()
@@ -0,0 +1,280 @@
+import threading
+import time
+
+import viki_recorder
+import viki_video
+
+# --- Multi-Camera Capture ---
+# One capture thread per device. Each camera fills its own FrameRing, so a slow or
+# stalled device only ever blocks its own thread; the preview reads the newest frame
+# of every camera from a shared FrameBus that holds at most one frame per camera.
+
+STATE_OPENING = "opening"
+STATE_RUNNING = "running"
+STATE_FAILED = "failed"
+STATE_STOPPED = "stopped"
+
+
+def open_source(source, frame_size=(640, 480), fps=30.0):
+    """
+    Opens a capture source: a device index (0, 1, ...), a video file path, or
+    "synthetic" / "synthetic:<fps>" for a generated test pattern.
+    """
+    if isinstance(source, str) and source.startswith("synthetic"):
+        _, _, rate = source.partition(":")
+        return viki_video.SyntheticCapture(frame_size[0], frame_size[1], fps=float(rate) if rate else fps)
+    import cv2
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+
+class FrameBus:
+    """
+    Bounded, latest-wins frame exchange shared by all cameras: one pending frame per
+    camera. Publishing never blocks; an undisplayed frame is replaced (and unpinned
+    from its camera's ring) so a slow consumer cannot hold back any producer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = {} # camera_id -> (slot, ring, timestamp)
+        self.dropped = {}
+
+    def publish(self, camera_id, slot, ring, timestamp):
+        """Hands over a slot pinned in `ring`; the bus owns that pin from now on."""
+        with self._lock:
+            old = self._frames.get(camera_id)
+            self._frames[camera_id] = (slot, ring, timestamp)
+            if old is not None:
+                self.dropped[camera_id] = self.dropped.get(camera_id, 0) + 1
+        if old is not None:
+            old[1].unpin(old[0])
+
+    def take_all(self):
+        """Returns {camera_id: (slot, ring, timestamp)} for every camera with a new frame. Caller unpins."""
+        with self._lock:
+            frames = self._frames
+            self._frames = {}
+        return frames
+
+    def discard(self, camera_id):
+        with self._lock:
+            old = self._frames.pop(camera_id, None)
+        if old is not None:
+            old[1].unpin(old[0])
+
+    def clear(self):
+        for slot, ring, _ in self.take_all().values():
+            ring.unpin(slot)
+
+
+class CameraWorker:
+    """Capture thread for one device: negotiates its mode, paces reads and feeds the bus."""
+
+    def __init__(self, camera_id, source, bus, frame_size=(640, 480), fps=30.0, pixel_format="MJPG", ring_size=6):
+        self.camera_id = camera_id
+        self.source = source
+        self.bus = bus
+        self.frame_size = frame_size
+        self.fps = fps
+        self.pixel_format = pixel_format
+        self.ring = viki_video.FrameRing(ring_size, *frame_size)
+        self.mode = None
+        self.state = STATE_OPENING
+        self.error = None
+        self.capture_rate = viki_video.RateMeter()
+        self.record_rate = viki_video.RateMeter()
+        self.read_time_total = 0.0
+        self.read_failures = 0
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"viki-camera-{self.camera_id}")
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.bus.discard(self.camera_id)
+        return self.stop_recording()
+
+    def _run(self):
+        import cv2
+
+        cap = open_source(self.source, self.frame_size, self.fps)
+        if not cap.isOpened():
+            self.state = STATE_FAILED
+            self.error = f"Cannot open camera source {self.source!r}."
+            return
+        try:
+            self.mode = viki_video.negotiate_camera_mode(cap, *self.frame_size, self.fps, self.pixel_format)
+            needs_resize = (self.mode["width"], self.mode["height"]) != self.frame_size
+            pacer = viki_video.FramePacer(self.mode["fps"])
+            self.state = STATE_RUNNING
+            frame = None
+            while not self._stop_event.is_set():
+                started = time.perf_counter()
+                ret, frame = cap.read(frame)
+                self.read_time_total += time.perf_counter() - started
+                captured_at = time.monotonic()
+                if not ret:
+                    self.read_failures += 1
+                    if self.read_failures >= 30 or isinstance(self.source, str): # End of file or lost device
+                        break
+                    pacer.wait(self._stop_event)
+                    continue
+                self.capture_rate.tick(captured_at)
+                slot = self.ring.acquire()
+                if slot is None:
+                    continue # Consumers still hold every buffer; skip this frame
+                if needs_resize or frame.shape[1::-1] != self.frame_size:
+                    cv2.resize(frame, self.frame_size, dst=slot.bgr)
+                else:
+                    slot.bgr[...] = frame
+                self.ring.publish(slot, captured_at)
+                with self._writer_lock:
+                    writer = self._writer
+                    if writer is not None:
+                        writer.write(slot.bgr, captured_at)
+                        self.record_rate.tick(captured_at)
+                self.ring.pin(slot) # Owned by the bus until the preview (or a newer frame) releases it
+                self.bus.publish(self.camera_id, slot, self.ring, captured_at)
+                pacer.wait(self._stop_event)
+            self.state = STATE_STOPPED
+        except Exception as e:
+            self.state = STATE_FAILED
+            self.error = str(e)
+        finally:
+            cap.release()
+
+    def snapshot(self):
+        """Pins and returns this camera's newest slot, or None."""
+        return self.ring.snapshot()
+
+    def start_recording(self, filename, fourcc_str):
+        """Records this camera to `filename` through its own encoder process."""
+        fps = self.mode["fps"] if self.mode else self.fps
+        writer = viki_recorder.EncoderWorker(filename, fourcc_str, fps, self.frame_size)
+        if not writer.start():
+            self.error = writer.error
+            return False
+        with self._writer_lock:
+            old, self._writer = self._writer, writer
+        self.record_rate.reset()
+        if old is not None:
+            old.release()
+        return True
+
+    def stop_recording(self):
+        """Stops recording and returns the encoder stats, or None if not recording."""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        return writer.release() if writer is not None else None
+
+    @property
+    def recording(self):
+        return self._writer is not None
+
+    def metrics(self):
+        frames = self.capture_rate.count
+        return {
+            "source": str(self.source),
+            "state": self.state,
+            "error": self.error,
+            "mode": self.mode,
+            "frames": frames,
+            "capture_fps": round(self.capture_rate.rate(), 1),
+            "record_fps": round(self.record_rate.rate(), 1) if self.recording else 0.0,
+            "read_ms_avg": round(self.read_time_total * 1000 / frames, 2) if frames else 0.0,
+            "read_failures": self.read_failures,
+            "ring_overruns": self.ring.overruns,
+            "bus_dropped": self.bus.dropped.get(self.camera_id, 0),
+        }
+
+
+class CameraManager:
+    """Starts, stops and aggregates CameraWorkers that share one FrameBus."""
+
+    def __init__(self, frame_size=(640, 480), fps=30.0, pixel_format="MJPG"):
+        self.frame_size = frame_size
+        self.fps = fps
+        self.pixel_format = pixel_format
+        self.bus = FrameBus()
+        self.cameras = {} # camera_id -> CameraWorker, in insertion (= tile) order
+
+    def add(self, source, camera_id=None):
+        if camera_id is None:
+            camera_id = f"cam{len(self.cameras)}"
+        self.cameras[camera_id] = CameraWorker(camera_id, source, self.bus, self.frame_size, self.fps, self.pixel_format)
+        return camera_id
+
+    def start(self):
+        for camera in self.cameras.values():
+            camera.start()
+
+    def stop(self):
+        """Stops every camera; returns {camera_id: recording stats} for cameras that were recording."""
+        stats = {}
+        for camera_id, camera in self.cameras.items():
+            result = camera.stop()
+            if result is not None:
+                stats[camera_id] = result
+        self.bus.clear()
+        return stats
+
+    def metrics(self):
+        return {camera_id: camera.metrics() for camera_id, camera in self.cameras.items()}
+
+
+class TiledPreview:
+    """
+    Composes the newest frame of each camera into one RGB mosaic, reusing the mosaic
+    and PIL buffers. Tiles keep the last frame of a camera until it sends a new one.
+    """
+
+    def __init__(self, camera_ids, tile_size=(320, 240)):
+        import numpy as np
+        import PIL.Image
+        self.camera_ids = list(camera_ids)
+        self.tile_size = tile_size
+        self.columns = max(1, int(np.ceil(np.sqrt(len(self.camera_ids)))))
+        rows = max(1, int(np.ceil(len(self.camera_ids) / self.columns)))
+        width, height = tile_size
+        self.size = (self.columns * width, rows * height)
+        self.rgb = np.zeros((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self.pil = PIL.Image.new("RGB", self.size)
+
+    def tile_at(self, x, y):
+        """Returns the camera id whose tile contains pixel (x, y), or None."""
+        column, row = int(x) // self.tile_size[0], int(y) // self.tile_size[1]
+        index = row * self.columns + column
+        if 0 <= column < self.columns and 0 <= index < len(self.camera_ids):
+            return self.camera_ids[index]
+        return None
+
+    def update(self, frames):
+        """Draws {camera_id: (slot, ring, timestamp)} into the mosaic and unpins the slots. Returns True if anything changed."""
+        import cv2
+
+        width, height = self.tile_size
+        for camera_id, (slot, ring, _) in frames.items():
+            try:
+                index = self.camera_ids.index(camera_id)
+                row, column = divmod(index, self.columns)
+                tile = self.rgb[row * height:(row + 1) * height, column * width:(column + 1) * width]
+                # Resize straight into the mosaic, then convert that tile in place
+                cv2.resize(slot.bgr, self.tile_size, dst=tile, interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(tile, cv2.COLOR_BGR2RGB, dst=tile)
+            except ValueError:
+                pass # Camera was removed
+            finally:
+                ring.unpin(slot)
+        if frames:
+            self.pil.frombytes(self.rgb)
+        return bool(frames)
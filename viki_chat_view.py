@@ -0,0 +1,365 @@
+import collections
+import tkinter as tk
+import tkinter.font as tkfont
+from array import array
+
+import customtkinter as ctk
+
+import viki_log
+
+log = viki_log.get_logger("chat")
+
+# --- Virtualized Chat Transcript ---
+# The transcript is kept in a compact model (texts + one byte per message for
+# kind/sender + a Fenwick tree of row heights). Bubble widgets are only created
+# for the rows in the viewport plus a small overscan, and are recycled on scroll.
+
+SENDER_USER = 0
+SENDER_AI = 1
+KIND_TEXT = 0
+KIND_IMAGE = 2 # Added to the sender code, so 2 = user image, 3 = AI image
+
+BUBBLE_GAP = 4 # Vertical space between two bubbles
+BUBBLE_PADX = 15
+BUBBLE_PADY = 10
+SIDE_MARGIN = 10
+
+
+def _safe_get_color(theme_dict, key, default):
+    try:
+        return theme_dict[key][0]
+    except (KeyError, IndexError, TypeError):
+        return default
+
+
+def bubble_colors(sender):
+    """Returns (bg_color, text_color, hover_color) for a bubble from the current theme."""
+    ctk_button_theme = ctk.ThemeManager.theme.get("CTkButton", {})
+    if sender == SENDER_USER:
+        return (_safe_get_color(ctk_button_theme, "fg_color", "#0078D7"),
+                _safe_get_color(ctk_button_theme, "text_color", "#FFFFFF"),
+                _safe_get_color(ctk_button_theme, "hover_color", "#005A9E"))
+    ctk_segmented_theme = ctk.ThemeManager.theme.get("CTkSegmentedButton", {})
+    return (_safe_get_color(ctk_segmented_theme, "selected_color", "#A0A0A0"),
+            _safe_get_color(ctk_button_theme, "text_color", "#F0F0F0"),
+            _safe_get_color(ctk_segmented_theme, "selected_hover_color", "#909090"))
+
+
+class HeightIndex:
+    """
+    Fenwick (binary indexed) tree over row heights.
+    Gives O(log n) append, height update, offset lookup and row-at-offset search.
+    """
+
+    def __init__(self):
+        self._values = array("I")
+        self._tree = array("Q", [0]) # 1-based
+
+    def __len__(self):
+        return len(self._values)
+
+    def append(self, height):
+        i = len(self._values) + 1
+        self._values.append(height)
+        lowbit = i & -i
+        # tree[i] covers rows (i - lowbit, i]
+        self._tree.append(self.offset(i - 1) - self.offset(i - lowbit) + height)
+
+    def set(self, index, height):
+        delta = height - self._values[index]
+        if not delta:
+            return
+        self._values[index] = height
+        i = index + 1
+        n = len(self._values)
+        while i <= n:
+            self._tree[i] += delta
+            i += i & -i
+
+    def height(self, index):
+        return self._values[index]
+
+    def offset(self, index):
+        """Returns the y offset of row `index` (sum of heights of rows before it)."""
+        total = 0
+        i = index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def total(self):
+        return self.offset(len(self._values))
+
+    def find(self, y):
+        """Returns the index of the row containing offset y (clamped to the valid range)."""
+        n = len(self._values)
+        if n == 0:
+            return 0
+        pos = 0
+        remaining = y
+        step = 1 << n.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= n and self._tree[nxt] <= remaining:
+                pos = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return min(pos, n - 1)
+
+    def clear(self):
+        self._values = array("I")
+        self._tree = array("Q", [0])
+
+
+class _Slot:
+    """A recyclable bubble widget placed on the canvas."""
+
+    def __init__(self, label, window_id, kind):
+        self.label = label
+        self.window_id = window_id
+        self.kind = kind
+        self.index = None
+        self.bg_color = None
+        self.hover_color = None
+
+
+class VirtualChatView:
+    """
+    Renders a chat transcript on a tk.Canvas, creating widgets only for visible rows.
+    """
+
+    def __init__(self, canvas, overscan=4, wraplength=400, font=("Segoe UI", 12), max_cached_images=16):
+        self.canvas = canvas
+        self.overscan = overscan
+        self.wraplength = wraplength
+        self.font = font
+        self.max_cached_images = max_cached_images
+
+        # Compact transcript model
+        self._texts = [] # message text, or image path for image rows
+        self._codes = bytearray() # sender + kind per row
+        self._heights = HeightIndex()
+        self._measured = bytearray() # 1 once the real widget height is known
+
+        self._visible = {} # row index -> _Slot
+        self._free = {KIND_TEXT: [], KIND_IMAGE: []}
+        self._images = collections.OrderedDict() # path -> PhotoImage (small LRU)
+        self._render_pending = False
+        self._stick_to_bottom = True
+        self._width = 1
+        self._tk_font = tkfont.Font(family=font[0], size=font[1])
+        self._line_height = self._tk_font.metrics("linespace")
+
+        self.canvas.bind("<Configure>", self._on_resize)
+        self._bind_wheel(self.canvas)
+
+    # --- Model ---
+
+    def append(self, message, sender="ai"):
+        """Adds a text message and scrolls to it."""
+        code = SENDER_USER if sender == "user" else SENDER_AI
+        self._add_row(str(message), code + KIND_TEXT, self._estimate_text_height(str(message)))
+
+    def append_image(self, image_path, sender="ai", max_size=(400, 300)):
+        """Adds an image message. The image is loaded lazily when its row becomes visible."""
+        code = SENDER_USER if sender == "user" else SENDER_AI
+        self._add_row(image_path, code + KIND_IMAGE, max_size[1] + BUBBLE_GAP)
+
+    def clear(self):
+        """Removes every message. Widgets are kept in the pool for reuse."""
+        for slot in self._visible.values():
+            self._release(slot)
+        self._visible.clear()
+        self._texts.clear()
+        self._codes = bytearray()
+        self._measured = bytearray()
+        self._heights.clear()
+        self._images.clear()
+        self._stick_to_bottom = True
+        self._schedule_render()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def stats(self):
+        """Returns counts useful to check that widget usage stays flat."""
+        return {
+            "messages": len(self._texts),
+            "visible_widgets": len(self._visible),
+            "pooled_widgets": sum(len(pool) for pool in self._free.values()),
+            "cached_images": len(self._images),
+            "content_height": self._heights.total(),
+        }
+
+    def _add_row(self, payload, code, height):
+        self._texts.append(payload)
+        self._codes.append(code)
+        self._measured.append(0)
+        self._heights.append(height)
+        # Like the old add_message, always jump to the latest message
+        self._stick_to_bottom = True
+        self._schedule_render()
+
+    def _estimate_text_height(self, text):
+        lines = 0
+        for paragraph in text.split("\n"):
+            width = self._tk_font.measure(paragraph) if paragraph else 0
+            lines += max(1, -(-width // self.wraplength))
+        return lines * self._line_height + 2 * BUBBLE_PADY + BUBBLE_GAP
+
+    # --- Scrolling ---
+
+    def yview(self, *args):
+        """Scrollbar command. Scrolls the canvas and re-renders the viewport."""
+        self.canvas.yview(*args)
+        self._stick_to_bottom = self.canvas.yview()[1] >= 1.0
+        self._schedule_render()
+
+    def yview_scroll(self, number, what):
+        self.yview("scroll", number, what)
+
+    def yview_moveto(self, fraction):
+        self.yview("moveto", fraction)
+
+    def refresh(self):
+        """Re-applies theme colors to the visible bubbles (e.g. after switching theme)."""
+        for index, slot in self._visible.items():
+            self._configure_slot(slot, index)
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_mousewheel)
+        widget.bind("<Button-4>", lambda e: self.yview_scroll(-3, "units"))
+        widget.bind("<Button-5>", lambda e: self.yview_scroll(3, "units"))
+
+    def _on_mousewheel(self, event):
+        self.yview_scroll(-3 if event.delta > 0 else 3, "units")
+
+    def _on_resize(self, event):
+        if event.width != self._width:
+            self._width = event.width
+            # Row x positions depend on the width, so re-place every visible bubble
+            for index, slot in self._visible.items():
+                self._place_slot(slot, index)
+        self._schedule_render()
+
+    # --- Rendering ---
+
+    def _schedule_render(self):
+        if not self._render_pending:
+            self._render_pending = True
+            self.canvas.after_idle(self._render)
+
+    def _render(self):
+        self._render_pending = False
+        total = self._heights.total()
+        view_height = max(self.canvas.winfo_height(), 1)
+        self.canvas.configure(scrollregion=(0, 0, self._width, max(total, view_height)))
+        if self._stick_to_bottom:
+            self.canvas.yview_moveto(1.0)
+
+        if not self._texts:
+            return
+
+        top = self.canvas.canvasy(0)
+        first = max(0, self._heights.find(top) - self.overscan)
+        last = min(len(self._texts) - 1, self._heights.find(top + view_height) + self.overscan)
+
+        for index in [i for i in self._visible if i < first or i > last]:
+            self._release(self._visible.pop(index))
+
+        new_slots = False
+        for index in range(first, last + 1):
+            if index in self._visible:
+                continue
+            slot = self._acquire(self._codes[index] & KIND_IMAGE)
+            self._visible[index] = slot
+            self._configure_slot(slot, index)
+            self._place_slot(slot, index)
+            new_slots = new_slots or not self._measured[index]
+        if new_slots:
+            # Correct the estimated heights once Tk has computed the real ones
+            self.canvas.after(10, self._measure_visible)
+
+    def _measure_visible(self):
+        changed = False
+        for index, slot in self._visible.items():
+            if self._measured[index]:
+                continue
+            height = slot.label.winfo_reqheight()
+            if height <= 1:
+                continue
+            self._measured[index] = 1
+            height += BUBBLE_GAP
+            if height != self._heights.height(index):
+                self._heights.set(index, height)
+                changed = True
+        if changed:
+            for index, slot in self._visible.items():
+                self._place_slot(slot, index)
+            self._schedule_render()
+
+    def _acquire(self, kind):
+        pool = self._free[kind]
+        if pool:
+            slot = pool.pop()
+            self.canvas.itemconfigure(slot.window_id, state="normal")
+            return slot
+        if kind == KIND_IMAGE:
+            label = ctk.CTkLabel(self.canvas, text="")
+        else:
+            label = ctk.CTkLabel(self.canvas, text="", font=self.font, wraplength=self.wraplength,
+                                 justify=tk.LEFT, corner_radius=10, padx=BUBBLE_PADX, pady=BUBBLE_PADY)
+        window_id = self.canvas.create_window(0, 0, window=label, anchor="nw")
+        slot = _Slot(label, window_id, kind)
+        # Hover bindings are set up once per pooled widget and read the slot's current colors
+        label.bind("<Enter>", lambda e, s=slot: s.hover_color and s.label.configure(bg_color=s.hover_color))
+        label.bind("<Leave>", lambda e, s=slot: s.bg_color and s.label.configure(bg_color=s.bg_color))
+        self._bind_wheel(label)
+        return slot
+
+    def _release(self, slot):
+        slot.index = None
+        self.canvas.itemconfigure(slot.window_id, state="hidden")
+        self._free[slot.kind].append(slot)
+
+    def _configure_slot(self, slot, index):
+        slot.index = index
+        code = self._codes[index]
+        sender = code & 1
+        if slot.kind == KIND_IMAGE:
+            slot.bg_color = slot.hover_color = None
+            image = self._load_image(self._texts[index])
+            slot.label.configure(image=image, text="" if image else "[image unavailable]")
+            return
+        bg_color, text_color, hover_color = bubble_colors(sender)
+        slot.bg_color = bg_color
+        slot.hover_color = hover_color
+        slot.label.configure(text=self._texts[index], bg_color=bg_color, text_color=text_color)
+
+    def _place_slot(self, slot, index):
+        y = self._heights.offset(index) + BUBBLE_GAP // 2
+        if self._codes[index] & 1 == SENDER_USER:
+            self.canvas.coords(slot.window_id, self._width - SIDE_MARGIN, y)
+            self.canvas.itemconfigure(slot.window_id, anchor="ne")
+        else:
+            self.canvas.coords(slot.window_id, SIDE_MARGIN, y)
+            self.canvas.itemconfigure(slot.window_id, anchor="nw")
+
+    def _load_image(self, image_path, max_size=(400, 300)):
+        image = self._images.get(image_path)
+        if image is not None:
+            self._images.move_to_end(image_path)
+            return image
+        try:
+            from PIL import Image, ImageTk
+            pil_image = Image.open(image_path)
+            pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            image = ImageTk.PhotoImage(pil_image)
+        except Exception as e:
+            log.error("Error displaying image: %s", e)
+            return None
+        self._images[image_path] = image
+        while len(self._images) > self.max_cached_images:
+            self._images.popitem(last=False)
+        return image
@@ -0,0 +1,286 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import viki_log
+
+log = viki_log.get_logger("commands")
+
+# --- Custom Command Store ---
+# One SQLite database shared by the UI and viki.perform_task. WAL mode lets the
+# dispatcher read while the UI writes; every edit is a single-row statement, so
+# nothing is ever rewritten in full. Files are only written on export (viki_bulk).
+#
+# Voice commands are unique by their normalized form (lower case, single spaces),
+# which is what queries are matched against through an index.
+
+COMMANDS_DB_FILE = "custom_commands.db"
+LEGACY_JSON_FILE = "custom_commands.json" # Migrated into the database on first open
+WEB_PREFIX = "web://"
+MAX_VOICE_WORDS = 12 # Longest voice command matched inside a longer query
+_MAX_SQL_PARAMS = 500
+
+Command = namedtuple("Command", ["id", "name", "voice", "target"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    voice_norm TEXT NOT NULL,
+    target TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS commands_voice_norm ON commands (voice_norm);
+"""
+
+
+def normalize(voice):
+    """The form voice commands are stored and matched by: lower case, single spaces."""
+    return " ".join(voice.lower().split())
+
+
+def display_name(target):
+    """Default application name for a target: the URL of a web app, else the file name."""
+    if target.startswith(WEB_PREFIX):
+        return target[len(WEB_PREFIX):]
+    return os.path.basename(target)
+
+
+def default_path():
+    """VIKI_COMMANDS_DB, else custom_commands.db in the working directory (where viki.py always kept its JSON)."""
+    return os.path.abspath(os.environ.get("VIKI_COMMANDS_DB", COMMANDS_DB_FILE))
+
+
+class CommandStore:
+    """
+    Thread-safe access to the command database. Each thread gets its own
+    connection; writers are serialized by SQLite (busy_timeout) rather than by a
+    Python lock, so other processes can share the file too.
+    """
+
+    def __init__(self, path=None, timeout=5.0):
+        self.path = path or default_path()
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # One connection per thread; check_same_thread=False only so close() can run anywhere
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # Durable at checkpoints; a crash can lose only the last commits
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def release_thread(self):
+        """Closes this thread's connection, if it has one. Short-lived worker threads call it when they finish."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            try:
+                self._connections.remove(conn)
+            except ValueError: # close() already took it
+                return
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    # --- Reads ---
+
+    def all(self):
+        """Every command, in the order they were added."""
+        rows = self._connect().execute("SELECT id, name, voice, target FROM commands ORDER BY id").fetchall()
+        return [Command(*row) for row in rows]
+
+    def as_dict(self):
+        """{voice: target}, the shape custom_commands.json always had."""
+        return {command.voice: command.target for command in self.all()}
+
+    def iter_batches(self, size=500):
+        """Every command in id order, `size` at a time (each batch is a short query, so writers are never held up)."""
+        conn = self._connect()
+        last_id = 0
+        while True:
+            rows = conn.execute("SELECT id, name, voice, target FROM commands WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_id, size)).fetchall()
+            if not rows:
+                return
+            yield [Command(*row) for row in rows]
+            last_id = rows[-1][0]
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM commands").fetchone()[0]
+
+    def get(self, command_id):
+        row = self._connect().execute("SELECT id, name, voice, target FROM commands WHERE id = ?", (command_id,)).fetchone()
+        return Command(*row) if row else None
+
+    def find(self, voice):
+        row = self._connect().execute("SELECT id, name, voice, target FROM commands WHERE voice_norm = ?",
+                                      (normalize(voice),)).fetchone()
+        return Command(*row) if row else None
+
+    def match(self, query):
+        """
+        The command whose voice phrase is the whole query or appears in it as whole
+        words (the oldest one if several do). Every word n-gram of the query is
+        looked up through the index, so the cost does not grow with the store.
+        """
+        words = query.lower().split()
+        candidates = {" ".join(words)}
+        for size in range(1, min(MAX_VOICE_WORDS, len(words)) + 1):
+            for start in range(len(words) - size + 1):
+                candidates.add(" ".join(words[start:start + size]))
+        candidates = list(candidates)
+        conn = self._connect()
+        best = None
+        for offset in range(0, len(candidates), _MAX_SQL_PARAMS):
+            chunk = candidates[offset:offset + _MAX_SQL_PARAMS]
+            row = conn.execute(f"SELECT id, name, voice, target FROM commands WHERE voice_norm IN ({','.join('?' * len(chunk))}) "
+                               "ORDER BY id LIMIT 1", chunk).fetchone()
+            if row and (best is None or row[0] < best[0]):
+                best = row
+        return Command(*best) if best else None
+
+    # --- Writes (each one its own transaction) ---
+
+    def upsert(self, voice, target, name=None):
+        """Adds a command, or replaces the one with the same (normalized) voice phrase. Returns the Command."""
+        voice = voice.strip()
+        name = name or display_name(target)
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT INTO commands (name, voice, voice_norm, target, updated) VALUES (?, ?, ?, ?, ?) "
+                         "ON CONFLICT (voice_norm) DO UPDATE SET name = excluded.name, voice = excluded.voice, "
+                         "target = excluded.target, updated = excluded.updated",
+                         (name, voice, normalize(voice), target, time.time()))
+        return self.find(voice)
+
+    def update(self, command_id, voice, target, name=None):
+        """
+        Changes a command in place. Raises sqlite3.IntegrityError if the new voice
+        phrase belongs to another command. Returns the Command (None if it was deleted).
+        """
+        voice = voice.strip()
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE commands SET name = ?, voice = ?, voice_norm = ?, target = ?, updated = ? WHERE id = ?",
+                         (name or display_name(target), voice, normalize(voice), target, time.time(), command_id))
+        return self.get(command_id)
+
+    def delete(self, command_id):
+        """Returns True if the command existed."""
+        conn = self._connect()
+        with conn:
+            return conn.execute("DELETE FROM commands WHERE id = ?", (command_id,)).rowcount > 0
+
+    def upsert_many(self, commands):
+        """Adds or replaces (voice, target, name) tuples in one transaction. Returns how many were written."""
+        rows = [(name or display_name(target), voice.strip(), normalize(voice), target, time.time())
+                for voice, target, name in commands]
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT INTO commands (name, voice, voice_norm, target, updated) VALUES (?, ?, ?, ?, ?) "
+                             "ON CONFLICT (voice_norm) DO UPDATE SET name = excluded.name, voice = excluded.voice, "
+                             "target = excluded.target, updated = excluded.updated", rows)
+        return len(rows)
+
+    def replace_all(self, commands):
+        """Replaces the whole table with {voice: target} in one transaction."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM commands")
+            conn.executemany("INSERT INTO commands (name, voice, voice_norm, target, updated) VALUES (?, ?, ?, ?, ?) "
+                             "ON CONFLICT (voice_norm) DO UPDATE SET target = excluded.target",
+                             [(display_name(target), voice.strip(), normalize(voice), target, time.time())
+                              for voice, target in commands.items()])
+
+    # --- Migration ---
+
+    def import_legacy_json(self, paths):
+        """
+        Imports the first existing custom_commands.json into an empty store.
+        Returns the number of commands imported (0 if the store already had some).
+        """
+        if self.count():
+            return 0
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    commands = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning("Could not migrate %s: %s", path, e)
+                continue
+            if not isinstance(commands, dict):
+                continue
+            count = self.upsert_many((voice, target, None) for voice, target in commands.items()
+                                     if isinstance(voice, str) and isinstance(target, str))
+            log.info("Migrated custom commands into the database", extra={"source": path, "count": count, "database": self.path})
+            return count
+        return 0
+
+
+def legacy_json_paths():
+    """Where custom_commands.json used to be read from: the working directory, then the PyInstaller bundle."""
+    paths = [os.path.abspath(LEGACY_JSON_FILE)]
+    if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
+        paths.append(os.path.join(sys._MEIPASS, LEGACY_JSON_FILE))
+    return paths
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The shared store, opened (and migrated from JSON) on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = CommandStore()
+                store.import_legacy_json(legacy_json_paths())
+                _store = store
+    return _store
+
+
+def set_store(store):
+    """Replaces the shared store (e.g. with one on a temporary database). Returns the previous one."""
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    return previous
+
+
+def release_thread():
+    """Closes the calling thread's connection to the shared store, if it has one (see CommandStore.release_thread)."""
+    store = _store
+    if store is not None:
+        store.release_thread()
@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import viki_log
+
+log = viki_log.get_logger("detect")
+
+# --- Face Detection (ResNet-10 SSD, 300x300) ---
+# deploy.prototxt ships with the repo; the matching weights are the standard
+# OpenCV face detector weights and have to be placed next to it.
+
+PROTOTXT_FILE = "deploy.prototxt"
+WEIGHTS_FILE = "res10_300x300_ssd_iter_140000.caffemodel"
+INPUT_SIZE = (300, 300)
+MEAN_BGR = (104.0, 177.0, 123.0)
+
+BOX_COLOR_RGB = (0, 200, 0)
+
+
+class FaceDetector:
+    """
+    Loads the SSD face model once and runs it on the CPU.
+    cv2.dnn.Net objects are not thread-safe, so each worker thread gets its own copy.
+    """
+
+    def __init__(self, prototxt_path, weights_path, confidence=0.5):
+        self.prototxt_path = prototxt_path
+        self.weights_path = weights_path
+        self.confidence = confidence
+        self._local = threading.local()
+        # Load once up front so a missing/broken model is reported immediately
+        self._net()
+
+    @staticmethod
+    def missing_files(prototxt_path, weights_path):
+        """Returns the model files that do not exist."""
+        return [path for path in (prototxt_path, weights_path) if not os.path.isfile(path)]
+
+    def _net(self):
+        net = getattr(self._local, "net", None)
+        if net is None:
+            import cv2
+            if not hasattr(cv2.dnn, "readNetFromCaffe"):
+                raise RuntimeError("this OpenCV build cannot load Caffe models (use opencv-python 4.x)")
+            net = cv2.dnn.readNetFromCaffe(self.prototxt_path, self.weights_path)
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            self._local.net = net
+        return net
+
+    def detect(self, frame_bgr):
+        """Returns a list of (x1, y1, x2, y2, confidence) boxes in frame pixel coordinates."""
+        import cv2
+
+        height, width = frame_bgr.shape[:2]
+        blob = cv2.dnn.blobFromImage(frame_bgr, 1.0, INPUT_SIZE, MEAN_BGR, swapRB=False, crop=False)
+        net = self._net()
+        net.setInput(blob)
+        detections = net.forward() # Shape (1, 1, N, 7): [_, _, confidence, x1, y1, x2, y2]
+        boxes = []
+        for det in detections[0, 0]:
+            confidence = float(det[2])
+            if confidence < self.confidence:
+                continue
+            x1 = int(max(0.0, det[3]) * width)
+            y1 = int(max(0.0, det[4]) * height)
+            x2 = int(min(1.0, det[5]) * width)
+            y2 = int(min(1.0, det[6]) * height)
+            if x2 > x1 and y2 > y1:
+                boxes.append((x1, y1, x2, y2, confidence))
+        return boxes
+
+
+def _iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if not inter:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union
+
+
+class BoxTracker:
+    """
+    Cheap constant-velocity tracker. Between two detections, each box moves by the
+    per-frame velocity observed between its last two matched detections.
+    """
+
+    def __init__(self, max_age_frames=30):
+        self.max_age_frames = max_age_frames
+        self._tracks = [] # dicts: box, velocity, frame
+
+    def update(self, boxes, frame_index):
+        """Feeds a new set of detections made on `frame_index`."""
+        tracks = []
+        unmatched = list(self._tracks)
+        for box in boxes:
+            best = max(unmatched, key=lambda t: _iou(t["box"], box), default=None)
+            velocity = (0.0, 0.0, 0.0, 0.0)
+            if best is not None and _iou(best["box"], box) > 0.3:
+                unmatched.remove(best)
+                frames = max(1, frame_index - best["frame"])
+                velocity = tuple((box[i] - best["box"][i]) / frames for i in range(4))
+            tracks.append({"box": box, "velocity": velocity, "frame": frame_index})
+        self._tracks = tracks
+
+    def predict(self, frame_index):
+        """Returns the interpolated boxes for `frame_index`."""
+        boxes = []
+        for track in self._tracks:
+            age = frame_index - track["frame"]
+            if age > self.max_age_frames:
+                continue
+            box = track["box"]
+            moved = tuple(int(box[i] + track["velocity"][i] * age) for i in range(4))
+            boxes.append(moved + (box[4],))
+        return boxes
+
+    def clear(self):
+        self._tracks = []
+
+
+class DetectionPipeline:
+    """
+    Runs the detector on a worker pool every `every_n` frames and tracks boxes in
+    between. At most `max_in_flight` detections run at once; if the workers are
+    busy the frame is simply not sent, so the preview frame rate never waits on inference.
+    """
+
+    def __init__(self, detector, every_n=5, max_workers=1, max_in_flight=1):
+        self.detector = detector
+        self.every_n = every_n
+        self.max_in_flight = max_in_flight
+        self.tracker = BoxTracker(max_age_frames=every_n * 6)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="viki-detect")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._frame_index = 0
+        self._started = time.monotonic()
+        self.inference_count = 0
+        self.inference_total = 0.0
+        self.inference_last = 0.0
+        self.skipped_busy = 0
+
+    def process(self, slot, ring):
+        """
+        Called by the capture loop for every frame. Submits `slot` for detection when
+        due (pinning it in `ring` until the worker is done) and returns the boxes to draw.
+        """
+        with self._lock:
+            self._frame_index += 1
+            frame_index = self._frame_index
+            due = frame_index % self.every_n == 1 or self.every_n == 1
+            if due and self._in_flight >= self.max_in_flight:
+                self.skipped_busy += 1
+                due = False
+            if due:
+                self._in_flight += 1
+        if due:
+            ring.pin(slot)
+            self._pool.submit(self._run, slot, ring, frame_index)
+        with self._lock:
+            return self.tracker.predict(frame_index)
+
+    def _run(self, slot, ring, frame_index):
+        try:
+            started = time.perf_counter()
+            boxes = self.detector.detect(slot.bgr)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.tracker.update(boxes, frame_index)
+                self.inference_count += 1
+                self.inference_total += elapsed
+                self.inference_last = elapsed
+        except Exception as e:
+            log.error("Face detection failed: %s", e)
+        finally:
+            ring.unpin(slot)
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started, 1e-6)
+            avg = self.inference_total / self.inference_count if self.inference_count else 0.0
+            return {
+                "frames": self._frame_index,
+                "inferences": self.inference_count,
+                "inference_avg_ms": round(avg * 1000, 2),
+                "inference_last_ms": round(self.inference_last * 1000, 2),
+                "detection_rate_hz": round(self.inference_count / elapsed, 2),
+                "skipped_busy": self.skipped_busy,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+def draw_boxes(frame, boxes, color=BOX_COLOR_RGB):
+    """Draws face boxes and confidences onto `frame` in place."""
+    import cv2
+
+    for x1, y1, x2, y2, confidence in boxes:
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, f"{confidence * 100:.0f}%", (x1, max(12, y1 - 6)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1, cv2.LINE_AA)
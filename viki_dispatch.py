@@ -0,0 +1,156 @@
+import collections
+import threading
+import time
+
+import viki_log
+
+log = viki_log.get_logger("dispatch")
+
+# --- Event-driven UI Dispatcher ---
+# Worker threads must never touch Tk widgets directly. Instead they post
+# (action, data) items here; the dispatcher wakes the Tk loop with a virtual
+# event and applies the items on the Tk thread.
+
+WAKE_EVENT = "<<VikiDispatch>>"
+
+# Actions that describe a piece of UI state. Only the newest value matters,
+# so posting one of these replaces any value that has not been applied yet.
+# The newest value still takes the place of its post relative to events: it is
+# applied after every event posted before it and before every event posted after.
+COALESCED_ACTIONS = (
+    "update_status",
+    "update_indicator",
+    "update_video_button_text",
+    "update_record_buttons_state",
+    "update_capture_button_state",
+)
+
+# Coalesced actions whose widgets are only ever changed through a setter that
+# calls mark_applied(). For these, posting the value already on screen is a no-op.
+SKIP_UNCHANGED_ACTIONS = (
+    "update_status",
+    "update_indicator",
+)
+
+_MISSING = object()
+
+
+class UIDispatcher:
+    """
+    Thread-safe replacement for the polled UI queue.
+    Keeps the queue.Queue style put((action, data)) interface so callers don't change.
+    """
+
+    def __init__(self, root, handler, max_items_per_frame=20, frame_budget_ms=8, fallback_poll_ms=250):
+        self.root = root
+        self.handler = handler
+        self.max_items_per_frame = max_items_per_frame
+        self.frame_budget = frame_budget_ms / 1000.0
+        self.fallback_poll_ms = fallback_poll_ms
+        self._events = collections.deque() # (seq, action, data)
+        self._states = {} # action -> (seq, newest value not applied yet)
+        self._seq = 0 # Post order, shared by events and states
+        self._applied = {} # action -> last value applied to the widgets
+        self._lock = threading.Lock()
+        self._wake_pending = False
+        self._closed = False
+        self.stats = {"posted": 0, "coalesced": 0, "skipped_unchanged": 0, "applied": 0, "frames": 0}
+
+        self.root.bind(WAKE_EVENT, lambda e: self._drain())
+        # Safety net in case a wake-up event could not be delivered (e.g. before mainloop starts)
+        self.root.after(self.fallback_poll_ms, self._fallback_poll)
+
+    def put(self, item):
+        """Posts an (action, data) item. Can be called from any thread."""
+        action, data = item
+        with self._lock:
+            if self._closed:
+                return
+            self.stats["posted"] += 1
+            self._seq += 1
+            if action in COALESCED_ACTIONS:
+                if action in self._states:
+                    self.stats["coalesced"] += 1
+                elif action in SKIP_UNCHANGED_ACTIONS and self._applied.get(action, _MISSING) == data:
+                    # Nothing changed since the last applied value, no need to redraw
+                    self.stats["skipped_unchanged"] += 1
+                    return
+                self._states[action] = (self._seq, data)
+            else:
+                self._events.append((self._seq, action, data))
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        self._wake()
+
+    def mark_applied(self, action, data):
+        """Records a value that was applied to the widgets directly on the Tk thread."""
+        with self._lock:
+            self._applied[action] = data
+
+    def pending(self):
+        """Returns the number of items waiting to be applied."""
+        with self._lock:
+            return len(self._events) + len(self._states)
+
+    def close(self):
+        """Stops accepting new items. Items already posted are discarded."""
+        with self._lock:
+            self._closed = True
+            self._events.clear()
+            self._states.clear()
+
+    def _wake(self):
+        try:
+            self.root.event_generate(WAKE_EVENT, when="tail")
+        except Exception:
+            # Tk may refuse cross-thread events (non-threaded Tcl or mainloop not running yet).
+            # The fallback poll will pick the items up.
+            pass
+
+    def _fallback_poll(self):
+        if self._closed:
+            return
+        if self.pending():
+            self._drain()
+        self.root.after(self.fallback_poll_ms, self._fallback_poll)
+
+    def _drain(self):
+        """Applies pending items on the Tk thread, capped per frame."""
+        deadline = time.perf_counter() + self.frame_budget
+        self.stats["frames"] += 1
+
+        handled = 0
+        while True:
+            with self._lock:
+                # States posted before the next event go first (all of them if no event is left);
+                # they are cheap, so only events count against the frame budget
+                limit = self._events[0][0] if self._events else None
+                states = sorted((seq, action, data) for action, (seq, data) in self._states.items()
+                                if limit is None or seq < limit)
+                for _, action, _ in states:
+                    del self._states[action]
+                event = None
+                if limit is not None and handled < self.max_items_per_frame and time.perf_counter() < deadline:
+                    event = self._events.popleft()
+            for _, action, data in states:
+                self._apply(action, data)
+            if event is None:
+                break
+            self._apply(event[1], event[2])
+            handled += 1
+
+        with self._lock:
+            if self._events or self._states:
+                # More work left; yield to Tk so it can redraw and handle input first
+                self.root.after(1, self._drain)
+            else:
+                self._wake_pending = False
+
+    def _apply(self, action, data):
+        try:
+            self.handler(action, data)
+            self.stats["applied"] += 1
+        except Exception:
+            log.exception("Error applying UI action %r", action)
+
@@ -0,0 +1,171 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+# --- Structured Logging ---
+# Callers only put records on a queue (never blocking, never touching stdout or disk);
+# a QueueListener thread formats them and writes to the console, a rotating JSON-lines
+# file and an in-memory ring of recent events for diagnostics.
+#
+# Structured fields are passed with extra=..., e.g.
+#     log.info("Query dispatched", extra={"query": query, "lane": "command"})
+
+LOGGER_NAME = "viki"
+DEFAULT_LOG_DIR = "logs"
+QUEUE_SIZE = 10000
+RING_SIZE = 1000
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_queue_handler = None
+_ring_handler = None
+_lock = threading.Lock()
+
+
+def get_logger(name=None):
+    """Returns the "viki" logger or one of its children ("viki.ui", "viki.video", ...)."""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def record_fields(record):
+    """The structured fields a record was logged with."""
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS and not key.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, thread, message and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Readable one-line format; extra fields are appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", datefmt="%H:%M:%S")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the most recent records in memory for diagnostics."""
+
+    def __init__(self, capacity=RING_SIZE):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record) # deque.append is atomic; no extra locking needed
+
+
+def setup_logging(level=None, log_dir=DEFAULT_LOG_DIR, max_bytes=2 * 1024 * 1024, backup_count=5, console=True):
+    """
+    Routes all "viki" loggers through the background writer. Safe to call more than once.
+    The level defaults to VIKI_LOG_LEVEL or INFO. Returns the "viki" logger.
+    """
+    global _listener, _queue_handler, _ring_handler
+    logger = get_logger()
+    level = level or os.environ.get("VIKI_LOG_LEVEL", "INFO")
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    with _lock:
+        if _listener is not None:
+            return logger
+        handlers = []
+        _ring_handler = RingBufferHandler()
+        handlers.append(_ring_handler)
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(ConsoleFormatter())
+            handlers.append(console_handler)
+        if log_dir:
+            try:
+                os.makedirs(log_dir, exist_ok=True)
+                file_handler = logging.handlers.RotatingFileHandler(os.path.join(log_dir, "viki.log"), maxBytes=max_bytes,
+                                                                    backupCount=backup_count, encoding="utf-8")
+                file_handler.setFormatter(JsonFormatter())
+                handlers.append(file_handler)
+            except OSError as e:
+                logger.warning("File logging disabled: %s", e)
+        _queue_handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        logger.addHandler(_queue_handler)
+        logger.propagate = False # Don't also print through the root logger
+    return logger
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the writer thread."""
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is None:
+            return
+        get_logger().removeHandler(_queue_handler)
+        _listener.stop() # Processes everything still queued
+        _listener = None
+        _queue_handler = None
+
+
+def recent_events(limit=None, min_level=logging.DEBUG):
+    """Most recent log events (oldest first) as dicts, from the in-memory ring."""
+    if _ring_handler is None:
+        return []
+    events = []
+    for record in list(_ring_handler.records):
+        if record.levelno < min_level:
+            continue
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        events.append(entry)
+    return events[-limit:] if limit else events
+
+
+def stats():
+    return {
+        "running": _listener is not None,
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "ring": len(_ring_handler.records) if _ring_handler else 0,
+    }
@@ -0,0 +1,147 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Background Photo Writer ---
+# Photo capture pins a FrameRing slot and hands it to a writer pool; encoding and
+# disk I/O never run on the Tk thread, and the frame is never copied.
+
+PHOTO_FORMATS = ("png", "jpg", "webp")
+
+
+def encode_params(fmt, png_level=3, quality=90):
+    """Returns the (extension, cv2.imencode params) for a photo format."""
+    import cv2
+
+    if fmt == "png":
+        return ".png", [cv2.IMWRITE_PNG_COMPRESSION, png_level]
+    if fmt == "jpg":
+        return ".jpg", [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if fmt == "webp":
+        return ".webp", [cv2.IMWRITE_WEBP_QUALITY, quality]
+    raise ValueError(f"Unsupported photo format: {fmt}")
+
+
+class PhotoWriter:
+    """
+    Encodes and saves frames on a small thread pool.
+    Filenames carry a millisecond timestamp plus a sequence number and are created
+    exclusively, so shots taken in the same second (or by two writers) never collide.
+    """
+
+    def __init__(self, output_dir="photos", fmt="png", png_level=3, quality=90, max_workers=2, prefix="viki_photo"):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.png_level = png_level
+        self.quality = quality
+        self.prefix = prefix
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="viki-photo")
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.saved = 0
+        self.failed = 0
+        self.bytes_written = 0
+
+    def submit(self, slot, ring, on_done=None, prefix=None):
+        """
+        Saves a pinned ring slot in the background and unpins it when done.
+        on_done(path, error) is called on the writer thread. `prefix` overrides the
+        filename prefix for this photo (e.g. to tag the camera it came from).
+        """
+        ext, params = encode_params(self.fmt, self.png_level, self.quality)
+        captured_at = time.time()
+        with self._lock:
+            self._in_flight += 1
+        return self._pool.submit(self._write, slot, ring, ext, params, captured_at, on_done, prefix or self.prefix)
+
+    def _write(self, slot, ring, ext, params, captured_at, on_done, prefix):
+        import cv2
+
+        path = None
+        error = None
+        try:
+            try:
+                ok, data = cv2.imencode(ext, slot.bgr, params)
+            finally:
+                ring.unpin(slot) # Encoded (or failed); the capture loop may reuse the slot now
+                with self._lock:
+                    self._in_flight -= 1
+            if not ok:
+                raise RuntimeError(f"Could not encode {ext} image.")
+            path = self._write_unique(data, ext, captured_at, prefix)
+            with self._lock:
+                self.saved += 1
+                self.bytes_written += data.nbytes
+        except Exception as e:
+            error = e
+            with self._lock:
+                self.failed += 1
+        if on_done:
+            on_done(path, error)
+        return path
+
+    def _write_unique(self, data, ext, captured_at, prefix):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(captured_at))
+        millis = int((captured_at % 1) * 1000)
+        while True:
+            name = f"{prefix}_{stamp}_{millis:03d}_{next(self._sequence):04d}{ext}"
+            path = os.path.join(self.output_dir, name)
+            try:
+                with open(path, "xb") as f: # Exclusive create; retry with the next number if taken
+                    f.write(data)
+                return path
+            except FileExistsError:
+                continue
+
+    def in_flight(self):
+        """Number of frames still pinned by the writer."""
+        with self._lock:
+            return self._in_flight
+
+    def burst(self, ring, count, fps, on_done=None, on_finished=None, stop_event=None, max_in_flight=3):
+        """
+        Takes `count` photos at `fps` on a background thread. Each shot pins the newest
+        ring slot (waiting for a new frame if the camera is slower than `fps`). At most
+        `max_in_flight` frames stay pinned so the capture loop always has free slots;
+        if encoding falls behind, the burst slows down instead.
+        on_finished(taken) is called once all shots were handed to the writer.
+        """
+        def run():
+            interval = 1.0 / fps
+            deadline = time.monotonic()
+            last_sequence = None
+            taken = 0
+            while taken < count and not (stop_event and stop_event.is_set()):
+                if self.in_flight() >= max_in_flight:
+                    time.sleep(0.005)
+                    continue
+                slot = ring.snapshot()
+                if slot is None or slot.sequence == last_sequence:
+                    if slot is not None:
+                        ring.unpin(slot)
+                    time.sleep(0.005) # Wait for the next camera frame
+                    continue
+                last_sequence = slot.sequence
+                self.submit(slot, ring, on_done)
+                taken += 1
+                deadline += interval
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if on_finished:
+                on_finished(taken)
+
+        thread = threading.Thread(target=run, daemon=True, name="viki-burst")
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            return {"saved": self.saved, "failed": self.failed, "bytes_written": self.bytes_written}
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
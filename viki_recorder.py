@@ -0,0 +1,521 @@
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+# --- Background Video Encoder ---
+# Capture copies each frame into a ring of shared-memory slots and hands the
+# slot index to an encoder process, so cv2.VideoWriter runs on another core and
+# a slow disk or codec can never stall cap.read().
+
+BACKPRESSURE_DROP = "drop" # Drop the new frame when every slot is busy
+BACKPRESSURE_BLOCK = "block" # Wait (up to block_timeout) for a free slot
+
+
+def _encoder_main(shm_name, num_slots, frame_shape, filename, fourcc, fps, work_q, free_q, status_q):
+    """
+    Encoder loop. Runs in the child process (or a thread in thread mode).
+    Frames are written at a constant `fps`: capture timestamps decide how many
+    output frames each input frame covers, so gaps are filled by repeating the
+    previous frame and bursts are thinned out. Playback length matches real time.
+    """
+    import cv2
+    import numpy as np
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray((num_slots,) + tuple(frame_shape), dtype=np.uint8, buffer=shm.buf)
+    height, width = frame_shape[0], frame_shape[1]
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    if not writer.isOpened():
+        del slots
+        shm.close()
+        status_q.put(("error", "Failed to open video writer. Check codecs or file path permissions."))
+        return
+    status_q.put(("opened", None))
+
+    first_ts = None
+    written = 0
+    received = 0
+    duplicated = 0
+    skipped = 0
+    encode_time = 0.0
+    max_repeat = max(1, int(fps)) # Never pad more than one second for a single stall
+    while True:
+        item = work_q.get()
+        if item is None:
+            break
+        slot, timestamp = item
+        received += 1
+        if first_ts is None:
+            first_ts = timestamp
+        target = int(round((timestamp - first_ts) * fps)) + 1 # Frames that should exist after this one
+        repeats = min(target - written, max_repeat)
+        if repeats <= 0:
+            skipped += 1
+        else:
+            started = time.perf_counter()
+            for _ in range(repeats):
+                writer.write(slots[slot])
+            encode_time += time.perf_counter() - started
+            duplicated += repeats - 1
+            written += repeats
+        free_q.put(slot)
+
+    writer.release()
+    del slots
+    shm.close()
+    status_q.put(("stats", {
+        "frames_received": received,
+        "frames_written": written,
+        "frames_duplicated": duplicated,
+        "frames_skipped": skipped,
+        "encode_ms_per_frame": round(encode_time * 1000 / max(written, 1), 3),
+    }))
+
+
+class EncoderWorker:
+    """
+    Records BGR frames to a video file on a background process (or thread).
+    Drop-in for the cv2.VideoWriter calls used by the UI: write(frame) and release().
+    """
+
+    def __init__(self, filename, fourcc, fps, frame_size, num_slots=8,
+                 backpressure=BACKPRESSURE_DROP, block_timeout=0.05, use_process=True):
+        self.filename = filename
+        self.fourcc = fourcc
+        self.fps = float(fps)
+        self.frame_size = frame_size # (width, height)
+        self.num_slots = num_slots
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+        self.use_process = use_process
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.error = None
+        self.result = None
+        self._worker = None
+        self._shm = None
+        self._slots = None
+        self._opened = False
+        self._released = False
+        self._lock = threading.Lock() # write() and release() run on different threads
+
+    def start(self, timeout=10.0):
+        """Starts the encoder and waits until it has opened the output file. Returns True on success."""
+        import numpy as np
+        width, height = self.frame_size
+        frame_shape = (height, width, 3)
+        self._shm = shared_memory.SharedMemory(create=True, size=self.num_slots * height * width * 3)
+        self._slots = np.ndarray((self.num_slots,) + frame_shape, dtype=np.uint8, buffer=self._shm.buf)
+
+        if self.use_process:
+            ctx = multiprocessing.get_context("spawn") # Same behavior on Windows and Linux
+            self._work_q, self._free_q, self._status_q = ctx.Queue(), ctx.Queue(), ctx.Queue()
+            worker_cls = ctx.Process
+        else:
+            self._work_q, self._free_q, self._status_q = queue.Queue(), queue.Queue(), queue.Queue()
+            worker_cls = threading.Thread
+        for slot in range(self.num_slots):
+            self._free_q.put(slot)
+
+        self._worker = worker_cls(target=_encoder_main, daemon=True, name="viki-encoder",
+                                  args=(self._shm.name, self.num_slots, frame_shape, self.filename,
+                                        self.fourcc, self.fps, self._work_q, self._free_q, self._status_q))
+        self._worker.start()
+        try:
+            kind, payload = self._status_q.get(timeout=timeout)
+        except queue.Empty:
+            kind, payload = "error", "Video encoder did not start in time."
+        if kind != "opened":
+            self.error = payload
+            self._cleanup()
+            return False
+        self._opened = True
+        self._started_at = time.monotonic()
+        return True
+
+    def isOpened(self):
+        return self._opened and not self._released
+
+    def write(self, frame, timestamp=None, block_timeout=None):
+        """
+        Queues a frame for encoding. Never blocks longer than block_timeout.
+        Passing `block_timeout` waits up to that long for a free slot whatever the backpressure mode.
+        Returns False if the frame was dropped because the encoder is behind,
+        or if the encoder is not (or no longer) open.
+        """
+        import numpy as np
+
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock: # Checked under the lock, so release() can't free the slots mid-copy
+            if not self.isOpened():
+                return False
+            try:
+                slot = self._free_q.get_nowait()
+            except queue.Empty:
+                slot = None
+                if block_timeout is None and self.backpressure == BACKPRESSURE_BLOCK:
+                    block_timeout = self.block_timeout
+                if block_timeout:
+                    try:
+                        slot = self._free_q.get(timeout=block_timeout)
+                    except queue.Empty:
+                        pass
+                if slot is None:
+                    self.frames_dropped += 1
+                    return False
+            np.copyto(self._slots[slot], frame)
+            self._work_q.put((slot, timestamp))
+            self.frames_submitted += 1
+            return True
+
+    def release(self, timeout=30.0):
+        """Flushes queued frames, closes the file and returns the encoder statistics."""
+        with self._lock: # Waits for a write() in progress; none can follow the end marker
+            if self._released:
+                return self.result
+            self._released = True
+            if self._opened:
+                self._work_q.put(None)
+        if self._opened:
+            try:
+                kind, payload = self._status_q.get(timeout=timeout)
+                if kind == "stats":
+                    self.result = payload
+            except queue.Empty:
+                self.error = "Video encoder did not finish in time."
+        if self.result is not None:
+            self.result["frames_dropped"] = self.frames_dropped
+            self.result["frames_submitted"] = self.frames_submitted
+            self.result["duration_s"] = round(time.monotonic() - self._started_at, 3)
+        self._cleanup()
+        return self.result
+
+    def _cleanup(self):
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+            self._worker = None
+        self._slots = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+# --- Motion-gated Recording ---
+
+MOTION_SENSITIVITIES = {"low": 0.25, "medium": 0.5, "high": 0.8} # Choices offered in the UI -> MotionGate sensitivity
+MOTION_ROLL_CHOICES = ("0.5 / 2", "1 / 3", "2 / 5", "5 / 10") # "pre-roll / post-roll" seconds
+MAX_PRE_ROLL_S = 5.0 # The pre-roll is kept as raw frames, so it is bounded (about 140 MB at 640x480, 30 fps)
+MAX_POST_ROLL_S = 600.0
+PRE_ROLL_BLOCK_S = 1.0 # How long each pre-roll frame may wait for an encoder slot when motion starts
+
+
+def parse_roll(text):
+    """Parses "pre-roll / post-roll" seconds (e.g. "1 / 3") into two floats. Raises ValueError."""
+    pre, sep, post = text.partition("/")
+    if not sep:
+        raise ValueError(f"expected \"pre-roll / post-roll\", got {text!r}")
+    pre_roll_s, post_roll_s = float(pre), float(post)
+    if not 0.0 <= pre_roll_s <= MAX_PRE_ROLL_S or not 0.0 <= post_roll_s <= MAX_POST_ROLL_S:
+        raise ValueError(f"pre-roll must be 0-{MAX_PRE_ROLL_S:g} s and post-roll 0-{MAX_POST_ROLL_S:g} s")
+    return pre_roll_s, post_roll_s
+
+
+class MotionGate:
+    """
+    Cheap motion detector: frame differencing on a downscaled, blurred grayscale copy
+    against a slowly adapting background. All buffers are preallocated.
+    `sensitivity` is 0..1; higher values react to smaller changes.
+    """
+
+    def __init__(self, sensitivity=0.5, size=(160, 120), pixel_threshold=25, adapt_rate=0.05):
+        import cv2
+        import numpy as np
+        self._cv2 = cv2
+        self.sensitivity = sensitivity
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.adapt_rate = adapt_rate
+        width, height = size
+        self._small = np.empty((height, width, 3), dtype=np.uint8)
+        self._gray = np.empty((height, width), dtype=np.uint8)
+        self._background = None
+        self._background_u8 = np.empty((height, width), dtype=np.uint8)
+        self._diff = np.empty((height, width), dtype=np.uint8)
+        self.last_score = 0.0
+
+    @property
+    def min_changed_fraction(self):
+        # sensitivity 0 -> 5% of the picture must change, 1 -> 0.1%
+        return 0.001 + 0.049 * (1.0 - max(0.0, min(1.0, self.sensitivity)))
+
+    def update(self, frame_bgr):
+        """Feeds a frame and returns True if it shows motion."""
+        import numpy as np
+        cv2 = self._cv2
+        cv2.resize(frame_bgr, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        cv2.GaussianBlur(self._gray, (5, 5), 0, dst=self._gray)
+        if self._background is None:
+            self._background = self._gray.astype(np.float32)
+            return False
+        cv2.convertScaleAbs(self._background, dst=self._background_u8)
+        cv2.absdiff(self._gray, self._background_u8, dst=self._diff)
+        cv2.accumulateWeighted(self._gray, self._background, self.adapt_rate)
+        changed = cv2.countNonZero(cv2.threshold(self._diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        self.last_score = changed / float(self._diff.size)
+        return self.last_score >= self.min_changed_fraction
+
+
+class MotionRecorder:
+    """
+    Wraps an EncoderWorker and only feeds it during activity windows.
+    Keeps `pre_roll_s` of frames before motion starts and keeps recording for
+    `post_roll_s` after it stops. Segments are written back to back in the video;
+    a sidecar JSON index maps each segment's video time to wall-clock time.
+    """
+
+    def __init__(self, encoder, sensitivity=0.5, pre_roll_s=1.0, post_roll_s=3.0):
+        import numpy as np
+        self.encoder = encoder
+        self.gate = MotionGate(sensitivity)
+        self.pre_roll_s = pre_roll_s
+        self.post_roll_s = post_roll_s
+        self.index_path = encoder.filename + ".segments.json"
+        width, height = encoder.frame_size
+        pre_roll_frames = max(1, int(round(pre_roll_s * encoder.fps)))
+        self._pre_roll = np.empty((pre_roll_frames, height, width, 3), dtype=np.uint8)
+        self._pre_roll_ts = [0.0] * pre_roll_frames
+        self._pre_roll_count = 0
+        self._pre_roll_next = 0
+        self._active_until = None # Monotonic time the current segment ends (post-roll), None if idle
+        self._segment = None
+        self._gap_total = 0.0 # Idle time cut out of the video so far
+        self._first_ts = None # Timestamp of the first recorded frame (video time 0)
+        self._last_ts = None
+        self.segments = []
+        self.frames_seen = 0
+        self._released = False
+        self._lock = threading.Lock() # write() and release() run on different threads
+
+    @property
+    def filename(self):
+        return self.encoder.filename
+
+    @property
+    def error(self):
+        return self.encoder.error
+
+    def start(self, timeout=10.0):
+        return self.encoder.start(timeout)
+
+    def isOpened(self):
+        return self.encoder.isOpened()
+
+    def write(self, frame, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            if self._released:
+                return False
+            self.frames_seen += 1
+            motion = self.gate.update(frame)
+            block_timeout = None
+
+            if self._active_until is None:
+                if not motion:
+                    self._remember(frame, timestamp)
+                    return True
+                self._start_segment(timestamp)
+                block_timeout = PRE_ROLL_BLOCK_S # Right behind the pre-roll burst, so no slot is free yet
+            if motion:
+                self._active_until = timestamp + self.post_roll_s
+            elif timestamp > self._active_until:
+                self._end_segment()
+                self._remember(frame, timestamp)
+                return True
+            return self._feed(frame, timestamp, block_timeout)
+
+    def release(self, timeout=30.0):
+        with self._lock: # Waits for a write() in progress; later ones are ignored
+            if not self._released:
+                self._released = True
+                if self._segment is not None:
+                    self._end_segment()
+        result = self.encoder.release(timeout) # Outside the lock: flushing can take a while
+        if result is not None:
+            result["segments"] = len(self.segments)
+            result["frames_seen"] = self.frames_seen
+            result["index_path"] = self.index_path
+        return result
+
+    def _remember(self, frame, timestamp):
+        """Keeps the frame in the pre-roll ring (copied into a preallocated buffer)."""
+        import numpy as np
+        np.copyto(self._pre_roll[self._pre_roll_next], frame)
+        self._pre_roll_ts[self._pre_roll_next] = timestamp
+        self._pre_roll_next = (self._pre_roll_next + 1) % len(self._pre_roll)
+        self._pre_roll_count = min(self._pre_roll_count + 1, len(self._pre_roll))
+
+    def _start_segment(self, timestamp):
+        # Pre-roll frames, oldest first, ignoring frames older than pre_roll_s
+        size = len(self._pre_roll)
+        start = (self._pre_roll_next - self._pre_roll_count) % size
+        pending = [(start + i) % size for i in range(self._pre_roll_count)]
+        pending = [index for index in pending if timestamp - self._pre_roll_ts[index] <= self.pre_roll_s]
+        self._pre_roll_count = 0
+        first_ts = self._pre_roll_ts[pending[0]] if pending else timestamp
+
+        # Cut the idle time since the previous segment out of the video timeline
+        if self._last_ts is not None:
+            self._gap_total += max(0.0, first_ts - self._last_ts - 1.0 / self.encoder.fps)
+        self._segment = {
+            "wall_start": time.time() - (timestamp - first_ts),
+            "video_start_s": first_ts - self._gap_total - (self._first_ts if self._first_ts is not None else first_ts),
+            "start_ts": first_ts,
+        }
+        if self._first_ts is None:
+            self._first_ts = first_ts
+        # The pre-roll arrives as one burst, far more than the encoder's free slots, so
+        # these writes wait for slots instead of dropping (a one-off stall of the capture loop)
+        for index in pending:
+            self._feed(self._pre_roll[index], self._pre_roll_ts[index], PRE_ROLL_BLOCK_S)
+
+    def _feed(self, frame, timestamp, block_timeout=None):
+        if self._last_ts is not None and timestamp <= self._last_ts:
+            return True # Already fed (pre-roll overlap)
+        self._last_ts = timestamp
+        if self._segment is not None:
+            self._segment["end_ts"] = timestamp
+        return self.encoder.write(frame, timestamp - self._gap_total, block_timeout)
+
+    def _end_segment(self):
+        segment = self._segment
+        self._segment = None
+        self._active_until = None
+        if segment is None:
+            return
+        end_ts = segment.get("end_ts", segment["start_ts"])
+        duration = end_ts - segment["start_ts"]
+        self.segments.append({
+            "wall_start": round(segment["wall_start"], 3),
+            "wall_end": round(segment["wall_start"] + duration, 3),
+            "video_start_s": round(segment["video_start_s"], 3),
+            "video_end_s": round(segment["video_start_s"] + duration, 3),
+        })
+        self._write_index()
+
+    def _write_index(self):
+        import json
+        import os
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"video": os.path.basename(self.encoder.filename), "fps": self.encoder.fps,
+                       "segments": self.segments}, f, indent=4)
+        os.replace(tmp_path, self.index_path) # Atomic, so a reader never sees a half-written index
+
+
+# --- Instant Replay ---
+
+
+class ReplayBuffer:
+    """
+    Keeps the last `seconds` of video in memory as JPEG-compressed frames
+    (roughly 30-40 KB each at 640x480), bounded by both age and `max_bytes`.
+    Compression runs on a background thread; the capture loop only pins the ring slot.
+    """
+
+    def __init__(self, seconds=60.0, quality=75, max_bytes=64 * 1024 * 1024, max_pending=3):
+        import collections
+        import cv2
+        self._cv2 = cv2
+        self.seconds = seconds
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self._frames = collections.deque() # (timestamp, jpeg ndarray)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=max_pending)
+        self.frames_dropped = 0
+        self.frames_failed = 0 # Frames imencode could not compress
+        self._worker = threading.Thread(target=self._compress_loop, daemon=True, name="viki-replay")
+        self._worker.start()
+
+    def add(self, slot, ring, timestamp):
+        """Queues a ring slot for compression. Drops the frame if the compressor is behind."""
+        ring.pin(slot)
+        try:
+            self._pending.put_nowait((slot, ring, timestamp))
+        except queue.Full:
+            ring.unpin(slot)
+            self.frames_dropped += 1
+
+    def _compress_loop(self):
+        params = [self._cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            slot, ring, timestamp = item
+            try:
+                ok, jpeg = self._cv2.imencode(".jpg", slot.bgr, params)
+            except Exception:
+                ok = False # A bad frame must not end the thread and leave the buffer silently empty
+            finally:
+                ring.unpin(slot)
+            if ok:
+                self._append(timestamp, jpeg)
+            else:
+                self.frames_failed += 1
+
+    def _append(self, timestamp, jpeg):
+        with self._lock:
+            self._frames.append((timestamp, jpeg))
+            self._bytes += jpeg.nbytes
+            while self._frames and (self._bytes > self.max_bytes or timestamp - self._frames[0][0] > self.seconds):
+                _, old = self._frames.popleft()
+                self._bytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            duration = self._frames[-1][0] - self._frames[0][0] if len(self._frames) > 1 else 0.0
+            return {"frames": len(self._frames), "bytes": self._bytes,
+                    "seconds": round(duration, 2), "dropped": self.frames_dropped, "failed": self.frames_failed}
+
+    def save_async(self, filename, fourcc, fps, frame_size, on_done):
+        """
+        Writes the buffered frames to `filename` on a background thread (encoding in an
+        EncoderWorker process) and calls on_done(filename, stats, error) when finished.
+        Returns False if there is nothing to save.
+        """
+        with self._lock:
+            frames = list(self._frames) # Snapshot; live capture keeps appending meanwhile
+        if not frames:
+            return False
+
+        def worker():
+            encoder = EncoderWorker(filename, fourcc, fps, frame_size,
+                                    backpressure=BACKPRESSURE_BLOCK, block_timeout=5.0)
+            if not encoder.start():
+                on_done(filename, None, encoder.error)
+                return
+            for timestamp, jpeg in frames:
+                frame = self._cv2.imdecode(jpeg, self._cv2.IMREAD_COLOR)
+                if frame is not None:
+                    encoder.write(frame, timestamp)
+            stats = encoder.release()
+            on_done(filename, stats, None if stats is not None else encoder.error)
+
+        threading.Thread(target=worker, daemon=True, name="viki-replay-save").start()
+        return True
+
+    def shutdown(self):
+        self._pending.put(None)
@@ -0,0 +1,510 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import viki
+import viki_log
+import viki_session
+
+log = viki_log.get_logger("server")
+
+# --- Local API Server ---
+# Runs Viki headless (no Tk, no microphone) behind a small asyncio HTTP/WebSocket
+# server, so other tools on the machine can use it as a service:
+#
+#     POST /task   {"query": "open notepad"}       -> {"reply": ..., "sentences": [...], "ms": ...}
+#     POST /chat   {"message": "tell me a joke"}   -> same, always answered by the chatbot
+#          add "stream": true to get NDJSON lines instead: one {"type": "speech"} per sentence, then {"type": "done"}
+#     GET  /health                                 -> counters
+#     GET  /ws     WebSocket; send {"type": "task" | "chat", "id": ..., "query"/"message": ...}
+#                  and receive "speech" messages per sentence, then "done" (or "error") with the same id
+#
+# perform_task blocks, so it runs on a bounded thread pool. Requests beyond the
+# pool wait in a bounded queue; when that is full the server answers 503 / a
+# "busy" error at once instead of piling up work. Each connection is a session
+# (a viki_session.Session: its own chat history, language and chat mode) whose
+# turns run in order; a WebSocket connection stops reading new messages
+# while MAX_INFLIGHT_PER_CONNECTION of its requests are unanswered, and every
+# write waits for the socket to drain, so slow clients push back instead of
+# buffering replies in memory.
+#
+# HTTP clients can keep a session across connections by sending back the
+# X-Viki-Session header of a previous response.
+#
+# Every request needs "Authorization: Bearer <token>": VIKI_SERVER_TOKEN, or a
+# random token generated (and printed) at startup when that is unset. Since any
+# web page in the user's browser can reach 127.0.0.1, requests carrying an Origin
+# other than the server's own are refused, and POST bodies must be sent as
+# application/json (which a page can't do cross-site without a CORS preflight,
+# and the server never answers one).
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_QUEUED = 256
+MAX_INFLIGHT_PER_CONNECTION = 8
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT_S = 300.0
+SESSION_IDLE_S = 900.0 # HTTP sessions not used for this long are forgotten
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_TEXT, WS_BINARY, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+# Replies perform_task gives the UI rather than the user
+UI_ACTIONS = {
+    "save_replay": "Instant replay is only available when video mode is running in the Viki app.",
+    "interrupted": "Okay.",
+}
+
+
+class Busy(Exception):
+    """All workers are busy and the queue is full."""
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class VikiServer:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, max_queued=DEFAULT_MAX_QUEUED,
+                 token=None, handlers=None):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_queued = max_queued
+        # "" turns authentication off (tests and benchmarks only)
+        self.token = token if token is not None else os.environ.get("VIKI_SERVER_TOKEN") or secrets.token_urlsafe(24)
+        # kind -> blocking function(text, session) returning the reply
+        self.handlers = handlers or {"task": viki.perform_task, "chat": viki.get_gemini_response}
+        self.sessions = viki_session.SessionStore(idle_timeout=SESSION_IDLE_S, on_evict=self._forget_session)
+        self._turn_locks = {} # Session id -> asyncio.Lock, so a session's turns run one at a time, in order
+        self.stats = {"connections": 0, "open_connections": 0, "requests": 0, "rejected": 0, "errors": 0}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="viki-server")
+        self._slots = None # asyncio.Semaphore, created on the server's loop
+        self._queued = 0
+        self._running = 0
+        self._server = None
+        self._evictor = None
+        self._connections = set() # Handler tasks of open connections
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.workers)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=MAX_HEADER_BYTES, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1] # Resolves port 0
+        self._evictor = asyncio.ensure_future(self._evict_sessions())
+        log.info("Viki server listening on http://%s:%d", self.host, self.port,
+                 extra={"workers": self.workers, "max_queued": self.max_queued, "auth": bool(self.token)})
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._evictor.cancel()
+            connections = list(self._connections)
+            for task in connections:
+                task.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
+            await self._server.wait_closed()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def health(self):
+        return dict(self.stats, sessions=len(self.sessions), running=self._running, queued=self._queued,
+                    workers=self.workers, max_queued=self.max_queued)
+
+    # --- Sessions ---
+
+    def _session(self, session_id=None):
+        session = self.sessions.get_or_create(session_id)
+        if session.id not in self._turn_locks:
+            self._turn_locks[session.id] = asyncio.Lock()
+        return session
+
+    def _forget_session(self, session):
+        self._turn_locks.pop(session.id, None)
+
+    async def _evict_sessions(self):
+        while True:
+            await asyncio.sleep(SESSION_IDLE_S / 4)
+            self.sessions.evict_idle()
+
+    # --- Work ---
+
+    async def run(self, session, kind, text):
+        """
+        Runs one request on the worker pool, after the session's earlier ones.
+        Raises Busy at once if the queue is full.
+        """
+        handler = self.handlers.get(kind)
+        if handler is None:
+            raise HttpError(404, f"unknown request type {kind!r}")
+        if not isinstance(text, str) or not text.strip():
+            raise HttpError(400, "empty query")
+        if self._queued >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise Busy()
+        self.stats["requests"] += 1
+        started = time.perf_counter()
+        self._queued += 1
+        waiting = True
+        self.sessions.touch(session)
+        # A session evicted while its connection is still open gets a fresh lock
+        turn_lock = self._turn_locks.setdefault(session.id, asyncio.Lock())
+        try:
+            async with turn_lock: # Held until the reply is back, so a session's turns never overlap
+                await self._slots.acquire()
+                self._queued -= 1
+                waiting = False
+                self._running += 1
+                try:
+                    self.sessions.touch(session)
+                    reply = await asyncio.get_running_loop().run_in_executor(self._pool, handler, text, session)
+                except Exception:
+                    self.stats["errors"] += 1
+                    log.exception("%s request failed", kind, extra={"session": session.id})
+                    raise HttpError(500, "internal error")
+                finally:
+                    self._running -= 1
+                    self._slots.release()
+        finally:
+            if waiting:
+                self._queued -= 1
+        reply = "" if reply is None else str(reply)
+        result = {"reply": UI_ACTIONS.get(reply, reply), "ms": round((time.perf_counter() - started) * 1000, 1)}
+        if reply in UI_ACTIONS:
+            result["action"] = reply
+        result["sentences"] = viki.split_sentences(viki.clean_markdown_for_tts(result["reply"]))
+        return result
+
+    # --- Connections ---
+
+    async def _handle_connection(self, reader, writer):
+        self.stats["connections"] += 1
+        self.stats["open_connections"] += 1
+        task = asyncio.current_task()
+        self._connections.add(task)
+        peer = writer.get_extra_info("peername")
+        try:
+            await self._serve_http(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError):
+            pass # Client went away or stalled
+        except asyncio.CancelledError:
+            pass # Server shutting down
+        except Exception:
+            log.exception("Connection from %s failed", peer)
+        finally:
+            self._connections.discard(task)
+            self.stats["open_connections"] -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _read_request(self, reader):
+        """Returns (method, path, headers, body), or None when the client closed the connection."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT_S)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "headers too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "bad request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        headers[":version"] = version
+        body = b""
+        length = headers.get("content-length")
+        if length:
+            if not length.isdigit():
+                raise HttpError(400, "bad Content-Length")
+            if int(length) > MAX_BODY_BYTES:
+                raise HttpError(413, "body too large")
+            body = await asyncio.wait_for(reader.readexactly(int(length)), IDLE_TIMEOUT_S)
+        return method.upper(), urlsplit(target).path, headers, body
+
+    async def _serve_http(self, reader, writer):
+        session = None
+        while True:
+            try:
+                request = await self._read_request(reader)
+            except HttpError as e:
+                await self._respond(writer, e.status, {"error": str(e)}, close=True)
+                return
+            if request is None:
+                return
+            method, path, headers, body = request
+            keep_alive = headers.get("connection", "").lower() != "close" and headers[":version"] == "HTTP/1.1"
+            # A session per connection, unless the client resumes one it was given earlier
+            session_id = headers.get("x-viki-session")
+            if session is None or (session_id and session_id != session.id):
+                session = self._session(session_id)
+            try:
+                if not self._allowed_origin(headers.get("origin")):
+                    raise HttpError(403, "cross-origin requests are not allowed")
+                if self.token and not hmac.compare_digest(headers.get("authorization", ""), f"Bearer {self.token}"):
+                    raise HttpError(401, "missing or wrong token")
+                if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._serve_websocket(reader, writer, headers, session)
+                    return
+                if path == "/health" and method == "GET":
+                    await self._respond(writer, 200, self.health(), session, keep_alive)
+                elif path in ("/task", "/chat") and method == "POST":
+                    if headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+                        raise HttpError(415, "Content-Type must be application/json")
+                    try:
+                        payload = json.loads(body or b"{}")
+                    except ValueError:
+                        raise HttpError(400, "body is not JSON")
+                    if not isinstance(payload, dict):
+                        raise HttpError(400, "body must be a JSON object")
+                    kind = path[1:]
+                    result = await self.run(session, kind, payload.get("query" if kind == "task" else "message"))
+                    if payload.get("stream"):
+                        await self._respond_stream(writer, result, session, keep_alive)
+                    else:
+                        await self._respond(writer, 200, result, session, keep_alive)
+                elif path in ("/task", "/chat", "/health"):
+                    raise HttpError(405, "method not allowed")
+                else:
+                    raise HttpError(404, "not found")
+            except Busy:
+                await self._respond(writer, 503, {"error": "busy"}, session, keep_alive, extra_headers={"Retry-After": "1"})
+            except HttpError as e:
+                await self._respond(writer, e.status, {"error": str(e)}, session, keep_alive)
+            if not keep_alive:
+                return
+
+    def _allowed_origin(self, origin):
+        """True without an Origin header (non-browser clients), or for a page served from this server itself."""
+        if origin is None:
+            return True
+        try:
+            parts = urlsplit(origin)
+            port = parts.port
+        except ValueError:
+            return False
+        return (parts.scheme == "http" and port == self.port
+                and parts.hostname in ("127.0.0.1", "localhost", "::1", self.host))
+
+    async def _respond(self, writer, status, payload, session=None, keep_alive=False, extra_headers=None, close=False):
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(body)),
+                   "Connection": "keep-alive" if keep_alive and not close else "close"}
+        if session is not None:
+            headers["X-Viki-Session"] = session.id
+        headers.update(extra_headers or {})
+        writer.write(_http_head(status, headers) + body)
+        await writer.drain()
+
+    async def _respond_stream(self, writer, result, session, keep_alive):
+        headers = {"Content-Type": "application/x-ndjson", "Transfer-Encoding": "chunked",
+                   "Connection": "keep-alive" if keep_alive else "close", "X-Viki-Session": session.id}
+        writer.write(_http_head(200, headers))
+        for message in _stream_messages(result):
+            line = json.dumps(message).encode("utf-8") + b"\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+            await writer.drain() # One sentence at a time: a slow reader holds the stream, not server memory
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # --- WebSocket ---
+
+    async def _serve_websocket(self, reader, writer, headers, session):
+        key = headers.get("sec-websocket-key")
+        if not key or headers.get("sec-websocket-version") != "13":
+            raise HttpError(400, "bad WebSocket handshake")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write(_http_head(101, {"Upgrade": "websocket", "Connection": "Upgrade", "Sec-WebSocket-Accept": accept,
+                                      "X-Viki-Session": session.id}))
+        await writer.drain()
+        connection = _WebSocket(reader, writer)
+        await connection.send_json({"type": "hello", "session": session.id})
+        inflight = asyncio.Semaphore(MAX_INFLIGHT_PER_CONNECTION)
+        tasks = set()
+        try:
+            while True:
+                await inflight.acquire() # Stop reading while too many of this client's requests are open
+                message = await connection.receive()
+                if message is None:
+                    break
+                task = asyncio.ensure_future(self._ws_request(connection, session, message, inflight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _ws_request(self, connection, session, message, inflight):
+        request_id = None
+        try:
+            try:
+                request = json.loads(message)
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                raise HttpError(400, "messages must be JSON objects")
+            request_id = request.get("id")
+            kind = request.get("type", "task")
+            result = await self.run(session, kind, request.get("query" if kind == "task" else "message"))
+            for message in _stream_messages(result):
+                message["id"] = request_id
+                await connection.send_json(message)
+        except Busy:
+            await connection.send_json({"type": "error", "id": request_id, "error": "busy", "status": 503})
+        except HttpError as e:
+            await connection.send_json({"type": "error", "id": request_id, "error": str(e), "status": e.status})
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            inflight.release()
+
+
+class _WebSocket:
+    """Server side of an RFC 6455 connection (text messages only)."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._send_lock = asyncio.Lock() # Frames of concurrent replies must not interleave
+        self.closed = False
+
+    async def receive(self):
+        """The next text message, or None once the connection is closed."""
+        fragments = []
+        while True:
+            head = await asyncio.wait_for(self.reader.readexactly(2), IDLE_TIMEOUT_S)
+            fin, opcode = head[0] & 0x80, head[0] & 0x0F
+            masked, length = head[1] & 0x80, head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+            if not masked or length > MAX_BODY_BYTES:
+                await self.close(1002 if not masked else 1009)
+                return None
+            mask = await self.reader.readexactly(4)
+            payload = _unmask(await self.reader.readexactly(length), mask)
+            if opcode == WS_CLOSE:
+                await self.close()
+                return None
+            if opcode == WS_PING:
+                await self._send_frame(WS_PONG, payload)
+                continue
+            if opcode == WS_PONG:
+                continue
+            if opcode == WS_BINARY:
+                await self.close(1003)
+                return None
+            fragments.append(payload) # WS_TEXT, or a continuation frame
+            if sum(len(fragment) for fragment in fragments) > MAX_BODY_BYTES:
+                await self.close(1009)
+                return None
+            if fin:
+                return b"".join(fragments).decode("utf-8")
+
+    async def send_json(self, message):
+        await self._send_frame(WS_TEXT, json.dumps(message).encode("utf-8"))
+
+    async def _send_frame(self, opcode, payload):
+        if self.closed and opcode != WS_CLOSE:
+            raise ConnectionResetError("WebSocket closed")
+        length = len(payload)
+        if length < 126:
+            head = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        async with self._send_lock:
+            self.writer.write(head + payload)
+            await self.writer.drain()
+
+    async def close(self, code=1000):
+        if not self.closed:
+            try:
+                await self._send_frame(WS_CLOSE, struct.pack("!H", code))
+            except ConnectionError:
+                pass
+            self.closed = True
+
+
+def _unmask(payload, mask):
+    if not payload:
+        return payload
+    # XOR the whole payload at once as one big integer instead of byte by byte
+    key = int.from_bytes((mask * (len(payload) // 4 + 1))[:len(payload)], "big")
+    return (int.from_bytes(payload, "big") ^ key).to_bytes(len(payload), "big")
+
+
+def _stream_messages(result):
+    for sentence in result["sentences"]:
+        yield {"type": "speech", "text": sentence}
+    done = {"type": "done", "reply": result["reply"], "ms": result["ms"]}
+    if "action" in result:
+        done["action"] = result["action"]
+    yield done
+
+
+_REASONS = {101: "Switching Protocols", 200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+            404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 415: "Unsupported Media Type",
+            431: "Request Header Fields Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def _http_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Viki headless as a local HTTP/WebSocket service.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Requests processed at the same time")
+    parser.add_argument("--max-queued", type=int, default=DEFAULT_MAX_QUEUED,
+                        help="Requests allowed to wait for a worker before new ones get 503")
+    args = parser.parse_args()
+
+    viki_log.setup_logging()
+    server = VikiServer(args.host, args.port, args.workers, args.max_queued)
+    if not os.environ.get("VIKI_SERVER_TOKEN"):
+        # Printed rather than logged, so it never ends up in the log files
+        print(f"Bearer token for this run: {server.token} (set VIKI_SERVER_TOKEN to choose your own)", file=sys.stderr)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        viki_log.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
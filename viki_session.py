@@ -0,0 +1,175 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# --- Sessions ---
+# Everything that belongs to one conversation partner (the chat history, the
+# language, chat mode and the speech state) lives in a Session instead of module
+# globals, so the window, the local API server and batch runs can each hold their
+# own conversations in one process. viki.default_session is the person at the
+# microphone; other callers pass their own session to viki.perform_task.
+#
+# Sessions are kept small while idle: __slots__, the history as (role, text)
+# tuples capped at MAX_HISTORY_TURNS, and the speech events only created for a
+# session that actually speaks.
+
+DEFAULT_LANGUAGE = "en-US"
+MAX_HISTORY_TURNS = 100 # Oldest turns are dropped; the whole history is sent with every chatbot request
+IDLE_TIMEOUT_S = 1800.0
+MAX_SESSIONS = 100000
+
+
+class SpeechState:
+    """Whether a session is speaking, and the way to interrupt it."""
+
+    __slots__ = ("is_speaking", "stop", "thread")
+
+    def __init__(self):
+        self.is_speaking = threading.Event() # Set while the bot is speaking
+        self.stop = threading.Event() # Set by another thread to interrupt the speech
+        self.thread = None # The thread currently speaking
+
+
+class Session:
+    """One conversation: history, language, chat mode and speech state. Thread-safe."""
+
+    __slots__ = ("id", "language", "chat_mode", "last_used", "_history", "_lock", "_speech")
+
+    def __init__(self, session_id=None, language=DEFAULT_LANGUAGE):
+        self.id = session_id or secrets.token_hex(8)
+        self.language = language
+        self.chat_mode = False
+        self.last_used = time.monotonic()
+        self._history = [] # (role, text); the chatbot's "contents" shape is only built per request
+        self._lock = threading.Lock()
+        self._speech = None
+
+    @property
+    def speech(self):
+        """The SpeechState, created on first use."""
+        if self._speech is None:
+            with self._lock:
+                if self._speech is None:
+                    self._speech = SpeechState()
+        return self._speech
+
+    def is_speaking(self):
+        return self._speech is not None and self._speech.is_speaking.is_set()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    # --- Conversation ---
+
+    def add_turn(self, role, text):
+        with self._lock:
+            self._append(role, text)
+
+    def _append(self, role, text):
+        self._history.append((role, text))
+        if len(self._history) > MAX_HISTORY_TURNS:
+            del self._history[:len(self._history) - MAX_HISTORY_TURNS]
+
+    def add_user_turn(self, text):
+        """Records the user's turn and returns the conversation up to it, as chatbot request "contents"."""
+        with self._lock:
+            self._append("user", text)
+            return [{"role": role, "parts": [{"text": turn}]} for role, turn in self._history]
+
+    def history(self):
+        """A copy of the conversation as (role, text) tuples."""
+        with self._lock:
+            return list(self._history)
+
+    def clear_history(self):
+        with self._lock:
+            self._history.clear()
+
+    def reset(self, greeting=None):
+        """Starts over: empty history (or just `greeting` from the bot) and command mode."""
+        with self._lock:
+            self._history.clear()
+            if greeting:
+                self._append("model", greeting)
+            self.chat_mode = False
+
+
+class SessionStore:
+    """
+    Sessions by id, in least recently used order (a session counts as used when
+    fetched with get() or passed to touch()). Idle ones are dropped by evict_idle(); past max_sessions
+    the least recently used one is dropped at once. on_evict(session) is called
+    for each dropped session.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT_S, max_sessions=MAX_SESSIONS, on_evict=None):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def get(self, session_id):
+        """The session with this id (marked as used), or None."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+        if session is not None:
+            session.touch()
+        return session
+
+    def touch(self, session):
+        """Marks a session held elsewhere (e.g. by an open connection) as used now."""
+        with self._lock: # Both under the lock, so evict_idle() never sees it moved but not yet touched
+            if session.id in self._sessions:
+                self._sessions.move_to_end(session.id)
+            session.touch()
+
+    def get_or_create(self, session_id=None, language=DEFAULT_LANGUAGE):
+        """The session with this id, or a new one (with this id, if given)."""
+        session = self.get(session_id) if session_id else None
+        if session is not None:
+            return session
+        session = Session(session_id, language)
+        evicted = []
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[1])
+        self._evicted(evicted)
+        return session
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._evicted([session])
+        return session
+
+    def evict_idle(self, now=None):
+        """Drops the sessions not used for idle_timeout. Returns how many were dropped."""
+        cutoff = (now if now is not None else time.monotonic()) - self.idle_timeout
+        evicted = []
+        with self._lock:
+            # Least recently used first, so this stops at the first session still in use
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if session.last_used >= cutoff:
+                    break
+                del self._sessions[session_id]
+                evicted.append(session)
+        self._evicted(evicted)
+        return len(evicted)
+
+    def _evicted(self, sessions):
+        if self.on_evict is not None:
+            for session in sessions:
+                self.on_evict(session)
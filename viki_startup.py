@@ -0,0 +1,196 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import viki_log
+
+log = viki_log.get_logger("startup")
+
+# --- Startup Warm-up ---
+# Engines that are slow to start (TTS, microphone calibration, the camera driver,
+# the HTTP stack) are warmed up concurrently on a small pool while the window is
+# already responsive. Each subsystem reports its own readiness, so the UI can
+# enable exactly the controls whose dependencies are up.
+
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+class Subsystem:
+    def __init__(self, name, fn, after):
+        self.name = name
+        self.fn = fn
+        self.after = tuple(after)
+        self.state = STATE_PENDING
+        self.error = None
+        self.queued_ms = None
+        self.started_ms = None
+        self.finished_ms = None
+
+    @property
+    def settled(self):
+        return self.state in (STATE_READY, STATE_FAILED)
+
+    def summary(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "wait_ms": round(self.started_ms - self.queued_ms, 1) if None not in (self.started_ms, self.queued_ms) else None,
+            "start_ms": self.started_ms,
+            "end_ms": self.finished_ms,
+            "ms": round(self.finished_ms - self.started_ms, 1) if self.finished_ms is not None else None,
+        }
+
+
+class StartupOrchestrator:
+    """
+    Runs warm-up functions on a thread pool. A subsystem starts as soon as the
+    subsystems it runs `after` are ready (it fails without running if one of them
+    failed). on_change(name, state, error) is called from the worker threads.
+    """
+
+    def __init__(self, max_workers=4, on_change=None):
+        self.max_workers = max_workers
+        self.on_change = on_change
+        self._subsystems = {}
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+        self._pool = None
+        self._started = None
+        self.finished_ms = None
+
+    def add(self, name, fn, after=()):
+        """Registers a warm-up. fn() raising an exception marks the subsystem as failed."""
+        with self._lock:
+            if self._pool is not None:
+                raise RuntimeError("cannot add subsystems after start()")
+            self._subsystems[name] = Subsystem(name, fn, after)
+
+    def start(self):
+        with self._lock:
+            if self._pool is not None:
+                return
+            self._started = time.perf_counter()
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="viki-warmup")
+            ready = [sub for sub in self._subsystems.values() if not any(name in self._subsystems for name in sub.after)]
+        for sub in ready:
+            self._submit(sub)
+
+    def _elapsed_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 1)
+
+    def _submit(self, sub):
+        sub.queued_ms = self._elapsed_ms()
+        self._pool.submit(self._run, sub)
+
+    def _run(self, sub):
+        sub.started_ms = self._elapsed_ms()
+        self._set_state(sub, STATE_RUNNING)
+        try:
+            sub.fn()
+        except Exception as e:
+            sub.finished_ms = self._elapsed_ms()
+            log.warning("Warm-up of %s failed: %s", sub.name, e, extra={"subsystem": sub.name, "ms": sub.finished_ms - sub.started_ms})
+            self._settle(sub, STATE_FAILED, str(e) or type(e).__name__)
+        else:
+            sub.finished_ms = self._elapsed_ms()
+            log.debug("%s ready", sub.name, extra={"subsystem": sub.name, "ms": round(sub.finished_ms - sub.started_ms, 1)})
+            self._settle(sub, STATE_READY)
+
+    def _settle(self, sub, state, error=None):
+        sub.error = error
+        self._set_state(sub, state)
+        runnable, skipped = [], []
+        with self._lock:
+            for other in self._subsystems.values():
+                if other.state != STATE_PENDING or sub.name not in other.after:
+                    continue
+                deps = [self._subsystems[name] for name in other.after if name in self._subsystems]
+                failed = [dep.name for dep in deps if dep.state == STATE_FAILED]
+                if failed:
+                    # Claimed here, so a second failing dependency cannot report it again
+                    other.state = STATE_FAILED
+                    other.started_ms = other.finished_ms = self._elapsed_ms()
+                    skipped.append((other, f"needs {', '.join(failed)}"))
+                elif all(dep.state == STATE_READY for dep in deps):
+                    other.state = STATE_RUNNING
+                    runnable.append(other)
+            finished = self.finished_ms is None and all(other.settled for other in self._subsystems.values())
+            if finished:
+                self.finished_ms = self._elapsed_ms()
+            self._settled.notify_all()
+        for other, reason in skipped:
+            self._settle(other, STATE_FAILED, reason)
+        for other in runnable:
+            self._submit(other)
+        if finished:
+            self._log_summary()
+            self._pool.shutdown(wait=False)
+
+    def _set_state(self, sub, state):
+        with self._lock:
+            sub.state = state
+        if self.on_change is not None:
+            try:
+                self.on_change(sub.name, state, sub.error)
+            except Exception:
+                log.exception("Startup state callback failed")
+
+    def state(self, name):
+        sub = self._subsystems.get(name)
+        return sub.state if sub else None
+
+    def error(self, name):
+        sub = self._subsystems.get(name)
+        return sub.error if sub else None
+
+    def is_ready(self, *names):
+        return all(self.state(name) == STATE_READY for name in names)
+
+    def is_settled(self, *names):
+        return all(self.state(name) in (STATE_READY, STATE_FAILED) for name in names)
+
+    def wait(self, *names, timeout=None):
+        """Blocks until the named subsystems (all, if none are named) are ready or failed. Returns True if all are ready."""
+        names = names or tuple(self._subsystems)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._settled:
+            while not all(self._subsystems[name].settled for name in names):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._settled.wait(remaining)
+        return self.is_ready(*names)
+
+    def critical_path(self):
+        """The chain of subsystems that determined when warm-up finished, first to last."""
+        with self._lock:
+            finished = [sub for sub in self._subsystems.values() if sub.finished_ms is not None]
+            if not finished:
+                return []
+            path = [max(finished, key=lambda sub: sub.finished_ms)]
+            while True:
+                deps = [self._subsystems[name] for name in path[-1].after
+                        if name in self._subsystems and self._subsystems[name].finished_ms is not None]
+                if not deps:
+                    break
+                path.append(max(deps, key=lambda sub: sub.finished_ms))
+        return [sub.name for sub in reversed(path)]
+
+    def summary(self):
+        with self._lock:
+            subsystems = {name: sub.summary() for name, sub in self._subsystems.items()}
+        return {"total_ms": self.finished_ms, "critical_path": self.critical_path(), "subsystems": subsystems}
+
+    def _log_summary(self):
+        summary = self.summary()
+        log.info("Warm-up finished in %.0f ms; critical path: %s", summary["total_ms"] or 0.0,
+                 " -> ".join(summary["critical_path"]), extra=summary)
+
+    def shutdown(self):
+        with self._lock:
+            pool = self._pool
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,232 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+import viki_log
+
+log = viki_log.get_logger("tasks")
+
+# --- Priority Lanes ---
+# Lower number = served first. Interruptions always jump ahead of regular
+# commands, and regular commands jump ahead of slow chatbot (LLM) requests.
+LANE_INTERRUPT = 0
+LANE_COMMAND = 1
+LANE_LLM = 2
+
+LANE_NAMES = {
+    LANE_INTERRUPT: "interrupt",
+    LANE_COMMAND: "command",
+    LANE_LLM: "llm",
+}
+
+# Thread-local storage so a running task can look up its own handle
+_local = threading.local()
+
+
+def current_task():
+    """Returns the TaskHandle being run by the calling worker thread, or None."""
+    return getattr(_local, "task", None)
+
+
+class TaskHandle:
+    """
+    Represents one submitted task. Can be used to cancel it or wait for its result.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+    def __init__(self, lane, key, fn, args, kwargs):
+        self.lane = lane
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.state = TaskHandle.PENDING
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        """True once cancel() was requested, even if the task is already running."""
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """
+        Requests cancellation. Pending tasks are never started; running tasks
+        are expected to check `cancelled` and drop their result.
+        """
+        self._cancel_event.set()
+
+    def wait(self, timeout=None):
+        """Blocks until the task finished (or was cancelled). Returns True if done."""
+        return self._done_event.wait(timeout)
+
+    def __repr__(self):
+        return f"<TaskHandle lane={LANE_NAMES.get(self.lane, self.lane)} key={self.key!r} state={self.state}>"
+
+
+class TaskExecutor:
+    """
+    Central executor for user queries.
+    Runs tasks on a bounded pool of worker threads, ordered by priority lane and
+    submission order. Identical pending queries (same key) are deduplicated.
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, name="viki-task"):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._heap = []
+        self._pending_by_key = {}
+        self._running = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "deduplicated": 0,
+            "rejected": 0,
+        }
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"{name}-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, fn, *args, lane=LANE_COMMAND, key=None, **kwargs):
+        """
+        Queues fn(*args, **kwargs) on the given lane and returns its TaskHandle.
+        If a task with the same key is still pending, that handle is returned instead.
+        Raises queue.Full when max_pending tasks are already waiting.
+        """
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("TaskExecutor has been shut down.")
+
+            if key is not None:
+                existing = self._pending_by_key.get(key)
+                if existing is not None and not existing.cancelled:
+                    self._stats["deduplicated"] += 1
+                    return existing
+
+            if self._pending_count() >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise queue.Full(f"Too many pending tasks ({self.max_pending}).")
+
+            handle = TaskHandle(lane, key, fn, args, kwargs)
+            heapq.heappush(self._heap, (lane, next(self._seq), handle))
+            if key is not None:
+                self._pending_by_key[key] = handle
+            self._stats["submitted"] += 1
+            self._cond.notify()
+            return handle
+
+    def cancel_all(self, lanes=None):
+        """
+        Cancels every pending and running task (optionally only those in `lanes`).
+        Returns the number of tasks that were cancelled.
+        """
+        count = 0
+        with self._cond:
+            for _, _, handle in self._heap:
+                if (lanes is None or handle.lane in lanes) and not handle.cancelled:
+                    handle.cancel()
+                    count += 1
+            for handle in self._running:
+                if (lanes is None or handle.lane in lanes) and not handle.cancelled:
+                    handle.cancel()
+                    count += 1
+        return count
+
+    def metrics(self):
+        """Returns a snapshot of queue depths per lane and lifetime counters."""
+        with self._cond:
+            depth = {name: 0 for name in LANE_NAMES.values()}
+            for _, _, handle in self._heap:
+                if not handle.cancelled:
+                    depth[LANE_NAMES.get(handle.lane, str(handle.lane))] += 1
+            snapshot = dict(self._stats)
+            snapshot["pending"] = depth
+            snapshot["pending_total"] = sum(depth.values())
+            snapshot["running"] = len(self._running)
+            snapshot["workers"] = self.max_workers
+            return snapshot
+
+    def shutdown(self, wait=False, timeout=None):
+        """Stops accepting work, cancels anything pending and stops the workers."""
+        with self._cond:
+            self._shutdown = True
+            for _, _, handle in self._heap:
+                handle.cancel()
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join(timeout)
+
+    def _pending_count(self):
+        return sum(1 for _, _, handle in self._heap if not handle.cancelled)
+
+    def _next_task(self):
+        """Pops the next runnable task, discarding cancelled ones. Called with the lock held."""
+        while self._heap:
+            _, _, handle = heapq.heappop(self._heap)
+            if handle.key is not None and self._pending_by_key.get(handle.key) is handle:
+                del self._pending_by_key[handle.key]
+            if handle.cancelled:
+                self._finish(handle, TaskHandle.CANCELLED)
+                continue
+            return handle
+        return None
+
+    def _finish(self, handle, state):
+        handle.state = state
+        handle.finished_at = time.monotonic()
+        if state == TaskHandle.CANCELLED:
+            self._stats["cancelled"] += 1
+        elif state == TaskHandle.FAILED:
+            self._stats["failed"] += 1
+        else:
+            self._stats["completed"] += 1
+        handle._done_event.set()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                handle = self._next_task()
+                while handle is None:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    handle = self._next_task()
+                handle.state = TaskHandle.RUNNING
+                handle.started_at = time.monotonic()
+                self._running.add(handle)
+
+            _local.task = handle
+            state = TaskHandle.DONE
+            try:
+                handle.result = handle.fn(*handle.args, **handle.kwargs)
+            except Exception as e:
+                handle.error = e
+                state = TaskHandle.FAILED
+                log.exception("Error in background task %r", handle)
+            finally:
+                _local.task = None
+
+            with self._cond:
+                self._running.discard(handle)
+                if state == TaskHandle.DONE and handle.cancelled:
+                    state = TaskHandle.CANCELLED
+                self._finish(handle, state)
@@ -0,0 +1,334 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import viki_log
+
+log = viki_log.get_logger("trace")
+
+# --- Interaction Tracing ---
+# Spans time the stages of one interaction (microphone -> recognition -> dispatch ->
+# Gemini -> sanitizing -> first audio) and feed per-stage histograms. Disabled by
+# default; every entry point checks one flag first, so the cost when off is a
+# global lookup and a branch.
+#
+# An interaction is begun on the thread that starts it and follows the work
+# explicitly (bind() on the worker thread), because thread pools and the speech
+# thread do not inherit thread-local state.
+
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+RECENT_INTERACTIONS = 50
+
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+_histograms = {}
+_recent = deque(maxlen=RECENT_INTERACTIONS)
+_next_id = 0
+
+
+class Histogram:
+    """Fixed log-scale buckets in milliseconds, plus count/sum/min/max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1) # Last bucket is overflow
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def add(self, ms):
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = max(self.max, ms)
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile."""
+        if not self.count:
+            return 0.0
+        wanted = pct / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted and count:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "min_ms": round(self.min or 0.0, 3),
+            "max_ms": round(self.max, 3),
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "buckets": dict(zip([str(b) for b in BUCKETS_MS] + ["inf"], self.counts)),
+        }
+
+
+class Interaction:
+    def __init__(self, interaction_id, kind):
+        self.id = interaction_id
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans = [] # (name, offset_ms, duration_ms)
+        self.ended = False
+        self.total_ms = None
+        self.first_audio_ms = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _recent.clear()
+
+
+def _observe(name, ms):
+    # Caller holds _lock
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = Histogram()
+    histogram.add(ms)
+
+
+def begin_interaction(kind="voice", bind_thread=True):
+    """
+    Starts an interaction and returns it (None when disabled). It is made current on
+    this thread unless bind_thread=False; then the caller hands it on explicitly
+    (e.g. the Tk thread, which never ends the interactions it starts).
+    """
+    global _next_id
+    if not _enabled:
+        return None
+    with _lock:
+        _next_id += 1
+        interaction = Interaction(_next_id, kind)
+    if bind_thread:
+        _local.interaction = interaction
+    return interaction
+
+
+def current():
+    """The interaction bound to this thread, or None."""
+    return getattr(_local, "interaction", None)
+
+
+class bind:
+    """Context manager that makes `interaction` current on this thread (e.g. a worker or the speech thread)."""
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    def __enter__(self):
+        self.previous = getattr(_local, "interaction", None)
+        _local.interaction = self.interaction
+        return self.interaction
+
+    def __exit__(self, *exc):
+        _local.interaction = self.previous
+        return False
+
+
+def record(name, duration_ms, interaction=None):
+    """Records a finished stage. Spans of a running interaction are kept until it ends."""
+    if not _enabled:
+        return
+    if interaction is None:
+        interaction = current()
+    with _lock:
+        if interaction is not None and not interaction.ended:
+            interaction.spans.append((name, round((time.perf_counter() - interaction.started) * 1000 - duration_ms, 3),
+                                      round(duration_ms, 3)))
+        else:
+            _observe(name, duration_ms)
+
+
+def end_interaction(interaction=None, discard=False):
+    """
+    Ends an interaction: its spans go into the histograms and it is kept in the
+    recent list. With discard=True (e.g. the microphone heard nothing) it is dropped.
+    """
+    if interaction is None:
+        interaction = current()
+    if interaction is None:
+        return
+    with _lock:
+        if interaction.ended:
+            return
+        interaction.ended = True
+        if discard:
+            return
+        interaction.total_ms = round((time.perf_counter() - interaction.started) * 1000, 3)
+        for name, _, duration_ms in interaction.spans:
+            _observe(name, duration_ms)
+        _observe(f"{interaction.kind}_interaction", interaction.total_ms)
+        if interaction.first_audio_ms is not None:
+            _observe(f"{interaction.kind}_to_first_audio", interaction.first_audio_ms)
+        _recent.append(interaction)
+
+
+def mark_first_audio(interaction=None):
+    """Records the time from the start of the interaction to the first spoken audio, and ends it."""
+    if not _enabled:
+        return
+    if interaction is None:
+        interaction = current()
+    if interaction is None or interaction.ended:
+        return
+    interaction.first_audio_ms = round((time.perf_counter() - interaction.started) * 1000, 3)
+    end_interaction(interaction)
+
+
+class _Span:
+    __slots__ = ("name", "interaction", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.interaction = current()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, (time.perf_counter() - self.started) * 1000, self.interaction)
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    """Times the enclosed block as stage `name` of the current interaction."""
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name)
+
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """Histograms per stage and the most recent interactions with their spans."""
+    with _lock:
+        return {
+            "enabled": _enabled,
+            "stages": {name: histogram.summary() for name, histogram in sorted(_histograms.items())},
+            "recent": [{
+                "id": interaction.id,
+                "kind": interaction.kind,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(interaction.wall_started)),
+                "total_ms": interaction.total_ms,
+                "first_audio_ms": interaction.first_audio_ms,
+                "spans": [{"stage": name, "offset_ms": offset, "duration_ms": duration}
+                          for name, offset, duration in interaction.spans],
+            } for interaction in _recent],
+        }
+
+
+# --- Export ---
+
+def start_metrics_server(port=9477, host="127.0.0.1"):
+    """Serves snapshot() as JSON at http://host:port/metrics. Returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = json.dumps(snapshot(), indent=2).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="viki-trace-http").start()
+    return server
+
+
+def start_json_dump(path, interval_s=30.0):
+    """Writes snapshot() to `path` every interval_s seconds (atomically). Returns a stop Event."""
+    stop_event = threading.Event()
+
+    def run():
+        while not stop_event.wait(interval_s):
+            dump_json(path)
+
+    threading.Thread(target=run, daemon=True, name="viki-trace-dump").start()
+    return stop_event
+
+
+def dump_json(path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def configure_from_env():
+    """
+    Enables tracing when VIKI_TRACE=1. VIKI_TRACE_PORT starts the metrics endpoint,
+    VIKI_TRACE_DUMP=<file> writes a JSON dump every VIKI_TRACE_DUMP_INTERVAL seconds (default 30).
+    """
+    if os.environ.get("VIKI_TRACE", "") not in ("1", "true", "yes"):
+        return False
+    enable()
+    port = os.environ.get("VIKI_TRACE_PORT")
+    if port:
+        try:
+            start_metrics_server(int(port))
+            log.info("Tracing metrics at http://127.0.0.1:%s/metrics", port)
+        except (OSError, ValueError) as e:
+            log.error("Could not start the tracing metrics endpoint: %s", e)
+    dump_path = os.environ.get("VIKI_TRACE_DUMP")
+    if dump_path:
+        start_json_dump(dump_path, float(os.environ.get("VIKI_TRACE_DUMP_INTERVAL", "30")))
+    return True
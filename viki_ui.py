@@ -1,29 +1,45 @@
+import time
+_STARTUP_STARTED = time.perf_counter() # Start of the time-to-window-visible measurement
 import sys
 import subprocess
-import importlib
+import importlib.util
 import tkinter as tk
 from tkinter import messagebox, filedialog
 import threading
-import cv2
 import PIL.Image
+import PIL.ImageTk
 from customtkinter import CTkImage
-import time
 import queue
+import sqlite3
 import viki  # Assuming viki.py is in the same directory and importable
-import speech_recognition as sr
+import viki_tasks
+import viki_dispatch
+import viki_chat_view
+import viki_video
+import viki_recorder
+import viki_detect
+import viki_photos
+import viki_cameras
+import viki_trace
+import viki_log
+import viki_startup
+import viki_commands
+import viki_app_tree
+import viki_bulk
+import viki_apps
 import customtkinter as ctk
 import tkinter.ttk as ttk
 import os # Make sure os is imported for path handling
 import winsound # Make sure winsound is imported
 
+log = viki_log.get_logger("ui")
+
 # --- Configuration for Module Check ---
 APP_NAME = "Viki Voice Assistant"
 REQUIRED_MODULES = [
     "pyttsx3",
     "speech_recognition",
-    "wikipedia",
     "requests", # Added for Gemini API calls in viki.py
-    "bs4",
     "cv2",
     "PIL",
     "customtkinter",
@@ -41,12 +57,14 @@ def check_and_install_modules_ui():
     Checks for required modules and offers to install them if missing.
     Uses Tkinter message boxes for user interaction.
     Returns True if all modules are present or successfully installed, False otherwise.
+    Modules are only located (find_spec), not imported, so the check costs no startup time.
     """
     missing_modules = []
     for module_name in REQUIRED_MODULES:
         try:
-            importlib.import_module(module_name)
-        except ImportError:
+            if importlib.util.find_spec(module_name) is None:
+                missing_modules.append(module_name)
+        except (ImportError, ValueError):
             missing_modules.append(module_name)
         except Exception as e:
             messagebox.showerror("Module Check Error", f"Error checking module '{module_name}': {e}\n\n"
@@ -92,9 +110,7 @@ def check_and_install_modules_ui():
 
                 messagebox.showinfo("Installation Complete", "Missing modules installed successfully! "
                                     "Please restart the application for changes to take effect.")
-                print("--- Pip Installation Output ---")
-                print("STDOUT:\n", process.stdout)
-                print("STDERR:\n", process.stderr)
+                log.info("Installed missing modules", extra={"stdout": process.stdout, "stderr": process.stderr})
                 sys.exit()
             except subprocess.CalledProcessError as e:
                 temp_root.destroy() if 'temp_root' in locals() else None
@@ -125,11 +141,13 @@ def resource_path(relative_path):
 
 # --- Opening Video Function ---
 def play_opening_video(video_path):
+    import cv2
+
     full_video_path = resource_path(video_path)
-    print(f"Attempting to open video: {full_video_path}")
+    log.debug("Opening splash video %s", full_video_path)
     cap = cv2.VideoCapture(full_video_path)
     if not cap.isOpened():
-        print(f"Error: Cannot open opening video at {full_video_path}. Check file path or codecs.")
+        log.error("Cannot open splash video %s; check the file path or codecs", full_video_path)
         # Fallback: Show a simple splash screen with text instead of video
         splash_root = tk.Tk()
         splash_root.title("Viki Voice Assistant")
@@ -162,7 +180,7 @@ def play_opening_video(video_path):
     video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
     if video_width == 0 or video_height == 0:
-        print("Could not get video dimensions. Skipping splash screen.")
+        log.warning("Could not get splash video dimensions; skipping the splash screen")
         cap.release()
         splash_root.destroy()
         return
@@ -199,11 +217,28 @@ ctk.set_appearance_mode("Light")
 ctk.set_default_color_theme("blue") # You can try "dark-blue" or "green"
 
 class VikiUI:
+    # Controls that stay disabled until the subsystems they need have warmed up
+    READINESS_GATES = {
+        "btn_listen": ("tts", "microphone"),
+        "btn_video": ("camera",),
+        "btn_multi_camera": ("camera",),
+        "btn_send": ("commands", "llm"),
+    }
+    SUBSYSTEM_LABELS = {
+        "commands": "Custom commands",
+        "tts": "Text-to-speech",
+        "microphone": "Microphone",
+        "camera": "Camera",
+        "llm": "Gemini connection",
+        "apps": "Installed applications",
+    }
+
     def __init__(self, root):
         self.root = root
         self.root.title("Viki Voice Assistant UI")
         self.root.geometry("900x750") # Slightly taller
         self.root.minsize(700, 600) # Minimum size to prevent layout issues
+        self.session = viki.default_session # The conversation of whoever is at the window
 
         # Configure grid rows and columns for responsiveness
         self.root.grid_rowconfigure(0, weight=0) # Logo
@@ -223,7 +258,7 @@ class VikiUI:
         # Add logo image below the title
         try:
             logo_path = resource_path("jarvis/viki_logo.png")
-            print(f"Loading logo image from: {logo_path}")
+            log.debug("Loading logo image from %s", logo_path)
             logo_image = PIL.Image.open(logo_path)
             max_width = 200
             max_height = 100
@@ -232,7 +267,7 @@ class VikiUI:
             self.logo_label = ctk.CTkLabel(root, image=self.logo_imgtk, text="")
             self.logo_label.grid(row=1, column=0, pady=10) # Use grid for logo
         except Exception as e:
-            print(f"Error loading logo image: {e}")
+            log.error("Error loading logo image: %s", e)
             self.logo_label = ctk.CTkLabel(root, text="Viki Assistant", font=("Segoe UI", 24, "bold"))
             self.logo_label.grid(row=1, column=0, pady=10)
 
@@ -241,20 +276,25 @@ class VikiUI:
         self.bind_button_sounds()
 
         # Add cancel_all_tasks method to stop all ongoing tasks
-        def cancel_all_tasks():
+        def cancel_all_tasks(query=None):
             # Stop speech
-            viki.stop_current_speech()
-            # Stop video recording and video mode
-            if self.recording:
-                self.stop_recording()
-            if self.video_mode:
-                self.video_mode = False
-                self.stop_event.set()
-                self.btn_video.configure(text="Toggle Video Mode")
-                self.btn_start_record.configure(state="disabled")
-                self.btn_stop_record.configure(state="disabled")
-                self.btn_capture_photo.configure(state="disabled")
-                self.log_to_chat("Video mode stopped due to new task.")
+            viki.stop_current_speech(self.session)
+            # Stop video recording and video mode, unless the query saves the replay:
+            # that reads the buffer video mode keeps filling, so the preview stays live
+            if query is None or not viki.is_replay_request(query):
+                if self.recording:
+                    self.stop_recording()
+                if self.video_mode:
+                    self.video_mode = False
+                    self.stop_event.set()
+                    self.btn_video.configure(text="Toggle Video Mode")
+                    self.btn_start_record.configure(state="disabled")
+                    self.btn_stop_record.configure(state="disabled")
+                    self.btn_capture_photo.configure(state="disabled")
+                    self.btn_burst_photo.configure(state="disabled")
+                    self.log_to_chat("Video mode stopped due to new task.")
+                if self.camera_manager is not None:
+                    self.stop_multi_camera()
             # Stop listening
             if self.listening:
                 self.stop_listening()
@@ -264,9 +304,13 @@ class VikiUI:
         self.chat_canvas = tk.Canvas(root, bg=ctk.ThemeManager.theme["CTkFrame"]["fg_color"][0], highlightthickness=0) # Use theme color
         self.chat_canvas.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
 
+        # Virtualized message list: only bubbles in the viewport get widgets
+        self.chat_view = viki_chat_view.VirtualChatView(self.chat_canvas)
+
         # Add a scrollbar for the canvas (using CTkScrollbar)
-        self.scrollbar = ctk.CTkScrollbar(root, command=self.chat_canvas.yview)
+        self.scrollbar = ctk.CTkScrollbar(root, command=self.chat_view.yview)
         self.scrollbar.grid(row=1, column=0, sticky="nse") # Stick to the right of chat_canvas
+        self.chat_canvas.configure(yscrollcommand=self.scrollbar.set)
 
         # Add scroll up and down buttons for chat canvas at bottom right corner
         self.btn_chat_scroll_up = ctk.CTkButton(root, text="▲", width=20, height=20, command=self.scroll_chat_up, corner_radius=10)
@@ -274,15 +318,6 @@ class VikiUI:
         self.btn_chat_scroll_down = ctk.CTkButton(root, text="▼", width=20, height=20, command=self.scroll_chat_down, corner_radius=10)
         self.btn_chat_scroll_down.grid(row=1, column=0, sticky="se", padx=(0, 30), pady=(10, 10))
 
-        # Frame inside canvas to hold messages (using CTkFrame)
-        self.messages_frame = ctk.CTkFrame(self.chat_canvas, fg_color="transparent") # Use transparent background
-        # Create window inside canvas for messages_frame
-        self.canvas_window_id = self.chat_canvas.create_window((0, 0), window=self.messages_frame, anchor="nw")
-
-        self.messages_frame.bind("<Configure>", lambda e: self.chat_canvas.configure(scrollregion=self.chat_canvas.bbox("all")))
-        # Bind canvas resize to update the width of the window holding messages_frame
-        self.chat_canvas.bind("<Configure>", self._on_canvas_resize)
-
         # Entry for manual command input with styled frame for rounded corners
         self.input_frame = ctk.CTkFrame(root, corner_radius=10)
         self.input_frame.grid(row=2, column=0, padx=10, pady=5, sticky="ew")
@@ -298,7 +333,7 @@ class VikiUI:
         # Buttons frame (using CTkFrame)
         btn_frame = ctk.CTkFrame(root, fg_color="transparent") # Transparent background
         btn_frame.grid(row=3, column=0, pady=10)
-        btn_frame.grid_columnconfigure((0,1,2,3,4,5,6,7,8,9,10), weight=1) # Make columns expand equally
+        btn_frame.grid_columnconfigure((0,1,2,3,4,5,6,7,8,9,10,11,12,13), weight=1) # Make columns expand equally
 
         self.btn_listen = ctk.CTkButton(btn_frame, text="Start Listening", command=self.start_listening, corner_radius=8)
         self.btn_listen.grid(row=0, column=0, padx=5, pady=5)
@@ -336,11 +371,64 @@ class VikiUI:
         self.btn_toggle_theme = ctk.CTkButton(btn_frame, text="Switch to Dark Mode", command=self.toggle_theme, corner_radius=8)
         self.btn_toggle_theme.grid(row=0, column=10, padx=5, pady=5)
 
+        # Optional face detection overlay on the webcam preview
+        self.face_detection_var = ctk.BooleanVar(value=False)
+        self.chk_face_detection = ctk.CTkCheckBox(btn_frame, text="Detect Faces", variable=self.face_detection_var, command=self.toggle_face_detection)
+        self.chk_face_detection.grid(row=0, column=11, padx=5, pady=5)
+
+        # Motion-gated recording: only write frames while something moves (plus pre/post-roll)
+        self.motion_recording_var = ctk.BooleanVar(value=False)
+        self.chk_motion_recording = ctk.CTkCheckBox(btn_frame, text="Record Motion Only", variable=self.motion_recording_var)
+        self.chk_motion_recording.grid(row=0, column=12, padx=5, pady=5)
+        self.motion_sensitivity_var = ctk.StringVar(value="medium") # Higher reacts to smaller changes
+        self.motion_sensitivity_label = ctk.CTkLabel(btn_frame, text="Motion:")
+        self.motion_sensitivity_label.grid(row=1, column=10, padx=(20, 5), pady=5)
+        self.motion_sensitivity_option = ctk.CTkComboBox(btn_frame, variable=self.motion_sensitivity_var, values=list(viki_recorder.MOTION_SENSITIVITIES), state="readonly", width=90, corner_radius=8)
+        self.motion_sensitivity_option.grid(row=1, column=11, padx=5, pady=5)
+        self.motion_roll_var = ctk.StringVar(value="1 / 3") # Seconds kept before motion starts / after it stops
+        self.motion_roll_label = ctk.CTkLabel(btn_frame, text="Pre/Post (s):")
+        self.motion_roll_label.grid(row=1, column=12, padx=(20, 5), pady=5)
+        self.motion_roll_option = ctk.CTkComboBox(btn_frame, variable=self.motion_roll_var, values=list(viki_recorder.MOTION_ROLL_CHOICES), width=90, corner_radius=8) # Editable: other values can be typed in
+        self.motion_roll_option.grid(row=1, column=13, padx=5, pady=5)
+
+        # Instant replay: saves the last replay_seconds of video on demand
+        self.btn_save_replay = ctk.CTkButton(btn_frame, text="Save Replay", command=self.save_replay, corner_radius=8)
+        self.btn_save_replay.grid(row=0, column=13, padx=5, pady=5)
+        self.replay_seconds = 60.0
+        self.replay_buffer = None # Created when video mode first starts
+
+        # Photo format and burst capture; photos are encoded and saved by a background writer pool
+        self.btn_burst_photo = ctk.CTkButton(btn_frame, text="Burst Photos", command=self.burst_photos, state="disabled", corner_radius=8)
+        self.btn_burst_photo.grid(row=1, column=6, padx=5, pady=5)
+        self.photo_format_var = ctk.StringVar(value="png")
+        self.photo_format_label = ctk.CTkLabel(btn_frame, text="Photo:")
+        self.photo_format_label.grid(row=1, column=8, padx=(20, 5), pady=5)
+        self.photo_format_option = ctk.CTkComboBox(btn_frame, variable=self.photo_format_var, values=list(viki_photos.PHOTO_FORMATS), state="readonly", width=80, corner_radius=8)
+        self.photo_format_option.grid(row=1, column=9, padx=5, pady=5)
+        self.photo_png_level = 3 # 0-9, higher is smaller but slower
+        self.photo_quality = 90 # JPEG/WebP quality, 0-100
+        self.burst_count = 5
+        self.burst_fps = 5.0
+        self.photo_writer = viki_photos.PhotoWriter(output_dir="photos", max_workers=2)
+
+        # Multi-camera mode: one capture thread per source, shown as a tiled preview.
+        # Sources are device indexes, video file paths or "synthetic" test patterns.
+        self.btn_multi_camera = ctk.CTkButton(btn_frame, text="Multi-Camera", command=self.toggle_multi_camera, corner_radius=8)
+        self.btn_multi_camera.grid(row=1, column=3, padx=5, pady=5)
+        self.camera_sources = [0, 1]
+        self.camera_manager = None # Running CameraManager while multi-camera mode is on
+        self.tiled_preview = None
+        self._multi_preview_job = None
+
         # Video display label (initially hidden or small)
         self.video_label = ctk.CTkLabel(root, text="", width=640, height=480) # Placeholder for video
         self.video_label.grid(row=4, column=0, pady=5)
         # Initially hide the video label by setting its state.
         self.video_label.grid_remove() # Hide it initially
+        # Achieved capture/display/record FPS, shown over the preview while video mode is on
+        self.video_fps_label = ctk.CTkLabel(root, text="", font=("Segoe UI", 11))
+        self.video_fps_label.grid(row=4, column=0, sticky="nw", padx=10)
+        self.video_fps_label.grid_remove()
 
         # Listening indicator canvas
         self.indicator_canvas = tk.Canvas(root, width=20, height=20, highlightthickness=0, bg=root.cget("bg"))
@@ -350,7 +438,30 @@ class VikiUI:
         # Initialize recording variables
         self.recording = False
         self.video_writer = None
-        self.current_frame = None
+
+        # Preallocated frame buffers reused by video_loop (created on first use)
+        self.frame_ring = None
+        self.frame_size = (640, 480) # Display and recording size
+
+        # Mode requested from the camera; camera_mode holds what the device actually granted
+        self.camera_fps = 30.0
+        self.camera_pixel_format = "MJPG" # Compressed, so 640x480@30 fits on USB 2 cameras
+        self.camera_mode = None
+        self.capture_rate = viki_video.RateMeter()
+        self.display_rate = viki_video.RateMeter()
+        self.record_rate = viki_video.RateMeter()
+        self._fps_label_updated = 0.0
+
+        # Latest-frame mailbox between video_loop and the Tk thread (never goes through self.queue)
+        # Frames in flight are pinned ring slots; dropped ones are released back to the ring.
+        self.preview_mailbox = viki_video.FrameMailbox(on_drop=lambda slot: self.frame_ring.unpin(slot))
+        self.preview_photo = None # Reused PhotoImage; new frames are pasted into it
+        self.preview_interval_ms = 16 # Display pacing, roughly one frame per screen refresh
+        self._preview_job = None
+
+        # Face detection pipeline (None while disabled); the model is loaded once and kept
+        self.face_detector = None
+        self.face_pipeline = None
 
         # New frame for application list and voice command mapping
         self.app_frame = ctk.CTkFrame(root, corner_radius=10) # Use CTkFrame
@@ -359,6 +470,18 @@ class VikiUI:
 
         ctk.CTkLabel(self.app_frame, text="Applications Voice Command Mapping", font=("Segoe UI", 16, "bold")).grid(row=0, column=0, columnspan=2, pady=5)
 
+        # Search box: filters the rows as you type
+        self.app_search_frame = ctk.CTkFrame(self.app_frame, fg_color="transparent")
+        self.app_search_frame.grid(row=1, column=0, columnspan=2, padx=5, sticky="ew")
+        self.app_search_frame.grid_columnconfigure(1, weight=1)
+        ctk.CTkLabel(self.app_search_frame, text="Search:").grid(row=0, column=0, padx=5, sticky="w")
+        self.app_search_var = tk.StringVar()
+        self.app_search_entry = ctk.CTkEntry(self.app_search_frame, textvariable=self.app_search_var, corner_radius=8,
+                                             placeholder_text="Filter by name, voice command or path")
+        self.app_search_entry.grid(row=0, column=1, padx=5, sticky="ew")
+        self.app_count_label = ctk.CTkLabel(self.app_search_frame, text="")
+        self.app_count_label.grid(row=0, column=2, padx=5, sticky="e")
+
         # Treeview for applications and voice commands
         self.app_tree = ttk.Treeview(self.app_frame, columns=("Application", "Voice Command", "Path"), show="headings", height=5)
         self.app_tree.heading("Application", text="Application")
@@ -367,13 +490,18 @@ class VikiUI:
         self.app_tree.column("Application", width=150, stretch=False)
         self.app_tree.column("Voice Command", width=200, stretch=False)
         self.app_tree.column("Path", width=350, stretch=True) # Path can stretch
-        self.app_tree.grid(row=1, column=0, padx=5, pady=5, sticky="nsew") # Use grid
+        self.app_tree.grid(row=2, column=0, padx=5, pady=5, sticky="nsew") # Use grid
 
         # Scrollbar for treeview
         self.app_scrollbar = ctk.CTkScrollbar(self.app_frame, command=self.app_tree.yview) # Use CTkScrollbar
-        self.app_scrollbar.grid(row=1, column=1, padx=5, pady=5, sticky="ns") # Stick to right of treeview
+        self.app_scrollbar.grid(row=2, column=1, padx=5, pady=5, sticky="ns") # Stick to right of treeview
         self.app_tree.configure(yscrollcommand=self.app_scrollbar.set)
 
+        # Rows are reconciled incrementally (and filtered) instead of being cleared and refilled
+        self.command_tree = viki_app_tree.CommandTree(self.app_tree, on_change=self._update_app_count,
+                                                      on_synced=self._on_app_tree_synced)
+        self.app_search_var.trace_add("write", lambda *_: self.command_tree.set_filter(self.app_search_var.get()))
+
 
         # Frame for adding new application, voice command and path
         self.add_app_frame = ctk.CTkFrame(root, fg_color="transparent")
@@ -427,6 +555,13 @@ class VikiUI:
         self.btn_delete_webapp = ctk.CTkButton(self.add_webapp_frame, text="Delete Selected Web", command=self.delete_selected_web_application, corner_radius=8, fg_color="red")
         self.btn_delete_webapp.grid(row=0, column=6, padx=5, pady=5)
 
+        self.btn_export_commands = ctk.CTkButton(self.add_webapp_frame, text="Export Commands", command=self.export_commands, corner_radius=8)
+        self.btn_export_commands.grid(row=0, column=7, padx=5, pady=5)
+
+        self.btn_import_commands = ctk.CTkButton(self.add_webapp_frame, text="Import Commands", command=self.import_commands, corner_radius=8)
+        self.btn_import_commands.grid(row=0, column=8, padx=5, pady=5)
+        self.bulk_job = None # Running viki_bulk.BulkJob, if any
+
         # Flags and threads
         self.listening = False
         self.video_mode = False
@@ -434,14 +569,23 @@ class VikiUI:
         self.listen_thread = None
         self.stop_event = threading.Event()
 
-        # Queue for thread-safe UI updates
-        self.queue = queue.Queue()
+        # Event-driven queue for thread-safe UI updates (wakes the Tk loop on put)
+        self.queue = viki_dispatch.UIDispatcher(self.root, self.handle_ui_action)
 
-        # Start UI update loop
-        self.root.after(100, self.process_queue)
+        # Bounded worker pool that runs user queries (replaces one thread per query)
+        self.executor = viki_tasks.TaskExecutor(max_workers=2, max_pending=16)
 
-        # Load saved custom commands into the treeview
-        self.load_custom_commands()
+        # Warm up slow engines in the background (started once the window is visible);
+        # the controls that need them are enabled as each subsystem comes up
+        self.startup = viki_startup.StartupOrchestrator(
+            on_change=lambda name, state, error: self.queue.put(("subsystem_state", (name, state, error))))
+        self.startup.add("commands", self.load_custom_commands)
+        self.startup.add("tts", self._warm_up_tts)
+        self.startup.add("microphone", viki.calibrate_microphone)
+        self.startup.add("camera", viki_video.probe_camera)
+        self.startup.add("llm", viki.warm_up_gemini)
+        self.startup.add("apps", viki_apps.get_index) # Scan installed applications before the first "open ..."
+        self._apply_readiness_gates()
 
         # Initialize ttk styling for Treeview
         self._setup_treeview_style()
@@ -449,9 +593,9 @@ class VikiUI:
         # Add initial bot message on startup
         initial_bot_message = "Hello! How can I help you today?"
         self.queue.put(("add_message", {"message": initial_bot_message, "sender": "ai"}))
-        viki.speak(initial_bot_message)
-        # Add initial message to viki's chat history for context
-        viki.chat_history.append({"role": "model", "parts": [{"text": initial_bot_message}]})
+        viki.speak(initial_bot_message, self.session)
+        # Add initial message to the session's chat history for context
+        self.session.add_turn("model", initial_bot_message)
 
 
     def _setup_treeview_style(self):
@@ -495,15 +639,11 @@ class VikiUI:
                   foreground=[('selected', ctk.ThemeManager.theme.get("CTkButton", {}).get("text_color", ["#FFFFFF", "#F0F0F0"])[1])] # Selected text (white)
                  )
 
-    def _on_canvas_resize(self, event):
-        # Update the width of the frame inside the canvas when canvas resizes
-        self.chat_canvas.itemconfig(self.canvas_window_id, width=event.width)
-
     def scroll_chat_up(self):
-        self.chat_canvas.yview_scroll(-3, "units")
+        self.chat_view.yview_scroll(-3, "units")
 
     def scroll_chat_down(self):
-        self.chat_canvas.yview_scroll(3, "units")
+        self.chat_view.yview_scroll(3, "units")
 
     def scroll_app_tree_up(self):
         self.app_tree.yview_scroll(-3, "units")
@@ -513,44 +653,62 @@ class VikiUI:
 
 
     def load_custom_commands(self):
-        import json
-        CUSTOM_COMMANDS_FILE = resource_path("custom_commands.json")
+        """
+        Reads the saved custom commands and queues them for the treeview.
+        Safe to call off the Tk thread (the startup warm-up runs it).
+        """
         try:
-            with open(CUSTOM_COMMANDS_FILE, "r") as f:
-                commands = json.load(f)
-            for item in self.app_tree.get_children():
-                self.app_tree.delete(item)
-            for voice_cmd, app_path in commands.items():
-                if app_path.startswith("web://"):
-                    app_name = app_path[len("web://"):]
-                else:
-                    app_name = os.path.basename(app_path)
-                self.app_tree.insert("", "end", values=(app_name, voice_cmd, app_path))
-            self.log_to_chat("Loaded custom commands from file.")
-        except FileNotFoundError:
-            self.log_to_chat("No custom commands file found to load.")
-        except json.JSONDecodeError:
-            self.log_to_chat("Error decoding custom commands file. File might be corrupt.")
-        except Exception as e:
+            commands = viki_commands.get_store().all() # Opens the store (migrating custom_commands.json once)
+        except sqlite3.Error as e:
             self.log_to_chat(f"Error loading custom commands: {e}")
+            raise
+        self.queue.put(("fill_app_tree", commands))
+
+    def _fill_app_tree(self, commands):
+        self.command_tree.sync(commands) # Finishes in idle-time chunks; _on_app_tree_synced reports it
+
+    def _on_app_tree_synced(self, total):
+        self.log_to_chat(f"Loaded {total} custom commands." if total else "No custom commands saved yet.")
+
+    def _update_app_count(self, shown, total):
+        self.app_count_label.configure(text=f"Showing {shown} of {total}" if shown != total else f"{total} commands")
+
+    def _show_command(self, command):
+        """Inserts or refreshes the row of a stored command (rows are keyed by the command id)."""
+        self.command_tree.upsert(command)
+
+    def _warm_up_tts(self):
+        if viki.get_engine() is None:
+            raise RuntimeError("no text-to-speech engine could be started")
+
+    def _apply_readiness_gates(self, subsystem=None):
+        """Enables each gated control once the subsystems it needs have warmed up (or given up)."""
+        for attr, needs in self.READINESS_GATES.items():
+            if subsystem is None or subsystem in needs:
+                getattr(self, attr).configure(state="normal" if self.startup.is_settled(*needs) else "disabled")
+
+    def _on_subsystem_state(self, name, state, error):
+        if state not in (viki_startup.STATE_READY, viki_startup.STATE_FAILED):
+            return
+        self._apply_readiness_gates(name)
+        if state == viki_startup.STATE_FAILED:
+            self.add_message(f"{self.SUBSYSTEM_LABELS.get(name, name)} unavailable: {error}", sender="ai")
 
     def update_status(self, status):
         self.status_label.configure(text=f"Status: {status}")
+        self.queue.mark_applied("update_status", status)
 
     def update_indicator(self, color):
         self.indicator_canvas.itemconfig(self.indicator_oval, fill=color)
+        self.queue.mark_applied("update_indicator", color)
 
     def clear_text(self):
-        for widget in self.messages_frame.winfo_children():
-            widget.destroy()
-        # Clear the chat history in viki.py as well for a fresh start
-        viki.chat_history.clear() # IMPORTANT: Clear viki's chat history too
-        viki.chat_mode = False # Reset chat mode to default
+        self.chat_view.clear()
         self.log_to_chat("Chat cleared.")
-        # Re-add initial bot message to chat history for context
+        # Start the session over too (history and chat mode), keeping the greeting for context
         initial_bot_message = "Hello! How can I help you today?"
         self.queue.put(("add_message", {"message": initial_bot_message, "sender": "ai"}))
-        viki.chat_history.append({"role": "model", "parts": [{"text": initial_bot_message}]})
+        self.session.reset(greeting=initial_bot_message)
 
 
     def browse_path(self):
@@ -567,12 +725,12 @@ class VikiUI:
             if not os.path.isfile(app_path):
                 messagebox.showwarning("Input Error", "Please select a valid file for the application path.")
                 return
-            self.app_tree.insert("", "end", values=(app_name, voice_cmd, app_path))
+            if not self._save_command(None, voice_cmd, app_path, app_name):
+                return
             self.app_entry.delete(0, tk.END)
             self.voice_entry.delete(0, tk.END)
             self.path_entry.delete(0, tk.END)
             self.log_to_chat(f"Added application '{app_name}'")
-            self.save_custom_command(voice_cmd, app_path)
         else:
             messagebox.showwarning("Input Error", "Please enter application name, voice command, and path.")
 
@@ -581,11 +739,11 @@ class VikiUI:
         voice_cmd = self.webapp_voice_entry.get().strip()
         if webapp_name and voice_cmd:
             webapp_path = f"web://{webapp_name}"
-            self.app_tree.insert("", "end", values=(webapp_name, voice_cmd, webapp_path))
+            if not self._save_command(None, voice_cmd, webapp_path, webapp_name):
+                return
             self.webapp_entry.delete(0, tk.END)
             self.webapp_voice_entry.delete(0, tk.END)
             self.log_to_chat(f"Added web application '{webapp_name}'")
-            self.save_custom_command(voice_cmd, webapp_path)
         else:
             messagebox.showwarning("Input Error", "Please enter web application name and voice command.")
 
@@ -638,12 +796,12 @@ class VikiUI:
         voice_cmd = self.voice_entry.get().strip()
         app_path = self.path_entry.get().strip()
         if app_name and voice_cmd and app_path:
-            self.app_tree.item(item, values=(app_name, voice_cmd, app_path))
+            if not self._save_command(item, voice_cmd, app_path, app_name):
+                return
             self.app_entry.delete(0, tk.END)
             self.voice_entry.delete(0, tk.END)
             self.path_entry.delete(0, tk.END)
             self.log_to_chat(f"Updated application '{app_name}'")
-            self.save_all_custom_commands()
             self.btn_add_app.configure(text="Add App", command=self.add_application)
         else:
             messagebox.showwarning("Input Error", "Please enter application name, voice command, and path.")
@@ -653,11 +811,11 @@ class VikiUI:
         voice_cmd = self.webapp_voice_entry.get().strip()
         if webapp_name and voice_cmd:
             webapp_path = f"web://{webapp_name}"
-            self.app_tree.item(item, values=(webapp_name, voice_cmd, webapp_path))
+            if not self._save_command(item, voice_cmd, webapp_path, webapp_name):
+                return
             self.webapp_entry.delete(0, tk.END)
             self.webapp_voice_entry.delete(0, tk.END)
             self.log_to_chat(f"Updated web application '{webapp_name}'")
-            self.save_all_custom_commands()
             self.btn_add_webapp.configure(text="Add Web App", command=self.add_web_application)
         else:
             messagebox.showwarning("Input Error", "Please enter web application name and voice command.")
@@ -673,9 +831,8 @@ class VikiUI:
             messagebox.showwarning("Data Error", "Selected item does not have valid data.")
             return
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete application '{values[0]}'?"):
-            self.app_tree.delete(item)
-            self.log_to_chat(f"Deleted application '{values[0]}'")
-            self.save_all_custom_commands()
+            if self._delete_command(item):
+                self.log_to_chat(f"Deleted application '{values[0]}'")
 
     def delete_selected_web_application(self):
         selected = self.app_tree.selection()
@@ -691,59 +848,107 @@ class VikiUI:
             messagebox.showwarning("Selection Error", "Selected item is not a web application.")
             return
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete web application '{values[0]}'?"):
-            self.app_tree.delete(item)
-            self.log_to_chat(f"Deleted web application '{values[0]}'")
-            self.save_all_custom_commands()
+            if self._delete_command(item):
+                self.log_to_chat(f"Deleted web application '{values[0]}'")
 
 
-    def save_all_custom_commands(self):
+    def _save_command(self, item, voice_cmd, app_path, app_name):
+        """
+        Writes one command to the store (a new one if item is None, else the row's
+        command) and refreshes its row. Returns False if nothing was saved.
+        """
+        store = viki_commands.get_store()
         try:
-            import json
-            CUSTOM_COMMANDS_FILE = resource_path("custom_commands.json")
-            commands = {}
-            for item in self.app_tree.get_children():
-                values = self.app_tree.item(item, "values")
-                if len(values) == 3:
-                    voice_cmd = values[1]
-                    app_path = values[2]
-                    commands[voice_cmd] = app_path
-            with open(CUSTOM_COMMANDS_FILE, "w", encoding="utf-8") as f:
-                json.dump(commands, f, indent=4)
-            self.log_to_chat("Saved all custom commands.")
-            self.save_commands_to_txt()
-        except Exception as e:
-            self.log_to_chat(f"Error saving all custom commands: {e}")
+            if item is None:
+                command = store.upsert(voice_cmd, app_path, app_name) # Same voice command: replaces that entry
+            else:
+                command = store.update(int(item), voice_cmd, app_path, app_name)
+        except sqlite3.IntegrityError:
+            messagebox.showwarning("Input Error", f"Another application already uses the voice command '{voice_cmd}'.")
+            return False
+        except sqlite3.Error as e:
+            self.log_to_chat(f"Error saving custom command: {e}")
+            return False
+        if command is None: # Deleted by someone else in the meantime
+            if item is not None:
+                self.command_tree.remove(int(item))
+            self.log_to_chat(f"The command '{voice_cmd}' no longer exists.")
+            return False
+        self._show_command(command)
+        return True
 
-    def save_custom_command(self, voice_cmd, app_path):
+    def _delete_command(self, item):
         try:
-            import json
-            CUSTOM_COMMANDS_FILE = resource_path("custom_commands.json")
-            try:
-                with open(CUSTOM_COMMANDS_FILE, "r") as f:
-                    commands = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                commands = {}
-            commands[voice_cmd] = app_path
-            with open(CUSTOM_COMMANDS_FILE, "w", encoding="utf-8") as f:
-                json.dump(commands, f, indent=4)
-            self.log_to_chat(f"Saved custom command '{voice_cmd}'")
-            self.save_commands_to_txt()
-        except Exception as e:
-            self.log_to_chat(f"Error saving single custom command: {e}")
+            viki_commands.get_store().delete(int(item))
+        except sqlite3.Error as e:
+            self.log_to_chat(f"Error deleting custom command: {e}")
+            return False
+        self.command_tree.remove(int(item))
+        return True
 
-    def save_commands_to_txt(self):
-        try:
-            CUSTOM_COMMANDS_TXT = resource_path("custom_commands.txt")
-            with open(CUSTOM_COMMANDS_TXT, "w", encoding="utf-8") as f:
-                for item in self.app_tree.get_children():
-                    values = self.app_tree.item(item, "values")
-                    if len(values) == 3:
-                        voice_cmd = values[1]
-                        app_path = values[2]
-                        f.write(f"{voice_cmd} : {app_path}\n")
-            self.log_to_chat("Saved commands to custom_commands.txt")
-        except Exception as e:
-            self.log_to_chat(f"Error saving commands to txt: {e}")
+    BULK_FILE_TYPES = [("JSON", "*.json"), ("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Text", "*.txt")]
+
+    def export_commands(self):
+        """Writes the stored commands to a JSON, CSV or TXT file chosen by the user, in the background."""
+        if self.bulk_job is not None:
+            self.bulk_job.cancel()
+            return
+        path = filedialog.asksaveasfilename(title="Export Custom Commands", initialfile="custom_commands.json",
+                                            defaultextension=".json", filetypes=self.BULK_FILE_TYPES)
+        if path:
+            self._start_bulk_job(viki_bulk.export_commands, path, "Export", self.btn_export_commands)
+
+    def import_commands(self):
+        """Adds the commands of a JSON, CSV or TXT file in the background; existing voice commands are replaced."""
+        if self.bulk_job is not None:
+            self.bulk_job.cancel()
+            return
+        path = filedialog.askopenfilename(title="Import Custom Commands",
+                                          filetypes=self.BULK_FILE_TYPES + [("All files", "*.*")])
+        if path:
+            self._start_bulk_job(viki_bulk.import_commands, path, "Import", self.btn_import_commands)
+
+    def _start_bulk_job(self, fn, path, verb, button):
+        name = os.path.basename(path)
+
+        def on_progress(report):
+            # Worker thread; update_status is coalesced, so fast batches don't flood the UI queue
+            self.queue.put(("update_status", f"{verb}ing commands: {report.fraction:.0%} ({report.written} done, {report.invalid} skipped)"))
+
+        def on_done(report, error):
+            commands = None
+            if fn is viki_bulk.import_commands:
+                try:
+                    commands = viki_commands.get_store().all() # Earlier batches are kept even if the import stopped
+                except sqlite3.Error:
+                    pass
+            self.queue.put(("bulk_done", (verb, name, report, error, commands)))
+
+        for other in (self.btn_import_commands, self.btn_export_commands):
+            other.configure(state="normal" if other is button else "disabled")
+        button.configure(text=f"Cancel {verb}")
+        self.log_to_chat(f"{verb}ing custom commands {'from' if verb == 'Import' else 'to'} {name}...")
+        self.bulk_job = viki_bulk.BulkJob(fn, path, on_progress=on_progress, on_done=on_done).start()
+
+    def _finish_bulk_job(self, verb, name, report, error, commands):
+        self.bulk_job = None
+        self.btn_import_commands.configure(text="Import Commands", state="normal")
+        self.btn_export_commands.configure(text="Export Commands", state="normal")
+        self.update_status("Idle")
+        if commands is not None:
+            self.command_tree.sync(commands)
+        if error is not None:
+            self.log_to_chat(f"{verb} of {name} {'was cancelled' if error == 'cancelled' else f'failed: {error}'}.")
+            return
+        if verb == "Export":
+            self.log_to_chat(f"Exported {report.written} commands to {name}")
+            return
+        message = f"Imported {report.written} of {report.read} commands from {name} in {report.elapsed:.1f}s."
+        if report.invalid:
+            shown = "; ".join(f"#{number}: {text}" for number, text in report.errors[:5])
+            more = f" (+{report.invalid - 5} more)" if report.invalid > 5 else ""
+            message += f" Skipped {report.invalid}: {shown}{more}"
+        self.log_to_chat(message)
 
     def toggle_listening(self):
         if self.listening:
@@ -771,7 +976,7 @@ class VikiUI:
             self.update_status("Idle")
             self.update_indicator("gray")
             self.stop_event.set()
-            viki.stop_current_speech() # Ensure any ongoing speech also stops
+            viki.stop_current_speech(self.session) # Ensure any ongoing speech also stops
             self.log_to_chat("Listening stopped.")
 
     def log_to_chat(self, message):
@@ -779,83 +984,19 @@ class VikiUI:
 
     def add_message(self, message, sender="user"):
         """
-        Adds a message bubble to the chat canvas.
+        Adds a message bubble to the chat transcript.
         Messages are styled differently based on the sender (user or AI).
+        Only the bubbles in view get widgets, so long conversations stay cheap.
         """
-        def safe_get_color(theme_dict, key, default):
-            try:
-                return theme_dict[key][0]
-            except (KeyError, IndexError, TypeError):
-                return default
-
-        # Determine colors from the current theme for message bubbles
-        if sender == "user":
-            ctk_button_theme = ctk.ThemeManager.theme.get("CTkButton", {})
-            bg_color = safe_get_color(ctk_button_theme, "fg_color", "#0078D7")
-            text_color = safe_get_color(ctk_button_theme, "text_color", "#FFFFFF")
-            hover_color = safe_get_color(ctk_button_theme, "hover_color", "#005A9E")
-            pack_anchor = "e" # Align to the right for user messages
-            pack_padx = (50, 10) # More padding on left for user messages
-        else: # sender == "ai" (chatbot)
-            ctk_segmented_theme = ctk.ThemeManager.theme.get("CTkSegmentedButton", {})
-            ctk_button_theme = ctk.ThemeManager.theme.get("CTkButton", {})
-            bg_color = safe_get_color(ctk_segmented_theme, "selected_color", "#A0A0A0")
-            text_color = safe_get_color(ctk_button_theme, "text_color", "#F0F0F0")
-            hover_color = safe_get_color(ctk_segmented_theme, "selected_hover_color", "#909090")
-            pack_anchor = "w" # Align to the left for AI messages
-            pack_padx = (10, 50) # More padding on right for AI messages
-
-        # Create a CustomTkinter frame for the message bubble
-        bubble_frame = ctk.CTkFrame(self.messages_frame, fg_color="transparent")
-        # Pack the frame, allowing it to expand horizontally and anchor it
-        bubble_frame.pack(fill=tk.X, padx=pack_padx, pady=2, anchor=pack_anchor) # Less vertical padding between bubbles
-
-        # Create a CustomTkinter label to hold the message text
-        msg_label = ctk.CTkLabel(bubble_frame, text=message,
-                                 bg_color=bg_color,      # Background color of the bubble
-                                 text_color=text_color,   # Text color inside the bubble
-                                 font=("Segoe UI", 12),
-                                 wraplength=400,          # Wrap text after 400 pixels width
-                                 justify=tk.LEFT,         # Left-justify text within the label
-                                 corner_radius=10,        # Apply rounded corners to the bubble
-                                 padx=15, pady=10)        # Internal padding for the text
-        # Pack the message label within its bubble frame, aligning left or right
-        msg_label.pack(side=tk.LEFT if sender=="ai" else tk.RIGHT, expand=False, fill=tk.BOTH)
-
-        # Add subtle hover effects to the message bubbles for a dynamic feel
-        msg_label.bind("<Enter>", lambda e: msg_label.configure(bg_color=hover_color))
-        msg_label.bind("<Leave>", lambda e: msg_label.configure(bg_color=bg_color))
-
-        # Auto-scroll the chat canvas to the bottom to show the latest message
-        self.chat_canvas.update_idletasks() # Ensure all pending UI updates are processed
-        self.chat_canvas.yview_moveto(1.0) # Scroll to the very bottom (1.0 means 100%)
+        self.chat_view.append(message, sender)
 
 
     def add_image_message(self, image_path, sender="ai"):
         try:
             full_image_path = resource_path(image_path)
-            img = PIL.Image.open(full_image_path)
-            max_width = 400
-            max_height = 300
-            img.thumbnail((max_width, max_height), PIL.Image.Resampling.LANCZOS)
-            imgtk = PIL.ImageTk.PhotoImage(img)
-
-            bubble_frame = ctk.CTkFrame(self.messages_frame, fg_color="transparent")
-            if sender == "user":
-                pack_anchor = "e"
-                pack_padx = (50, 10)
-            else:
-                pack_anchor = "w"
-                pack_padx = (10, 50)
-
-            bubble_frame.pack(fill=tk.X, padx=pack_padx, pady=2, anchor=pack_anchor)
-
-            img_label = ctk.CTkLabel(bubble_frame, image=imgtk, text="") # Use CTkLabel
-            img_label.image = imgtk
-            img_label.pack(anchor=pack_anchor)
-
-            self.chat_canvas.update_idletasks()
-            self.chat_canvas.yview_moveto(1.0)
+            if not os.path.isfile(full_image_path):
+                raise FileNotFoundError(full_image_path)
+            self.chat_view.append_image(full_image_path, sender)
         except Exception as e:
             self.log_to_chat(f"Error displaying image: {e}")
 
@@ -870,33 +1011,38 @@ class VikiUI:
         """
         Continuously listens for user speech, handling interruptions if the bot is speaking.
         """
+        import speech_recognition as sr
+
         while not self.stop_event.is_set():
             try:
                 # Update status and indicator based on whether bot is speaking
-                if not viki.is_speaking_event.is_set():
-                    self.queue.put(("update_status", f"Listening in {viki.get_lang_display_name(viki.current_language)}..."))
+                if not self.session.is_speaking():
+                    self.queue.put(("update_status", f"Listening in {viki.get_lang_display_name(self.session.language)}..."))
                     self.queue.put(("update_indicator", "green"))
                 else:
                     self.queue.put(("update_status", "Bot speaking, listening for interruption..."))
                     self.queue.put(("update_indicator", "yellow")) # Yellow to indicate listening while speaking
 
                 # Listen for a short duration to be responsive to interruptions
-                query = viki.recognize_speech(timeout=0.5) # Listen for a short duration
+                interaction = viki_trace.begin_interaction("voice")
+                query = viki.recognize_speech(timeout=0.5, session=self.session) # Listen for a short duration
+                if not query:
+                    viki_trace.end_interaction(interaction, discard=True) # Nothing was said; don't skew the stats
 
                 if query:
                     # Check if the bot is currently speaking and if the query is an interruption
-                    interruption_phrases = ["ok i got it", "ok done", "okay done", "alright done", "stop", "shush", "quiet", "cancel", "hold on", "enough"]
-                    is_interruption = any(phrase in query.lower() for phrase in interruption_phrases)
+                    is_interruption = viki.is_interruption(query)
 
-                    if viki.is_speaking_event.is_set() and is_interruption:
+                    if self.session.is_speaking() and is_interruption:
                         self.queue.put(("add_message", {"message": query, "sender": "user"}))
                         interruption_ack = "Okay, I'm stopping."
                         self.queue.put(("log_to_chat", "Bot: " + interruption_ack)) # Log acknowledgment to UI
-                        viki.stop_current_speech() # IMMEDIATELY stop ongoing speech
+                        self.executor.cancel_all(lanes=(viki_tasks.LANE_COMMAND, viki_tasks.LANE_LLM)) # Drop queued/running answers
+                        viki.stop_current_speech(self.session) # IMMEDIATELY stop ongoing speech
                         # Clear speaking event and stop event to reset state
-                        viki.is_speaking_event.clear()
-                        viki._stop_speaking_event.clear()
-                        viki.speak(interruption_ack) # Speak the acknowledgment (new, short speech)
+                        self.session.speech.is_speaking.clear()
+                        self.session.speech.stop.clear()
+                        viki.speak(interruption_ack, self.session) # Speak the acknowledgment (new, short speech)
                         self.queue.put(("update_status", "Idle"))
                         self.queue.put(("update_indicator", "gray"))
                         continue # Skip further processing of this interruption query as a new command
@@ -906,14 +1052,14 @@ class VikiUI:
                     self.queue.put(("update_status", "Processing..."))
                     self.queue.put(("update_indicator", "orange"))
                     # Cancel all ongoing tasks before starting new task
-                    self.cancel_all_tasks()
-                    # Perform task in a separate thread and handle its return value
-                    threading.Thread(target=self._perform_task_and_display, args=(query,), daemon=True).start()
+                    self.cancel_all_tasks(query)
+                    # Perform task on the task executor and handle its return value
+                    self.submit_query(query, interaction)
                 # If no query and no exception, it means timeout occurred, just loop again.
 
             except sr.UnknownValueError:
                 # Only log/display if the bot wasn't speaking, to avoid spamming "didn't catch that"
-                if not viki.is_speaking_event.is_set():
+                if not self.session.is_speaking():
                     self.queue.put(("add_message", {"message": "Sorry, I didn't catch that.", "sender": "ai"}))
                 self.queue.put(("update_status", "Idle"))
                 self.queue.put(("update_indicator", "gray"))
@@ -930,31 +1076,77 @@ class VikiUI:
                 self.queue.put(("update_indicator", "gray"))
 
 
-    def _perform_task_and_display(self, query):
+    def submit_query(self, query, interaction=None):
+        """
+        Queues a user query on the task executor, in the lane matching its kind.
+        Identical queries that are still waiting are only run once. `interaction`
+        (the traced interaction, if any) follows the query onto the worker thread;
+        it is discarded when the query is rejected or merged into a waiting one.
+        """
+        if viki.is_interruption(query):
+            lane = viki_tasks.LANE_INTERRUPT
+        elif self.session.chat_mode:
+            lane = viki_tasks.LANE_LLM
+        else:
+            lane = viki_tasks.LANE_COMMAND
+        try:
+            handle = self.executor.submit(self._perform_task_and_display, query, interaction, time.perf_counter(),
+                                          lane=lane, key=query.lower().strip())
+        except queue.Full:
+            viki_trace.end_interaction(interaction, discard=True)
+            self.log_to_chat("I'm still working on your previous requests. Please wait a moment.")
+            self.queue.put(("update_status", "Busy"))
+            return None
+        if interaction is not None and handle.args[1] is not interaction:
+            viki_trace.end_interaction(interaction, discard=True) # Deduplicated: the waiting task keeps its own
+        pending = self.executor.metrics()["pending_total"]
+        if pending:
+            self.queue.put(("update_status", f"Processing... ({pending} queued)"))
+        return handle
+
+    def _perform_task_and_display(self, query, interaction=None, queued_at=None):
         """
         Helper function to call viki.perform_task and then queue its response
         for display and for speaking. This is the centralized point for speech output
         of the MAIN response.
         """
-        response_text = viki.perform_task(query) # viki.perform_task now ONLY returns the text
+        with viki_trace.bind(interaction):
+            if queued_at is not None:
+                viki_trace.record("task_queue_wait", (time.perf_counter() - queued_at) * 1000)
+            self._run_query(query)
+
+    def _run_query(self, query):
+        response_text = viki.perform_task(query, self.session) # viki.perform_task now ONLY returns the text
+
+        task = viki_tasks.current_task()
+        if task is not None and task.cancelled:
+            # The task was cancelled while it was running, so its answer is stale
+            response_text = None
 
         if response_text == "exit_command":
+            viki_trace.end_interaction()
             self.queue.put(("log_to_chat", "Bot: Received exit command. Shutting down."))
             self.root.quit() # Properly quit the Tkinter mainloop
             return
+        elif response_text == "save_replay":
+            self.queue.put(("save_replay", None)) # The replay buffer lives on the UI side
         elif response_text == "interrupted":
             # This case means an interruption phrase was recognized.
             # viki.stop_current_speech() was already called and acknowledgment spoken by listen_loop.
             pass
         elif response_text: # If there's a valid response text
             self.queue.put(("add_message", {"message": response_text, "sender": "ai"}))
-            viki.speak(response_text) # Call viki.speak ONLY from here for main responses
+            viki.speak(response_text, self.session) # Call viki.speak ONLY from here for main responses; the speech thread ends the interaction
+        if not response_text or response_text in ("save_replay", "interrupted"):
+            viki_trace.end_interaction() # Nothing will be spoken
         
         self.queue.put(("update_status", "Idle"))
         self.queue.put(("update_indicator", "gray"))
 
 
     def video_loop(self):
+        import cv2
+
         cap = cv2.VideoCapture(0)
         if not cap.isOpened():
             self.queue.put(("log_to_chat", "Error: Cannot open webcam. Make sure it's connected and not in use."))
@@ -965,30 +1157,71 @@ class VikiUI:
             self.queue.put(("hide_video_label", None)) # Hide label if webcam fails
             return
 
+        width, height = self.frame_size
+        mode = viki_video.negotiate_camera_mode(cap, width, height, self.camera_fps, self.camera_pixel_format)
+        self.camera_mode = mode
+        self.queue.put(("log_to_chat", f"Camera mode: {mode['width']}x{mode['height']} at {mode['fps']:g} fps"
+                                       f"{' (' + mode['pixel_format'] + ')' if mode['pixel_format'] else ''}."))
+        # Only resize when the camera could not deliver the display size itself
+        needs_resize = (mode["width"], mode["height"]) != self.frame_size
+        pacer = viki_video.FramePacer(mode["fps"])
+        self.capture_rate.reset()
+        self.record_rate.reset()
+
         # Ensure video_label is shown when video mode starts
         self.queue.put(("show_video_label", None))
         self.queue.put(("hide_indicator_canvas", None)) # Hide indicator if video is showing
 
+        if self.frame_ring is None:
+            self.frame_ring = viki_video.FrameRing(10, width, height) # Headroom for slots pinned by the photo writer
+        ring = self.frame_ring
+        frame = None # Capture buffer, reused by cap.read() when the backend supports it
+        if self.replay_buffer is None:
+            self.replay_buffer = viki_recorder.ReplayBuffer(seconds=self.replay_seconds)
+        self.replay_buffer.clear() # Don't stitch a previous video session into the replay
+        replay = self.replay_buffer
+
         while self.video_mode and not self.stop_event.is_set():
-            ret, frame = cap.read()
+            ret, frame = cap.read(frame)
+            captured_at = time.monotonic()
             if not ret:
                 self.queue.put(("log_to_chat", "Failed to grab frame."))
                 break
-            # Resize frame to 640x480 for display and recording consistency
-            frame_resized = cv2.resize(frame, (640, 480))
-            cv2image = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-            self.current_frame = cv2image # Store current frame for photo capture
-
-            # Display frame on Tkinter label
-            pil_image = PIL.Image.fromarray(cv2image)
-            imgtk = PIL.ImageTk.PhotoImage(image=pil_image)
-            self.queue.put(("update_video_frame", imgtk)) # Use queue for thread-safe update
-
-            if self.recording and self.video_writer:
-                self.video_writer.write(frame_resized) # Write BGR frame
-
-            time.sleep(0.03) # ~30 fps
+            self.capture_rate.tick(captured_at)
+            slot = ring.acquire()
+            if slot is None:
+                continue # Every slot is still in use; skip this frame rather than allocate
+            # Resize to the display/recording size and convert, writing into the slot's buffers
+            if needs_resize or frame.shape[1::-1] != self.frame_size:
+                cv2.resize(frame, self.frame_size, dst=slot.bgr)
+            else:
+                slot.bgr[...] = frame # Native mode: a plain copy into the slot
+            cv2.cvtColor(slot.bgr, cv2.COLOR_BGR2RGB, dst=slot.rgb)
+            pipeline = self.face_pipeline
+            if pipeline is not None:
+                # Inference runs on a worker every few frames; boxes in between come from the tracker
+                boxes = pipeline.process(slot, ring)
+                if boxes:
+                    viki_detect.draw_boxes(slot.rgb, boxes) # Preview only; recordings use slot.bgr
+            # Convert on this worker thread; the Tk thread only pastes the newest frame
+            slot.load_pil()
+            ring.publish(slot, captured_at) # Latest frame, used for photo capture
+            replay.add(slot, ring, captured_at) # JPEG-compressed on the replay thread
+
+            ring.pin(slot) # Released by the preview once displayed (or when overwritten)
+            self.preview_mailbox.put(slot, captured_at)
+
+            writer = self.video_writer # Local reference; stop_recording may clear it meanwhile
+            if self.recording and writer:
+                writer.write(slot.bgr, captured_at) # Copied into the encoder's shared memory
+                self.record_rate.tick(captured_at)
+
+            # Sleep only for what is left of this frame's interval (the camera read usually
+            # blocks for most of it); a slow frame does not push every later frame back
+            pacer.wait(self.stop_event)
         cap.release()
+        log.debug("Capture stopped", extra={"frames": self.capture_rate.count, "late": pacer.late,
+                                            "skipped_busy": ring.overruns})
         self.queue.put(("hide_video_label", None)) # Hide label when video stops
         self.queue.put(("show_indicator_canvas", None)) # Show indicator when video stops
         if self.recording:
@@ -998,69 +1231,157 @@ class VikiUI:
         self.queue.put(("update_capture_button_state", "disabled"))
 
 
-    def process_queue(self):
-        while True:
-            try:
-                item = self.queue.get_nowait()
-                action = item[0]
-                data = item[1]
-
-                if action == "log_to_chat":
-                    self.add_message(data, sender="ai") # Always from AI for system messages
-                elif action == "add_message":
-                    self.add_message(data["message"], data["sender"])
-                elif action == "update_status":
-                    self.update_status(data)
-                elif action == "update_indicator":
-                    self.update_indicator(data)
-                elif action == "update_video_button_text":
-                    self.btn_video.configure(text=data)
-                elif action == "update_record_buttons_state":
-                    self.btn_start_record.configure(state=data)
-                    self.btn_stop_record.configure(state="normal" if data=="normal" else "disabled")
-                elif action == "update_capture_button_state":
-                    self.btn_capture_photo.configure(state=data)
-                elif action == "update_video_frame":
-                    self.video_label.imgtk = data # Update image on main thread
-                    self.video_label.configure(image=data)
-                elif action == "show_video_label":
-                    self.video_label.grid() # Show the video label
-                elif action == "hide_video_label":
-                    self.video_label.grid_remove() # Hide the video label
-                elif action == "show_indicator_canvas":
-                    self.indicator_canvas.grid() # Show the indicator
-                elif action == "hide_indicator_canvas":
-                    self.indicator_canvas.grid_remove() # Hide the indicator
-                elif action == "stop_recording_via_queue":
-                    self.stop_recording() # Call stop_recording on main thread
-
-            except queue.Empty:
-                break
-        self.root.after(100, self.process_queue)
+    def handle_ui_action(self, action, data):
+        """
+        Applies one queued UI action. Called on the Tk thread by the UI dispatcher.
+        """
+        if action == "log_to_chat":
+            self.add_message(data, sender="ai") # Always from AI for system messages
+        elif action == "add_message":
+            self.add_message(data["message"], data["sender"])
+        elif action == "update_status":
+            self.update_status(data)
+        elif action == "update_indicator":
+            self.update_indicator(data)
+        elif action == "update_video_button_text":
+            self.btn_video.configure(text=data)
+        elif action == "update_record_buttons_state":
+            self.btn_start_record.configure(state=data)
+            self.btn_stop_record.configure(state="normal" if data=="normal" else "disabled")
+        elif action == "update_capture_button_state":
+            self.btn_capture_photo.configure(state=data)
+            self.btn_burst_photo.configure(state=data)
+        elif action == "show_video_label":
+            self.video_label.grid() # Show the video label
+            self.video_fps_label.grid()
+        elif action == "hide_video_label":
+            self.video_label.grid_remove() # Hide the video label
+            self.video_fps_label.grid_remove()
+        elif action == "show_indicator_canvas":
+            self.indicator_canvas.grid() # Show the indicator
+        elif action == "hide_indicator_canvas":
+            self.indicator_canvas.grid_remove() # Hide the indicator
+        elif action == "stop_recording_via_queue":
+            self.stop_recording() # Call stop_recording on main thread
+        elif action == "save_replay":
+            self.save_replay()
+        elif action == "subsystem_state":
+            self._on_subsystem_state(*data)
+        elif action == "fill_app_tree":
+            self._fill_app_tree(data)
+        elif action == "bulk_done":
+            self._finish_bulk_job(*data)
 
 
     def send_command(self, event=None):
+        if not self.startup.is_settled(*self.READINESS_GATES["btn_send"]):
+            self.update_status("Still starting up...") # <Return> bypasses the disabled Send button
+            return
         command = self.entry.get().strip()
         if command:
             self.add_message(command, sender="user")
             self.entry.delete(0, tk.END)
 
             # Check if the command is an interruption phrase
-            interruption_phrases = ["ok i got it", "ok done", "okay done", "alright done", "stop", "shush", "quiet", "cancel", "hold on", "enough"]
-            if any(phrase in command.lower() for phrase in interruption_phrases):
-                viki.stop_current_speech()
+            if viki.is_interruption(command):
+                self.executor.cancel_all(lanes=(viki_tasks.LANE_COMMAND, viki_tasks.LANE_LLM))
+                viki.stop_current_speech(self.session)
                 self.update_status("Idle")
                 self.update_indicator("gray")
                 self.log_to_chat("Speech interrupted by user command.")
                 return
 
             # Cancel all ongoing tasks before starting new task
-            self.cancel_all_tasks()
+            self.cancel_all_tasks(command)
+            interaction = viki_trace.begin_interaction("text", bind_thread=False)
             self.update_status("Processing command...")
             self.update_indicator("orange")
             # Using _perform_task_and_display to handle response
-            threading.Thread(target=self._perform_task_and_display, args=(command,), daemon=True).start()
-
+            self.submit_query(command, interaction)
+
+
+    def start_preview(self):
+        """Starts pulling frames from the preview mailbox on the Tk thread."""
+        self.preview_mailbox.clear()
+        self.preview_mailbox.reset_stats()
+        self.display_rate.reset()
+        if self._preview_job is None:
+            self._preview_job = self.root.after(self.preview_interval_ms, self._display_preview_frame)
+
+    def stop_preview(self):
+        if self._preview_job is not None:
+            self.root.after_cancel(self._preview_job)
+            self._preview_job = None
+        self.preview_mailbox.clear()
+        stats = self.preview_mailbox.stats()
+        log.debug("Preview stopped", extra=stats)
+        if self.face_pipeline is not None:
+            log.debug("Face detection stats", extra=self.face_pipeline.stats())
+
+    def _display_preview_frame(self):
+        """Shows the newest captured frame, if any, then reschedules itself."""
+        item = self.preview_mailbox.take()
+        if item is not None:
+            slot, captured_at = item
+            pil_image = slot.pil
+            if self.preview_photo is None or (self.preview_photo.width(), self.preview_photo.height()) != pil_image.size:
+                self.preview_photo = PIL.ImageTk.PhotoImage(image=pil_image)
+                self.video_label.configure(image=self.preview_photo)
+            else:
+                self.preview_photo.paste(pil_image) # Reuse the Tk image instead of allocating a new one
+            self.frame_ring.unpin(slot)
+            self.preview_mailbox.mark_displayed(captured_at)
+            self.display_rate.tick()
+        self._update_fps_label()
+        if self.video_mode:
+            self._preview_job = self.root.after(self.preview_interval_ms, self._display_preview_frame)
+        else:
+            self._preview_job = None
+
+    def video_fps(self):
+        """Achieved capture, display and record frame rates over the last couple of seconds."""
+        return {
+            "capture": round(self.capture_rate.rate(), 1),
+            "display": round(self.display_rate.rate(), 1),
+            "record": round(self.record_rate.rate(), 1) if self.recording else 0.0,
+        }
+
+    def _update_fps_label(self):
+        now = time.monotonic()
+        if now - self._fps_label_updated < 0.5:
+            return
+        self._fps_label_updated = now
+        fps = self.video_fps()
+        text = f"Capture {fps['capture']:.1f} fps | Display {fps['display']:.1f} fps"
+        if self.recording:
+            text += f" | Record {fps['record']:.1f} fps"
+        self.video_fps_label.configure(text=text)
+
+    def toggle_face_detection(self):
+        if self.face_detection_var.get():
+            if self.face_detector is None:
+                prototxt_path = resource_path(viki_detect.PROTOTXT_FILE)
+                weights_path = resource_path(viki_detect.WEIGHTS_FILE)
+                missing = viki_detect.FaceDetector.missing_files(prototxt_path, weights_path)
+                if missing:
+                    self.log_to_chat(f"Face detection needs the model files: {', '.join(missing)}")
+                    self.face_detection_var.set(False)
+                    return
+                try:
+                    self.face_detector = viki_detect.FaceDetector(prototxt_path, weights_path)
+                except Exception as e:
+                    self.log_to_chat(f"Failed to load face detection model: {e}")
+                    self.face_detection_var.set(False)
+                    return
+            self.face_pipeline = viki_detect.DetectionPipeline(self.face_detector, every_n=5)
+            self.log_to_chat("Face detection enabled.")
+        elif self.face_pipeline is not None:
+            pipeline = self.face_pipeline
+            self.face_pipeline = None
+            pipeline.shutdown()
+            stats = pipeline.stats()
+            self.log_to_chat(f"Face detection disabled. Inference {stats['inference_avg_ms']} ms per frame, "
+                             f"{stats['detection_rate_hz']} detections per second.")
 
     def toggle_video_mode(self):
         self.video_mode = not self.video_mode
@@ -1069,8 +1390,10 @@ class VikiUI:
             self.stop_event.clear()
             self.video_thread = threading.Thread(target=self.video_loop, daemon=True)
             self.video_thread.start()
+            self.start_preview()
             self.btn_start_record.configure(state="normal")
             self.btn_capture_photo.configure(state="normal")
+            self.btn_burst_photo.configure(state="normal")
             self.log_to_chat("Video mode started.")
         else:
             self.btn_video.configure(text="Toggle Video Mode")
@@ -1078,8 +1401,10 @@ class VikiUI:
             self.btn_start_record.configure(state="disabled")
             self.btn_stop_record.configure(state="disabled")
             self.btn_capture_photo.configure(state="disabled")
+            self.btn_burst_photo.configure(state="disabled")
             if self.recording:
                 self.stop_recording()
+            self.stop_preview()
             self.log_to_chat("Video mode stopped.")
 
 
@@ -1093,10 +1418,9 @@ class VikiUI:
                 if os.path.exists(self.click_sound_path):
                     winsound.PlaySound(self.click_sound_path, winsound.SND_FILENAME | winsound.SND_ASYNC)
                 else:
-                    print(f"Warning: Click sound file not found at {self.click_sound_path}")
+                    log.warning("Click sound file not found at %s", self.click_sound_path)
             except Exception as e:
-                print(f"Error playing click sound: {e}") # Debugging
-                pass # Ignore sound errors
+                log.debug("Error playing click sound: %s", e) # Ignore sound errors
 
         # Iterate through all widgets and bind them
         def bind_recursively(widget):
@@ -1118,12 +1442,16 @@ class VikiUI:
             self.btn_toggle_theme.configure(text="Switch to Dark Mode")
         # Update Treeview style to match new theme colors
         self._setup_treeview_style()
+        # Re-color the chat bubbles currently on screen
+        self.chat_view.refresh()
 
 
     def start_recording(self):
+        if self.camera_manager is not None:
+            self._start_multi_recording()
+            return
         if not self.video_mode or self.recording:
             return
-        fourcc = None
         ext = self.video_format_var.get()
         # Define the output path for recordings
         output_dir = "recordings"
@@ -1134,25 +1462,36 @@ class VikiUI:
         filename = os.path.join(output_dir, f"viki_recording_{timestamp}.{ext}")
 
         if ext == "mp4":
-            fourcc = cv2.VideoWriter_fourcc(*"mp4v") # For .mp4
+            fourcc = "mp4v" # For .mp4
         elif ext == "avi":
-            fourcc = cv2.VideoWriter_fourcc(*"XVID") # For .avi
+            fourcc = "XVID" # For .avi
         else:
             self.log_to_chat(f"Unsupported video format: {ext}")
             return
         
-        # Get frame width and height from the captured frame
-        if self.current_frame is not None:
-            height, width, _ = self.current_frame.shape
-        else:
-            # Fallback if no frame is available (shouldn't happen if video_mode is active)
-            width, height = 640, 480 # Default to 640x480
+        motion = self.motion_recording_var.get()
+        if motion:
+            try:
+                pre_roll_s, post_roll_s = viki_recorder.parse_roll(self.motion_roll_var.get())
+            except ValueError as e:
+                self.log_to_chat(f"Invalid pre/post-roll (use seconds like \"1 / 3\"): {e}")
+                return
 
-        self.video_writer = cv2.VideoWriter(filename, fourcc, 30.0, (width, height))
-        if not self.video_writer.isOpened():
-            self.log_to_chat("Failed to open video writer. Check codecs or file path permissions.")
-            self.video_writer = None
+        # Frames are always resized to frame_size before they reach the encoder
+        width, height = self.frame_size
+
+        # Encoding runs in a separate process; frames are timestamped so the file plays at real speed
+        # The stream is written at the camera's negotiated rate; gaps are filled from the timestamps
+        fps = self.camera_mode["fps"] if self.camera_mode else self.camera_fps
+        writer = viki_recorder.EncoderWorker(filename, fourcc, fps, (width, height))
+        if motion:
+            sensitivity = viki_recorder.MOTION_SENSITIVITIES[self.motion_sensitivity_var.get()]
+            writer = viki_recorder.MotionRecorder(writer, sensitivity, pre_roll_s, post_roll_s)
+        if not writer.start():
+            self.log_to_chat(writer.error or "Failed to open video writer. Check codecs or file path permissions.")
             return
+        self.video_writer = writer
+        self.record_rate.reset()
         self.recording = True
         self.btn_start_record.configure(state="disabled")
         self.btn_stop_record.configure(state="normal")
@@ -1161,37 +1500,262 @@ class VikiUI:
     def stop_recording(self):
         if not self.recording:
             return
+        if self.camera_manager is not None:
+            self._stop_multi_recording()
+            return
         self.recording = False
-        if self.video_writer:
-            self.video_writer.release()
-            self.video_writer = None
+        writer = self.video_writer
+        self.video_writer = None
+        if writer:
+            # Flushing the encoder can take a moment, so do it off the Tk thread
+            threading.Thread(target=self._finish_recording, args=(writer,), daemon=True).start()
         self.btn_start_record.configure(state="normal")
         self.btn_stop_record.configure(state="disabled")
         self.log_to_chat("Recording stopped.")
 
+    def _finish_recording(self, writer):
+        stats = writer.release()
+        if stats is None:
+            self.log_to_chat(f"Recording may be incomplete: {writer.error}")
+            return
+        log.info("Recording finished", extra=stats)
+        if "segments" in stats:
+            self.log_to_chat(f"Motion recording saved {stats['segments']} segment(s). Index: {stats['index_path']}")
+        if stats["frames_dropped"]:
+            self.log_to_chat(f"Recording saved. {stats['frames_dropped']} frames were dropped because the encoder fell behind.")
+
+    def save_replay(self):
+        """Writes the replay buffer to a video file in the background; live preview keeps running."""
+        if self.replay_buffer is None:
+            self.log_to_chat("Instant replay needs video mode. Start video mode first.")
+            return
+        ext = self.video_format_var.get()
+        fourcc = "XVID" if ext == "avi" else "mp4v"
+        output_dir = "recordings"
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        filename = os.path.join(output_dir, f"viki_replay_{time.strftime('%Y%m%d_%H%M%S')}.{ext}")
+        seconds = self.replay_buffer.stats()["seconds"]
+        fps = self.camera_mode["fps"] if self.camera_mode else self.camera_fps
+        if not self.replay_buffer.save_async(filename, fourcc, fps, self.frame_size, self._replay_saved):
+            self.log_to_chat("There is nothing in the replay buffer yet.")
+            return
+        self.log_to_chat(f"Saving the last {seconds:.0f} seconds to {filename}...")
+        viki.speak("Saving the replay.", self.session)
+
+    def _replay_saved(self, filename, stats, error):
+        # Called on the replay writer thread
+        if error:
+            self.log_to_chat(f"Failed to save replay: {error}")
+        else:
+            log.info("Replay saved", extra=dict(stats, path=filename))
+            self.log_to_chat(f"Replay saved as {filename}")
+
+    def _configure_photo_writer(self):
+        self.photo_writer.fmt = self.photo_format_var.get()
+        self.photo_writer.png_level = self.photo_png_level
+        self.photo_writer.quality = self.photo_quality
+
     def capture_photo(self):
-        if self.current_frame is None:
+        if self.camera_manager is not None:
+            for camera_id in self.camera_manager.cameras:
+                self._capture_camera_photo(camera_id)
+            return
+        # Pin the latest ring slot (no copy); the writer pool encodes it and unpins it when done
+        slot = self.frame_ring.snapshot() if self.frame_ring else None
+        if slot is None:
             self.log_to_chat("No video frame available to capture photo.")
             return
-        try:
-            output_dir = "photos"
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            timestamp = int(time.time())
-            filename = os.path.join(output_dir, f"viki_photo_{timestamp}.png")
-            # Convert RGB (PIL) to BGR (OpenCV) for imwrite
-            cv2.imwrite(filename, cv2.cvtColor(self.current_frame, cv2.COLOR_RGB2BGR))
-            self.log_to_chat(f"Photo captured and saved as {filename}")
-        except Exception as e:
-            self.log_to_chat(f"Failed to capture photo: {e}")
+        self._configure_photo_writer()
+        self.photo_writer.submit(slot, self.frame_ring, self._photo_saved)
+
+    def _photo_saved(self, path, error):
+        # Called on a photo writer thread
+        if error:
+            self.log_to_chat(f"Failed to capture photo: {error}")
+        else:
+            self.log_to_chat(f"Photo captured and saved as {path}")
+
+    def burst_photos(self):
+        """Takes burst_count photos at burst_fps without blocking the preview."""
+        if self.frame_ring is None or self.frame_ring.latest() is None:
+            self.log_to_chat("No video frame available to capture photo.")
+            return
+        self._configure_photo_writer()
+        self.btn_burst_photo.configure(state="disabled")
+        def photo_saved(path, error):
+            if error:
+                self.log_to_chat(f"Failed to save burst photo: {error}")
+        def finished(taken):
+            self.queue.put(("update_capture_button_state", "normal" if self.video_mode else "disabled"))
+            self.log_to_chat(f"Burst captured {taken} photo(s); they are saved to the photos folder in the background.")
+        self.photo_writer.burst(self.frame_ring, self.burst_count, self.burst_fps,
+                                on_done=photo_saved, on_finished=finished, stop_event=self.stop_event)
+        self.log_to_chat(f"Taking {self.burst_count} photos at {self.burst_fps:g} per second...")
+
+
+    def toggle_multi_camera(self):
+        if self.camera_manager is None:
+            self.start_multi_camera()
+        else:
+            self.stop_multi_camera()
+
+    def start_multi_camera(self):
+        if self.video_mode:
+            self.log_to_chat("Stop video mode before starting multi-camera mode.")
+            return
+        manager = viki_cameras.CameraManager(self.frame_size, self.camera_fps, self.camera_pixel_format)
+        for source in self.camera_sources:
+            manager.add(source)
+        manager.start()
+        self.camera_manager = manager
+        self.tiled_preview = viki_cameras.TiledPreview(manager.cameras)
+        self.preview_photo = None # Tile mosaic has its own size
+        self.btn_multi_camera.configure(text="Stop Multi-Camera")
+        self.btn_video.configure(state="disabled")
+        self.btn_start_record.configure(state="normal")
+        self.btn_capture_photo.configure(state="normal")
+        self.video_label.grid()
+        self.video_fps_label.grid()
+        self.indicator_canvas.grid_remove()
+        self.video_label.bind("<Button-1>", self._on_tile_click)
+        self.video_label.bind("<Shift-Button-1>", self._on_tile_shift_click)
+        self._multi_preview_job = self.root.after(self.preview_interval_ms, self._display_multi_preview)
+        self.log_to_chat(f"Multi-camera mode started with {len(manager.cameras)} source(s). "
+                         "Click a tile to snapshot that camera, Shift+click to record it.")
+
+    def stop_multi_camera(self):
+        manager = self.camera_manager
+        if manager is None:
+            return
+        self.camera_manager = None
+        if self._multi_preview_job is not None:
+            self.root.after_cancel(self._multi_preview_job)
+            self._multi_preview_job = None
+        self.video_label.unbind("<Button-1>")
+        self.video_label.unbind("<Shift-Button-1>")
+        self.video_label.grid_remove()
+        self.video_label.configure(width=self.frame_size[0], height=self.frame_size[1])
+        self.video_fps_label.grid_remove()
+        self.indicator_canvas.grid()
+        self.preview_photo = None
+        self.tiled_preview = None
+        self.recording = False
+        self.btn_multi_camera.configure(text="Multi-Camera")
+        self.btn_video.configure(state="normal")
+        self.btn_start_record.configure(state="disabled")
+        self.btn_stop_record.configure(state="disabled")
+        self.btn_capture_photo.configure(state="disabled")
+        log.info("Multi-camera mode stopped", extra={"cameras": manager.metrics()})
+        # Joining the capture threads and flushing encoders can take a moment
+        threading.Thread(target=self._finish_multi_camera, args=(manager,), daemon=True).start()
+        self.log_to_chat("Multi-camera mode stopped.")
+
+    def _finish_multi_camera(self, manager):
+        for camera_id, stats in manager.stop().items():
+            log.info("Recording finished", extra=dict(stats, camera=camera_id))
+
+    def _display_multi_preview(self):
+        """Pastes the newest frame of every camera into the tile mosaic, then reschedules itself."""
+        manager = self.camera_manager
+        if manager is None:
+            self._multi_preview_job = None
+            return
+        preview = self.tiled_preview
+        if preview.update(manager.bus.take_all()):
+            if self.preview_photo is None:
+                self.preview_photo = PIL.ImageTk.PhotoImage(image=preview.pil)
+                self.video_label.configure(image=self.preview_photo, width=preview.size[0], height=preview.size[1])
+            else:
+                self.preview_photo.paste(preview.pil)
+            self.display_rate.tick()
+        now = time.monotonic()
+        if now - self._fps_label_updated >= 0.5:
+            self._fps_label_updated = now
+            parts = []
+            for camera_id, metrics in manager.metrics().items():
+                if metrics["state"] == viki_cameras.STATE_FAILED:
+                    parts.append(f"{camera_id} failed")
+                else:
+                    parts.append(f"{camera_id} {metrics['capture_fps']:.1f} fps{' REC' if metrics['record_fps'] else ''}")
+            self.video_fps_label.configure(text=" | ".join(parts))
+        self._multi_preview_job = self.root.after(self.preview_interval_ms, self._display_multi_preview)
+
+    def _tile_camera(self, event):
+        if self.tiled_preview is None:
+            return None
+        return self.tiled_preview.tile_at(event.x, event.y)
+
+    def _on_tile_click(self, event):
+        camera_id = self._tile_camera(event)
+        if camera_id is not None:
+            self._capture_camera_photo(camera_id)
+
+    def _on_tile_shift_click(self, event):
+        camera_id = self._tile_camera(event)
+        if camera_id is None:
+            return
+        camera = self.camera_manager.cameras[camera_id]
+        if camera.recording:
+            threading.Thread(target=self._finish_camera_recording, args=(camera,), daemon=True).start()
+            self.log_to_chat(f"Recording stopped for {camera_id}.")
+        else:
+            self._start_camera_recording(camera)
+        return "break" # Don't also take a snapshot
+
+    def _capture_camera_photo(self, camera_id):
+        camera = self.camera_manager.cameras[camera_id]
+        slot = camera.snapshot()
+        if slot is None:
+            self.log_to_chat(f"No frame from {camera_id} yet.")
+            return
+        self._configure_photo_writer()
+        self.photo_writer.submit(slot, camera.ring, self._photo_saved, prefix=f"viki_photo_{camera_id}")
+
+    def _start_camera_recording(self, camera):
+        ext = self.video_format_var.get()
+        fourcc = "XVID" if ext == "avi" else "mp4v"
+        output_dir = "recordings"
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        filename = os.path.join(output_dir, f"viki_recording_{time.strftime('%Y%m%d_%H%M%S')}_{camera.camera_id}.{ext}")
+        if not camera.start_recording(filename, fourcc):
+            self.log_to_chat(f"Could not record {camera.camera_id}: {camera.error}")
+            return False
+        self.log_to_chat(f"Recording {camera.camera_id}: {filename}")
+        return True
+
+    def _finish_camera_recording(self, camera):
+        stats = camera.stop_recording()
+        if stats is not None:
+            log.info("Recording finished", extra=dict(stats, camera=camera.camera_id))
+
+    def _start_multi_recording(self):
+        started = [camera for camera in self.camera_manager.cameras.values()
+                   if camera.state == viki_cameras.STATE_RUNNING and not camera.recording and self._start_camera_recording(camera)]
+        if started:
+            self.recording = True
+            self.btn_start_record.configure(state="disabled")
+            self.btn_stop_record.configure(state="normal")
+
+    def _stop_multi_recording(self):
+        self.recording = False
+        for camera in self.camera_manager.cameras.values():
+            if camera.recording:
+                threading.Thread(target=self._finish_camera_recording, args=(camera,), daemon=True).start()
+        self.btn_start_record.configure(state="normal")
+        self.btn_stop_record.configure(state="disabled")
+        self.log_to_chat("Recording stopped.")
 
 
 # --- Main Application Entry Point ---
 
 def main():
+    startup_main = time.perf_counter()
     try:
-        print("Starting Viki UI...")
+        viki_log.setup_logging()
+        log.info("Starting Viki UI")
+        viki_trace.configure_from_env() # VIKI_TRACE=1 enables per-stage latency tracing
 
         # Initialize a temporary Tkinter root for message boxes, then hide it.
         temp_tk_root = tk.Tk()
@@ -1210,8 +1774,27 @@ def main():
         # except Exception as e:
         #     print(f"Warning: Could not play opening video splash screen. Error: {e}")
 
+        modules_checked = time.perf_counter()
         root = ctk.CTk()
         app = VikiUI(root)
+        ui_built = time.perf_counter()
+
+        def on_first_map(event):
+            if event.widget is not root:
+                return
+            root.unbind("<Map>", map_binding)
+            visible = time.perf_counter()
+            app.startup.start() # Warm-up runs while the window fades in
+            log.info("Window visible", extra={
+                "startup_ms": round((visible - _STARTUP_STARTED) * 1000, 1),
+                "imports_ms": round((startup_main - _STARTUP_STARTED) * 1000, 1),
+                "module_check_ms": round((modules_checked - startup_main) * 1000, 1),
+                "ui_build_ms": round((ui_built - modules_checked) * 1000, 1),
+                "first_paint_ms": round((visible - ui_built) * 1000, 1),
+            })
+
+        map_binding = root.bind("<Map>", on_first_map, add="+")
+        root.after(1000, app.startup.start) # In case the window is never mapped (e.g. started minimized)
 
         # Opening fade-in animation
         def fade_in(window, alpha=0.0, step=0.05):
@@ -1230,16 +1813,21 @@ def main():
             try:
                 winsound.PlaySound("SystemStart", winsound.SND_ALIAS)
             except Exception as e:
-                print(f"Warning: Could not play system start sound: {e}")
+                log.warning("Could not play system start sound: %s", e)
 
         threading.Thread(target=play_opening_sound, daemon=True).start()
 
         # Handle window close protocol
-        root.protocol("WM_DELETE_WINDOW", lambda: (app.stop_listening(), app.stop_recording(), root.destroy()))
+        root.protocol("WM_DELETE_WINDOW", lambda: (app.stop_listening(), app.stop_recording(), app.stop_multi_camera(), app.executor.shutdown(), app.startup.shutdown(), app.command_tree.close(), app.bulk_job and app.bulk_job.cancel(), app.photo_writer.shutdown(wait=False), app.queue.close(), root.destroy()))
         root.mainloop()
-        print("Viki UI closed.")
-    except Exception as e:
-        print(f"Error starting Viki UI: {e}")
+        log.info("Viki UI closed")
+    except Exception:
+        log.exception("Error starting Viki UI")
+    finally:
+        viki_log.shutdown_logging() # Flush queued records before exiting
 
 if __name__ == "__main__":
+    # Needed so the encoder process also works from the PyInstaller bundle
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,348 @@
+import threading
+import time
+from collections import deque
+
+# --- Webcam Frame Helpers ---
+
+
+class FrameMailbox:
+    """
+    Single-slot, latest-wins handoff between the capture thread and the Tk thread.
+    Putting a new frame overwrites any frame that has not been displayed yet,
+    so the preview never falls behind the camera.
+    """
+
+    def __init__(self, on_drop=None):
+        self._lock = threading.Lock()
+        self._frame = None
+        self._timestamp = None
+        self.on_drop = on_drop # Called with frames that are overwritten or cleared before display
+        self.reset_stats()
+
+    def put(self, frame, timestamp=None):
+        """Stores the newest frame. Returns True if an undisplayed frame was dropped."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            old_frame = self._frame
+            self._frame = frame
+            self._timestamp = timestamp
+            self.posted += 1
+            if old_frame is not None:
+                self.dropped += 1
+        if old_frame is not None and self.on_drop:
+            self.on_drop(old_frame)
+        return old_frame is not None
+
+    def take(self):
+        """Returns (frame, timestamp) and empties the slot, or None if there is no new frame."""
+        with self._lock:
+            if self._frame is None:
+                return None
+            item = (self._frame, self._timestamp)
+            self._frame = None
+            self._timestamp = None
+            return item
+
+    def mark_displayed(self, timestamp):
+        """Records that the frame captured at `timestamp` is now on screen."""
+        latency = time.monotonic() - timestamp
+        with self._lock:
+            self.displayed += 1
+            self.latency_total += latency
+            self.latency_last = latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def clear(self):
+        with self._lock:
+            old_frame = self._frame
+            self._frame = None
+            self._timestamp = None
+        if old_frame is not None and self.on_drop:
+            self.on_drop(old_frame)
+
+    def reset_stats(self):
+        self.posted = 0
+        self.dropped = 0
+        self.displayed = 0
+        self.latency_total = 0.0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+
+    def stats(self):
+        """Returns counters and display latency in milliseconds."""
+        with self._lock:
+            avg = self.latency_total / self.displayed if self.displayed else 0.0
+            return {
+                "posted": self.posted,
+                "dropped": self.dropped,
+                "displayed": self.displayed,
+                "latency_avg_ms": round(avg * 1000, 2),
+                "latency_last_ms": round(self.latency_last * 1000, 2),
+                "latency_max_ms": round(self.latency_max * 1000, 2),
+            }
+
+
+class FrameSlot:
+    """
+    Preallocated buffers for one frame: the BGR frame (display/recording size),
+    its RGB conversion and a PIL image the RGB data is loaded into.
+    """
+
+    def __init__(self, width, height):
+        import numpy as np
+        import PIL.Image
+        self.bgr = np.empty((height, width, 3), dtype=np.uint8)
+        self.rgb = np.empty((height, width, 3), dtype=np.uint8)
+        self.pil = PIL.Image.new("RGB", (width, height))
+        self.timestamp = None
+        self.sequence = 0
+        self.pins = 0
+
+    def load_pil(self):
+        """Copies the RGB buffer into the slot's PIL image without allocating a new image."""
+        self.pil.frombytes(self.rgb)
+
+
+class FrameRing:
+    """
+    Fixed ring of FrameSlots reused by the capture loop.
+    Consumers (preview, photo capture, ...) pin a slot while they read it; the
+    capture loop only overwrites slots that are neither pinned nor the latest frame.
+    """
+
+    def __init__(self, size, width, height):
+        self.width = width
+        self.height = height
+        self.slots = [FrameSlot(width, height) for _ in range(size)]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._latest = None
+        self._sequence = 0
+        self.overruns = 0 # Frames skipped because every slot was busy
+
+    def acquire(self):
+        """Returns a slot the capture loop may overwrite, or None if all slots are busy."""
+        with self._lock:
+            for _ in range(len(self.slots)):
+                slot = self.slots[self._next]
+                self._next = (self._next + 1) % len(self.slots)
+                if slot.pins == 0 and slot is not self._latest:
+                    return slot
+            self.overruns += 1
+            return None
+
+    def publish(self, slot, timestamp):
+        """Marks a filled slot as the latest frame."""
+        with self._lock:
+            self._sequence += 1
+            slot.sequence = self._sequence
+            slot.timestamp = timestamp
+            self._latest = slot
+
+    def latest(self):
+        """Returns the latest slot without pinning it (for reading metadata only)."""
+        return self._latest
+
+    def snapshot(self):
+        """Pins and returns the latest slot, or None. Call unpin() when done with it."""
+        with self._lock:
+            slot = self._latest
+            if slot is not None:
+                slot.pins += 1
+            return slot
+
+    def pin(self, slot):
+        with self._lock:
+            slot.pins += 1
+
+    def unpin(self, slot):
+        with self._lock:
+            slot.pins -= 1
+
+    def clear(self):
+        with self._lock:
+            self._latest = None
+
+
+def fourcc_to_str(value):
+    """Decodes a CAP_PROP_FOURCC value ("MJPG", "YUYV", ...); empty if unknown."""
+    code = int(value)
+    if code <= 0:
+        return ""
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00")
+
+
+def probe_camera(index=0):
+    """
+    Opens and releases a camera once, which loads OpenCV and the capture backend
+    ahead of the first preview. Raises RuntimeError if the camera cannot be opened.
+    """
+    import cv2
+    cap = cv2.VideoCapture(index)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"cannot open camera {index}")
+    finally:
+        cap.release()
+
+
+def negotiate_camera_mode(cap, width, height, fps, pixel_format="MJPG"):
+    """
+    Asks the device for a capture mode and returns the mode it actually granted:
+    {"width", "height", "fps", "pixel_format"}. Devices clamp or ignore requests
+    freely, so callers must use the returned values rather than the requested ones.
+    The pixel format is set first because on most drivers it limits the sizes and
+    frame rates on offer (e.g. uncompressed YUYV often cannot do 30 fps at 640x480 over USB 2).
+    """
+    import cv2
+    if pixel_format:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*pixel_format))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_FPS, fps)
+    granted_fps = cap.get(cv2.CAP_PROP_FPS)
+    return {
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or width,
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or height,
+        # Some backends report 0 (unknown) or nonsense; fall back to what we asked for
+        "fps": granted_fps if 1.0 <= granted_fps <= 240.0 else float(fps),
+        "pixel_format": fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC)),
+    }
+
+
+class FramePacer:
+    """
+    Deadline-based loop pacing on the monotonic clock.
+    Each wait() sleeps until the next multiple of 1/fps since the first call, so
+    time spent reading and processing a frame is not added on top of the interval.
+    When the loop falls more than a whole interval behind, the schedule restarts
+    from now instead of running a burst of catch-up iterations.
+    """
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps
+        self._deadline = None
+        self.late = 0 # Iterations that overran their deadline
+
+    def wait(self, stop_event=None):
+        """Sleeps until the next frame is due. Returns early if stop_event gets set."""
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now
+        self._deadline += self.interval
+        delay = self._deadline - now
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+        else:
+            self.late += 1
+            if -delay > self.interval:
+                self._deadline = now
+
+    def reset(self):
+        self._deadline = None
+        self.late = 0
+
+
+class RateMeter:
+    """Events per second over a sliding window, e.g. achieved capture or display FPS."""
+
+    def __init__(self, window_s=2.0):
+        self.window_s = window_s
+        self._ticks = deque()
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def tick(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._ticks.append(now)
+            self.count += 1
+            self._prune(now)
+
+    def _prune(self, now):
+        while self._ticks and self._ticks[0] < now - self.window_s:
+            self._ticks.popleft()
+
+    def rate(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            if len(self._ticks) < 2:
+                return 0.0
+            span = self._ticks[-1] - self._ticks[0]
+            return (len(self._ticks) - 1) / span if span > 0 else 0.0
+
+    def reset(self):
+        with self._lock:
+            self._ticks.clear()
+            self.count = 0
+
+
+class SyntheticCapture:
+    """
+    Stand-in for cv2.VideoCapture that generates frames, for benchmarks and for
+    running the video pipeline without a physical camera.
+    Supports the subset of the VideoCapture interface used by Viki.
+    """
+
+    def __init__(self, width=640, height=480, fps=30.0, max_frames=None, realtime=True):
+        import numpy as np
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.max_frames = max_frames
+        self.realtime = realtime
+        self.frames_read = 0
+        self._opened = True
+        self._next_deadline = None
+        # Static gradient background; a bright square moves across it every frame
+        ramp = np.linspace(0, 255, width, dtype=np.uint8)
+        self._background = np.empty((height, width, 3), dtype=np.uint8)
+        self._background[:, :, 0] = ramp
+        self._background[:, :, 1] = ramp[::-1]
+        self._background[:, :, 2] = 96
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self, image=None):
+        if not self._opened or (self.max_frames is not None and self.frames_read >= self.max_frames):
+            return False, None
+        if self.realtime:
+            # Emulate a camera delivering frames at a fixed rate
+            now = time.monotonic()
+            if self._next_deadline is None:
+                self._next_deadline = now
+            if self._next_deadline > now:
+                time.sleep(self._next_deadline - now)
+            self._next_deadline += 1.0 / self.fps
+        if image is None or image.shape != self._background.shape:
+            image = self._background.copy()
+        else:
+            image[...] = self._background
+        size = self.height // 4
+        x = (self.frames_read * 8) % (self.width - size)
+        y = (self.frames_read * 4) % (self.height - size)
+        image[y:y + size, x:x + size] = 255
+        self.frames_read += 1
+        return True, image
+
+    def get(self, prop_id):
+        import cv2
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def set(self, prop_id, value):
+        return False
+
+    def release(self):
+        self._opened = False